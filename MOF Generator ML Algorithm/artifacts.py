@@ -0,0 +1,96 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import joblib
+import numpy as np
+import torch
+
+# Bump this whenever the saved layout or the training code changes in a way
+# that makes older artifacts unusable
+ARTIFACT_VERSION = 1
+
+
+def file_digest(path, chunk_size=1 << 20):
+    """Return the sha256 of a file's contents"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def artifact_key(data_digest, hyperparameters):
+    """Return the key of the artifacts trained from a CSV (by digest) with these settings"""
+    payload = json.dumps({
+        'version': ARTIFACT_VERSION,
+        'data': data_digest,
+        'hyperparameters': hyperparameters,
+    }, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:16]
+
+
+class ArtifactStore:
+    """Directory of trained artifacts, one subdirectory per key.
+
+    Each entry holds the fitted preprocessor (preprocessor.joblib), the
+    state dict of every model (<name>.pt), the arrays generation needs
+    (arrays.npz) and metadata.json. Entries are written to a temporary
+    directory and renamed into place, so a half-written entry is never
+    loaded."""
+    def __init__(self, root='artifacts'):
+        self.root = root
+
+    def path(self, key):
+        return os.path.join(self.root, key)
+
+    def exists(self, key):
+        return os.path.exists(os.path.join(self.path(key), 'metadata.json'))
+
+    def save(self, key, preprocessor, models, arrays, metadata):
+        """Save a fitted preprocessor, a dict of models, a dict of arrays and metadata"""
+        os.makedirs(self.root, exist_ok=True)
+        tmp = self.path(key) + f'.tmp-{os.getpid()}'
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+
+        joblib.dump(preprocessor, os.path.join(tmp, 'preprocessor.joblib'))
+        for name, model in models.items():
+            torch.save(model.state_dict(), os.path.join(tmp, f'{name}.pt'))
+        np.savez(os.path.join(tmp, 'arrays.npz'), **arrays)
+
+        metadata = dict(metadata, key=key, version=ARTIFACT_VERSION, models=sorted(models),
+                        created=time.strftime('%Y-%m-%dT%H:%M:%S'),
+                        torch_version=torch.__version__)
+        with open(os.path.join(tmp, 'metadata.json'), 'w') as f:
+            json.dump(metadata, f, indent=2)
+
+        shutil.rmtree(self.path(key), ignore_errors=True)
+        os.replace(tmp, self.path(key))
+
+    def load(self, key, device='cpu'):
+        """Return (preprocessor, state dicts by model name, arrays, metadata)"""
+        path = self.path(key)
+        with open(os.path.join(path, 'metadata.json')) as f:
+            metadata = json.load(f)
+        if metadata.get('version') != ARTIFACT_VERSION:
+            raise ValueError(f"Artifacts in {path} are version {metadata.get('version')}, expected {ARTIFACT_VERSION}")
+
+        preprocessor = joblib.load(os.path.join(path, 'preprocessor.joblib'))
+        state_dicts = {
+            name: torch.load(os.path.join(path, f'{name}.pt'), map_location=device)
+            for name in metadata['models']
+        }
+        with np.load(os.path.join(path, 'arrays.npz')) as data:
+            arrays = {name: data[name] for name in data.files}
+        return preprocessor, state_dicts, arrays, metadata
+
+    def latest(self):
+        """Return the key of the most recently written entry, or None"""
+        if not os.path.isdir(self.root):
+            return None
+        keys = [key for key in os.listdir(self.root) if self.exists(key)]
+        if not keys:
+            return None
+        return max(keys, key=lambda key: os.path.getmtime(os.path.join(self.path(key), 'metadata.json')))
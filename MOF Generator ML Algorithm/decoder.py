@@ -0,0 +1,56 @@
+import numpy as np
+import pandas as pd
+
+
+class FeatureDecoder:
+    """Inverse of the fitted ColumnTransformer for generated feature
+    vectors. Column positions, scaler parameters and category tables are
+    looked up once here; decode() then maps a whole (N, input_dim) batch
+    back to the original columns: unscaled numbers for the numerical
+    features and the highest-scoring category for each categorical one."""
+    def __init__(self, preprocessor, numerical_features, categorical_features):
+        names = list(preprocessor.get_feature_names_out())
+        position = {name: i for i, name in enumerate(names)}
+        self.numerical_features = list(numerical_features)
+        self.categorical_features = list(categorical_features)
+
+        # Numerical features: column and scaler parameters of each
+        num_scaler = preprocessor.transformers_[0][1].named_steps['scaler']
+        self.numeric_columns = np.array([position[f'num__{feature}'] for feature in self.numerical_features])
+        self.scale = np.asarray(num_scaler.scale_, dtype=np.float64)
+        self.mean = np.asarray(num_scaler.mean_, dtype=np.float64)
+
+        # Categorical features: first one-hot column and category table of each
+        cat_encoder = preprocessor.transformers_[1][1].named_steps['onehot']
+        self.category_tables = []
+        for i, feature in enumerate(self.categorical_features):
+            prefix = f'cat__{feature}_'
+            start = next((j for j, name in enumerate(names) if name.startswith(prefix)), None)
+            categories = np.asarray(cat_encoder.categories_[i], dtype=object)
+            self.category_tables.append((start, categories))
+
+    def decode(self, features):
+        """Return a dictionary of original column -> array for a batch of feature vectors"""
+        features = np.atleast_2d(np.asarray(features))
+        result = {}
+
+        numeric = features[:, self.numeric_columns] * self.scale + self.mean
+        for i, feature in enumerate(self.numerical_features):
+            result[feature] = numeric[:, i]
+
+        for feature, (start, categories) in zip(self.categorical_features, self.category_tables):
+            if start is None:
+                result[feature] = np.full(len(features), "Unknown", dtype=object)  # Fallback if no matching columns
+                continue
+            values = features[:, start:start + len(categories)]
+            result[feature] = categories[np.argmax(values, axis=1)]
+
+        return result
+
+    def decode_frame(self, features):
+        """Return a batch of feature vectors as a DataFrame in the original schema"""
+        return pd.DataFrame(self.decode(features), columns=self.numerical_features + self.categorical_features)
+
+    def decode_one(self, feature_vector):
+        """Return one feature vector as a dictionary of original values"""
+        return {feature: values[0] for feature, values in self.decode(feature_vector).items()}
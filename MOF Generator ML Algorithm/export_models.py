@@ -0,0 +1,233 @@
+import os
+import copy
+import json
+import time
+import shutil
+import argparse
+import numpy as np
+import torch
+import torch.nn as nn
+from generation import latent_distribution, candidate_scores
+
+# Models exported for CPU screening: file stem -> how to get it from a pipeline
+EXPORTED_MODELS = {
+    'property_model': lambda pipeline: pipeline['property_model'],
+    'decoder': lambda pipeline: pipeline['autoencoder'].decoder,
+}
+
+
+def onnx_available():
+    """Return whether the optional onnx and onnxruntime packages are installed"""
+    try:
+        import onnx  # noqa: F401
+        import onnxruntime  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def quantize(model):
+    """Return a copy of the model with dynamic int8 Linear layers: weights
+    are stored as int8 and activations are quantized on the fly per batch"""
+    return torch.ao.quantization.quantize_dynamic(copy.deepcopy(model).cpu().eval(), {nn.Linear}, dtype=torch.qint8)
+
+
+def export_torchscript(model, example, path):
+    """Trace, freeze and save a model as TorchScript"""
+    with torch.no_grad():
+        traced = torch.jit.trace(model.eval(), example)
+    frozen = torch.jit.optimize_for_inference(torch.jit.freeze(traced))
+    torch.jit.save(frozen, path)
+
+
+def export_onnx(model, example, path):
+    """Save a float32 model as ONNX with a variable batch dimension"""
+    torch.onnx.export(
+        model.eval(), example, path, input_names=['input'], output_names=['output'],
+        dynamic_axes={'input': {0: 'batch'}, 'output': {0: 'batch'}}, opset_version=17
+    )
+
+
+def export_models(pipeline, output_dir, onnx=True):
+    """Write TorchScript (float32 and int8) and, with onnx=True, ONNX
+    (float32 and int8) versions of the property model and the decoder to
+    output_dir. Returns the names of the files written."""
+    input_dim = pipeline['seed_features'].shape[1]
+    latent_dim = pipeline['autoencoder'].decoder[0].in_features
+    examples = {'property_model': torch.rand(64, input_dim), 'decoder': torch.rand(64, latent_dim)}
+
+    if onnx:
+        if not onnx_available():
+            raise ImportError("ONNX export needs the onnx and onnxruntime packages")
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+
+    tmp = output_dir + f'.tmp-{os.getpid()}'
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    for name, get_model in EXPORTED_MODELS.items():
+        model = copy.deepcopy(get_model(pipeline)).cpu().eval()
+        export_torchscript(model, examples[name], os.path.join(tmp, f'{name}.ts'))
+        export_torchscript(quantize(model), examples[name], os.path.join(tmp, f'{name}.int8.ts'))
+        if onnx:
+            export_onnx(model, examples[name], os.path.join(tmp, f'{name}.onnx'))
+            quantize_dynamic(os.path.join(tmp, f'{name}.onnx'), os.path.join(tmp, f'{name}.int8.onnx'),
+                             weight_type=QuantType.QInt8)
+
+    shutil.rmtree(output_dir, ignore_errors=True)
+    os.replace(tmp, output_dir)
+    return sorted(os.listdir(output_dir))
+
+
+class CompiledModel:
+    """An exported model behind the interface the eager models are used
+    through: a callable from a tensor to a tensor, with eval(). Inputs
+    are moved to the CPU and outputs back to the device they came from."""
+    def __init__(self, path):
+        self.path = path
+        if path.endswith('.onnx'):
+            import onnxruntime
+            session = onnxruntime.InferenceSession(path, providers=['CPUExecutionProvider'])
+            self.run = lambda x: torch.from_numpy(session.run(None, {'input': x.numpy()})[0])
+        else:
+            module = torch.jit.load(path, map_location='cpu')
+            self.run = module
+
+    def eval(self):
+        return self
+
+    def __call__(self, x):
+        with torch.no_grad():
+            return self.run(x.detach().to('cpu', torch.float32)).to(x.device)
+
+
+class CompiledAutoencoder:
+    """The eager autoencoder for encoding (only the seed MOFs are encoded)
+    with an exported decoder, so it can replace the autoencoder in
+    generation.generate_blocks"""
+    def __init__(self, autoencoder, decoder):
+        self.autoencoder = autoencoder
+        self.decoder = decoder
+
+    def eval(self):
+        self.autoencoder.eval()
+        return self
+
+    def encode(self, x):
+        return self.autoencoder.encode(x)
+
+    def decode(self, z):
+        return self.decoder(z)
+
+
+def model_path(output_dir, name, fmt='torchscript', int8=False):
+    return os.path.join(output_dir, f"{name}{'.int8' if int8 else ''}.{'onnx' if fmt == 'onnx' else 'ts'}")
+
+
+def load_compiled(output_dir, autoencoder, fmt='torchscript', int8=False):
+    """Return drop-in replacements for (property_model, autoencoder) that
+    run the exported graphs"""
+    property_model = CompiledModel(model_path(output_dir, 'property_model', fmt, int8))
+    decoder = CompiledModel(model_path(output_dir, 'decoder', fmt, int8))
+    return property_model, CompiledAutoencoder(autoencoder, decoder)
+
+
+def _rows_per_second(function, inputs, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(inputs)
+        times.append(time.perf_counter() - start)
+    return len(inputs) / sorted(times)[len(times) // 2]
+
+
+def evaluate(pipeline, output_dir, rows=65536, repeat=5, top=100, seed=0):
+    """Compare every exported model with its eager original on `rows`
+    generated MOFs: output error, throughput and, for the property model,
+    how many of the top `top` candidates by screening score are the same.
+    Returns the report as a dictionary."""
+    torch.manual_seed(seed)
+    cpu_pipeline = dict(pipeline, property_model=copy.deepcopy(pipeline['property_model']).cpu().eval(),
+                        autoencoder=copy.deepcopy(pipeline['autoencoder']).cpu().eval())
+    seed_features = torch.FloatTensor(pipeline['seed_features'])
+    encoding_mean, encoding_std = latent_distribution(cpu_pipeline['autoencoder'], seed_features)
+    z = encoding_mean + encoding_std * torch.randn(rows, len(encoding_mean))
+    with torch.no_grad():
+        features = cpu_pipeline['autoencoder'].decode(z)
+    inputs = {'property_model': features, 'decoder': z}
+    y_train = np.asarray(pipeline['y_train'])
+
+    report = {}
+    for name, get_model in EXPORTED_MODELS.items():
+        eager = get_model(cpu_pipeline)
+        with torch.no_grad():
+            reference = eager(inputs[name]).numpy()
+            eager_rate = _rows_per_second(eager, inputs[name], repeat)
+        report[name] = {'eager': {'rows_per_second': eager_rate}}
+
+        for fmt in ('torchscript', 'onnx'):
+            for int8 in (False, True):
+                path = model_path(output_dir, name, fmt, int8)
+                if not os.path.exists(path):
+                    continue
+                compiled = CompiledModel(path)
+                output = compiled(inputs[name]).numpy()
+                rate = _rows_per_second(compiled, inputs[name], repeat)
+                error = np.abs(output - reference)
+                entry = {
+                    'rows_per_second': rate,
+                    'speedup': rate / eager_rate,
+                    'max_abs_error': float(error.max()),
+                    'mean_abs_error': float(error.mean()),
+                }
+                if name == 'property_model':
+                    # Relative to the spread of each target, and what it does to the screening result
+                    entry['max_error_in_target_std'] = float((error / np.maximum(y_train.std(axis=0), 1e-12)).max())
+                    reference_top = np.argsort(-candidate_scores(reference, y_train.mean(axis=0), y_train.std(axis=0)))[:top]
+                    output_top = np.argsort(-candidate_scores(output, y_train.mean(axis=0), y_train.std(axis=0)))[:top]
+                    entry[f'top_{top}_overlap'] = len(np.intersect1d(reference_top, output_top)) / top
+                report[name][f"{fmt}{'-int8' if int8 else ''}"] = entry
+
+    print(f"\n{'Model':<16}{'Variant':<18}{'Rows/s':>14}{'Speedup':>10}{'Max error':>12}{'Mean error':>12}")
+    for name, variants in report.items():
+        for variant, entry in variants.items():
+            if variant == 'eager':
+                print(f"{name:<16}{variant:<18}{entry['rows_per_second']:>14,.0f}{'1.00x':>10}{'-':>12}{'-':>12}")
+            else:
+                print(f"{name:<16}{variant:<18}{entry['rows_per_second']:>14,.0f}{entry['speedup']:>9.2f}x"
+                      f"{entry['max_abs_error']:>12.2e}{entry['mean_abs_error']:>12.2e}")
+    for variant, entry in report['property_model'].items():
+        if variant != 'eager':
+            print(f"property_model {variant}: largest error {entry['max_error_in_target_std']:.2e} target std, "
+                  f"{100 * entry[f'top_{top}_overlap']:.0f}% of the top {top} unchanged")
+    return report
+
+
+if __name__ == "__main__":
+    from artifacts import ArtifactStore
+    from mof import load_pipeline
+
+    parser = argparse.ArgumentParser(description="Export the property model and decoder for CPU inference.")
+    parser.add_argument("--artifacts", default="artifacts", help="directory of saved preprocessors and models")
+    parser.add_argument("--key", default=None, help="artifact key to export (default: the latest)")
+    parser.add_argument("--no-onnx", action="store_true", help="only export TorchScript")
+    parser.add_argument("--rows", type=int, default=65536, help="generated MOFs used to compare the models")
+    parser.add_argument("--repeat", type=int, default=5, help="timed runs per model; the median is kept")
+    args = parser.parse_args()
+
+    store = ArtifactStore(args.artifacts)
+    key = args.key or store.latest()
+    if key is None or not store.exists(key):
+        raise SystemExit("No saved artifacts; run mof.py once first")
+    pipeline = load_pipeline(store, key)
+    output_dir = os.path.join(store.path(key), 'compiled')
+    onnx = not args.no_onnx
+    if onnx and not onnx_available():
+        print("onnx or onnxruntime is not installed; exporting TorchScript only (pass --no-onnx to skip this check)")
+        onnx = False
+    files = export_models(pipeline, output_dir, onnx=onnx)
+    print(f"Exported {', '.join(files)} to '{output_dir}'")
+
+    report = evaluate(pipeline, output_dir, rows=args.rows, repeat=args.repeat)
+    with open(os.path.join(output_dir, 'report.json'), 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Report written to '{os.path.join(output_dir, 'report.json')}'")
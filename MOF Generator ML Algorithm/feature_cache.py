@@ -0,0 +1,95 @@
+import os
+import json
+import shutil
+import hashlib
+import joblib
+import numpy as np
+
+# The arrays of a cache entry; each one is saved as <name>.npy
+ARRAYS = ('X_train', 'X_test', 'y_train', 'y_test')
+
+# Bump this whenever the cleaning or preprocessing steps change
+FEATURE_VERSION = 1
+
+
+def feature_key(data_digest, settings):
+    """Return the cache key of the features of a CSV (by digest) under these settings"""
+    payload = json.dumps({'version': FEATURE_VERSION, 'data': data_digest, 'settings': settings}, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:16]
+
+
+class FeatureCache:
+    """Directory of cleaned, preprocessed feature matrices, one
+    subdirectory per key. X is stored as float32 and y as float64
+    .npy files that are opened memory-mapped, so loading an entry only
+    reads the headers and rows are paged in as they are used. The
+    fitted preprocessor is stored next to them."""
+    def __init__(self, root='feature_cache'):
+        self.root = root
+
+    def path(self, key):
+        return os.path.join(self.root, key)
+
+    def get(self, key):
+        """Return the cached data dictionary for key, or None"""
+        path = self.path(key)
+        if not os.path.exists(os.path.join(path, 'meta.json')):
+            return None
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+        if meta.get('version') != FEATURE_VERSION:
+            return None
+
+        data = {name: np.load(os.path.join(path, f'{name}.npy'), mmap_mode='r') for name in ARRAYS}
+        data['preprocessor'] = joblib.load(os.path.join(path, 'preprocessor.joblib'))
+        data['feature_names'] = meta['feature_names']
+        data['paths'] = {name: os.path.join(path, f'{name}.npy') for name in ARRAYS}
+        return data
+
+    def put(self, key, data):
+        """Save a data dictionary with the arrays in ARRAYS and a fitted preprocessor"""
+        shapes = {name: np.shape(data[name]) for name in ARRAYS}
+        return self.put_blocks(key, data['preprocessor'], shapes, ((name, data[name]) for name in ARRAYS))
+
+    def put_blocks(self, key, preprocessor, shapes, blocks):
+        """Save an entry whose arrays arrive in pieces: shapes gives the
+        final shape of every array in ARRAYS, and blocks yields (name,
+        rows) pairs that are written one after the other into
+        preallocated files, so the arrays are never whole in memory"""
+        os.makedirs(self.root, exist_ok=True)
+        tmp = self.path(key) + f'.tmp-{os.getpid()}'
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+
+        arrays = {}
+        for name in ARRAYS:
+            dtype = np.float32 if name.startswith('X') else np.float64
+            if shapes[name][0] == 0:
+                np.save(os.path.join(tmp, f'{name}.npy'), np.zeros(shapes[name], dtype=dtype))
+            else:
+                arrays[name] = np.lib.format.open_memmap(
+                    os.path.join(tmp, f'{name}.npy'), mode='w+', dtype=dtype, shape=tuple(shapes[name])
+                )
+        filled = dict.fromkeys(ARRAYS, 0)
+        for name, block in blocks:
+            if len(block):
+                arrays[name][filled[name]:filled[name] + len(block)] = block
+                filled[name] += len(block)
+        for name, array in arrays.items():
+            if filled[name] != len(array):
+                raise ValueError(f"{name} got {filled[name]} rows, expected {len(array)}")
+            array.flush()
+        del arrays
+        joblib.dump(preprocessor, os.path.join(tmp, 'preprocessor.joblib'))
+
+        meta = {
+            'version': FEATURE_VERSION,
+            'feature_names': [str(name) for name in preprocessor.get_feature_names_out()],
+            'rows': {name: int(shapes[name][0]) for name in ARRAYS},
+        }
+        with open(os.path.join(tmp, 'meta.json'), 'w') as f:
+            json.dump(meta, f, indent=2)
+
+        shutil.rmtree(self.path(key), ignore_errors=True)
+        os.replace(tmp, self.path(key))
+        return self.get(key)
@@ -0,0 +1,168 @@
+import os
+import json
+import time
+import numpy as np
+import torch
+from novelty import deduplicate
+
+# Weight and direction of each target (in the order of mof.TARGET_NAMES) in
+# the screening score: lower ground state energy is better, higher is
+# better for the rest. The weights follow the performance score in mof.py.
+SCORE_WEIGHTS = np.array([0.45, 0.45, 0.05, 0.05])
+SCORE_DIRECTIONS = np.array([-1.0, 1.0, 1.0, 1.0])
+
+# Column names of the predictions in candidates.csv, as in generated_top_mofs.csv
+PREDICTION_COLUMNS = [
+    'predicted_ground_state_energy', 'predicted_co2_uptake',
+    'predicted_selectivity', 'predicted_heat_adsorption',
+]
+
+
+def latent_distribution(autoencoder, seed_features):
+    """Return the mean and std of the latent codes of the seed MOFs"""
+    autoencoder.eval()
+    with torch.no_grad():
+        encodings = autoencoder.encode(seed_features)
+    return torch.mean(encodings, dim=0), torch.std(encodings, dim=0)
+
+
+def generate_blocks(autoencoder, property_model, seed_features, num_samples, block_size=65536):
+    """Yield (start, features, predictions) for consecutive blocks of up
+    to block_size generated MOFs. Each block is sampled with one randn
+    call, decoded with one decoder call and scored with one predictor
+    call; features and predictions come back as NumPy arrays."""
+    encoding_mean, encoding_std = latent_distribution(autoencoder, seed_features)
+    property_model.eval()
+
+    with torch.no_grad():
+        for start in range(0, num_samples, block_size):
+            n = min(block_size, num_samples - start)
+            z = encoding_mean + encoding_std * torch.randn(n, len(encoding_mean), device=encoding_mean.device)
+            features = autoencoder.decode(z)
+            predictions = property_model(features)
+            yield start, features.cpu().numpy(), predictions.cpu().numpy()
+
+
+def candidate_scores(predictions, target_mean, target_std):
+    """Score candidates by their standardized predictions; higher is better"""
+    standardized = (predictions - target_mean) / np.maximum(target_std, 1e-12)
+    return standardized @ (SCORE_WEIGHTS * SCORE_DIRECTIONS)
+
+
+class TopK:
+    """The k best candidates seen so far, by score. With min_distance,
+    of any candidates closer than that to each other only the best is
+    kept, so the k are also spread out."""
+    def __init__(self, k, min_distance=0.0):
+        self.k = k
+        self.min_distance = min_distance
+        self.duplicates = 0  # Candidates dropped for being near a better one
+        self.indices = np.zeros(0, dtype=np.int64)
+        self.scores = np.zeros(0)
+        self.features = None
+        self.predictions = None
+
+    def add(self, indices, scores, features, predictions):
+        """Merge a block of candidates with the given global indices"""
+        indices = np.concatenate([self.indices, indices])
+        scores = np.concatenate([self.scores, scores])
+        if self.features is not None:
+            features = np.concatenate([self.features, features])
+            predictions = np.concatenate([self.predictions, predictions])
+
+        if self.min_distance > 0:
+            # Best first, so the kept members are never displaced by a worse near-duplicate
+            order = np.argsort(-scores, kind='stable')
+            unique = deduplicate(features[order], self.min_distance, limit=self.k)
+            scanned = len(order) if len(unique) < self.k else unique[-1] + 1
+            self.duplicates += int(scanned - len(unique))
+            keep = order[unique]
+            indices, scores, features, predictions = indices[keep], scores[keep], features[keep], predictions[keep]
+        elif len(scores) > self.k:
+            keep = np.argpartition(-scores, self.k - 1)[:self.k]
+            indices, scores, features, predictions = indices[keep], scores[keep], features[keep], predictions[keep]
+        self.indices, self.scores, self.features, self.predictions = indices, scores, features, predictions
+
+    def result(self):
+        """Return (indices, scores, features, predictions), best first"""
+        if self.features is None:
+            raise ValueError("No candidates have been added")
+        order = np.argsort(-self.scores)
+        return self.indices[order], self.scores[order], self.features[order], self.predictions[order]
+
+
+def screen_candidates(autoencoder, property_model, seed_features, num_samples, target_mean, target_std,
+                      block_size=65536, top_k=1000, output_dir=None, decoder=None,
+                      novelty=None, min_distance=0.0, dedupe_distance=0.0):
+    """Generate and score num_samples MOFs block by block. Only the
+    running top_k stay in memory; when output_dir is given every block is
+    also written into features.npy, predictions.npy and scores.npy there,
+    which are preallocated and filled in place. With a FeatureDecoder,
+    every block is also decoded to the original columns and appended to
+    candidates.csv. With a NoveltyIndex, candidates closer than
+    min_distance to a known MOF are left out of the top k (they are still
+    written to disk). With dedupe_distance, every block is merged into
+    the top k best first, skipping candidates within that distance of a
+    better one. Returns the TopK result and a dictionary of timing
+    statistics."""
+    top = TopK(top_k, dedupe_distance)
+    outputs = None
+    if output_dir is not None:
+        os.makedirs(output_dir, exist_ok=True)
+        outputs = {}
+
+    rejected = 0
+    start_time = time.perf_counter()
+    for start, features, predictions in generate_blocks(
+            autoencoder, property_model, seed_features, num_samples, block_size):
+        scores = candidate_scores(predictions, target_mean, target_std)
+
+        if outputs is not None:
+            if not outputs:
+                for name, block in (('features', features), ('predictions', predictions), ('scores', scores)):
+                    outputs[name] = np.lib.format.open_memmap(
+                        os.path.join(output_dir, f'{name}.npy'), mode='w+',
+                        dtype=np.float32, shape=(num_samples,) + block.shape[1:]
+                    )
+            end = start + len(scores)
+            outputs['features'][start:end] = features
+            outputs['predictions'][start:end] = predictions
+            outputs['scores'][start:end] = scores
+
+            if decoder is not None:
+                frame = decoder.decode_frame(features)
+                frame.insert(0, 'candidate', np.arange(start, end))
+                for j, name in enumerate(PREDICTION_COLUMNS):
+                    frame[name] = predictions[:, j]
+                frame['score'] = scores
+                frame.to_csv(os.path.join(output_dir, 'candidates.csv'), mode='w' if start == 0 else 'a',
+                             header=start == 0, index=False)
+
+        indices = start + np.arange(len(scores))
+        if novelty is not None:
+            novel = novelty.is_novel(features, min_distance)
+            rejected += int(len(novel) - novel.sum())
+            indices, scores, features, predictions = indices[novel], scores[novel], features[novel], predictions[novel]
+        top.add(indices, scores, features, predictions)
+
+        done = start + len(scores)
+        if done < num_samples and (start // block_size) % 10 == 9:
+            rate = done / (time.perf_counter() - start_time)
+            print(f"Screened {done:,}/{num_samples:,} candidates, {rate:,.0f} candidates/s")
+
+    seconds = time.perf_counter() - start_time
+    if outputs:
+        for array in outputs.values():
+            array.flush()
+        with open(os.path.join(output_dir, 'meta.json'), 'w') as f:
+            json.dump({'num_samples': num_samples, 'block_size': block_size, 'seconds': seconds}, f)
+
+    stats = {'candidates': num_samples, 'seconds': seconds, 'candidates_per_second': num_samples / max(seconds, 1e-12),
+             'rejected_known': rejected, 'duplicates': top.duplicates}
+    print(f"Screened {num_samples:,} candidates in {seconds:.2f}s, "
+          f"{stats['candidates_per_second']:,.0f} candidates/s")
+    if novelty is not None:
+        print(f"Left out {rejected:,} candidates within {min_distance} of a known MOF")
+    if dedupe_distance > 0:
+        print(f"Dropped {top.duplicates:,} candidates within {dedupe_distance} of a better one")
+    return top.result(), stats
@@ -0,0 +1,197 @@
+import math
+import time
+import argparse
+import numpy as np
+import torch
+from generation import SCORE_WEIGHTS, SCORE_DIRECTIONS, latent_distribution
+
+
+class LatentObjective:
+    """Predicted score of latent vectors: decode, predict the four
+    properties and combine the standardized predictions with the
+    screening weights, so it matches generation.candidate_scores. Every
+    call works on a whole (N, latent_dim) batch and counts the number of
+    latent vectors evaluated."""
+    def __init__(self, autoencoder, property_model, target_mean, target_std):
+        self.autoencoder = autoencoder.eval()
+        self.property_model = property_model.eval()
+        device = next(autoencoder.parameters()).device
+        self.mean = torch.as_tensor(target_mean, dtype=torch.float32, device=device)
+        self.std = torch.clamp(torch.as_tensor(target_std, dtype=torch.float32, device=device), min=1e-12)
+        self.weights = torch.as_tensor(SCORE_WEIGHTS * SCORE_DIRECTIONS, dtype=torch.float32, device=device)
+        self.evaluations = 0
+
+    def __call__(self, z):
+        """Return (scores, features, predictions) for a batch of latent vectors"""
+        self.evaluations += len(z)
+        features = self.autoencoder.decode(z)
+        predictions = self.property_model(features)
+        scores = ((predictions - self.mean) / self.std) @ self.weights
+        return scores, features, predictions
+
+
+def random_search(objective, encoding_mean, encoding_std, budget, block_size=65536):
+    """Baseline: score `budget` latent samples from the seed distribution"""
+    best = []
+    with torch.no_grad():
+        for start in range(0, budget, block_size):
+            n = min(block_size, budget - start)
+            z = encoding_mean + encoding_std * torch.randn(n, len(encoding_mean), device=encoding_mean.device)
+            scores, features, predictions = objective(z)
+            best.append((scores, features, predictions))
+    scores, features, predictions = (torch.cat(parts) for parts in zip(*best))
+    return scores, features, predictions
+
+
+def gradient_search(objective, encoding_mean, encoding_std, restarts=256, steps=200, lr=0.05, prior_weight=0.01):
+    """Gradient ascent on the predicted score from `restarts` starting
+    points at once. A small penalty on the distance from the seed
+    distribution (in units of its std) keeps the search where the decoder
+    has seen data, and the codes are kept non-negative like the encoder's
+    ReLU outputs."""
+    std = torch.clamp(encoding_std, min=1e-6)
+    z = (encoding_mean + encoding_std * torch.randn(restarts, len(encoding_mean), device=encoding_mean.device))
+    z = z.clamp(min=0).requires_grad_(True)
+    optimizer = torch.optim.Adam([z], lr=lr)
+
+    for _ in range(steps):
+        scores, _, _ = objective(z)
+        prior = (((z - encoding_mean) / std) ** 2).sum(dim=1)
+        loss = -(scores - prior_weight * prior).sum()
+        # Gradient with respect to the latent codes only; the models are left untouched
+        z.grad, = torch.autograd.grad(loss, [z])
+        optimizer.step()
+        with torch.no_grad():
+            z.clamp_(min=0)
+
+    with torch.no_grad():
+        return objective(z.detach())
+
+
+def cmaes_search(objective, encoding_mean, encoding_std, restarts=32, population=64, generations=100):
+    """Separable (diagonal covariance) CMA-ES run for `restarts`
+    independent searches in parallel. Each generation samples a
+    (restarts, population, latent_dim) tensor and scores all of it in one
+    batched call. Returns the best point found by each restart."""
+    device = encoding_mean.device
+    dim = len(encoding_mean)
+    mu = population // 2
+
+    # Recombination weights and strategy constants (Hansen's defaults)
+    weights = torch.log(torch.tensor(mu + 0.5)) - torch.log(torch.arange(1, mu + 1, dtype=torch.float32))
+    weights = (weights / weights.sum()).to(device)
+    mueff = float(1.0 / (weights ** 2).sum())
+    c_sigma = (mueff + 2) / (dim + mueff + 5)
+    d_sigma = 1 + 2 * max(0.0, math.sqrt((mueff - 1) / (dim + 1)) - 1) + c_sigma
+    c_mu = min(1.0, (mueff - 2 + 1 / mueff) / ((dim + 2) ** 2 + mueff) * (dim + 2) / 3)
+    chi_n = math.sqrt(dim) * (1 - 1 / (4 * dim) + 1 / (21 * dim ** 2))
+
+    mean = (encoding_mean + encoding_std * torch.randn(restarts, dim, device=device)).clamp(min=0)
+    sigma = torch.full((restarts, 1), float(encoding_std.mean()), device=device)
+    variance = torch.ones(restarts, dim, device=device)
+    path = torch.zeros(restarts, dim, device=device)
+
+    best_scores = torch.full((restarts,), -float('inf'), device=device)
+    best_z = mean.clone()
+    with torch.no_grad():
+        for _ in range(generations):
+            steps = torch.randn(restarts, population, dim, device=device) * variance.sqrt()[:, None, :]
+            candidates = (mean[:, None, :] + sigma[:, :, None] * steps).clamp(min=0)
+            scores, _, _ = objective(candidates.reshape(-1, dim))
+            scores = scores.reshape(restarts, population)
+
+            # Remember the best point of every restart
+            gen_best, gen_arg = scores.max(dim=1)
+            improved = torch.nonzero(gen_best > best_scores, as_tuple=True)[0]
+            best_scores[improved] = gen_best[improved]
+            best_z[improved] = candidates[improved, gen_arg[improved]]
+
+            # Weighted recombination of the mu best samples
+            order = torch.argsort(scores, dim=1, descending=True)[:, :mu]
+            selected = torch.gather(candidates, 1, order[:, :, None].expand(-1, -1, dim))
+            y = (selected - mean[:, None, :]) / sigma[:, :, None]
+            step = (weights[None, :, None] * y).sum(dim=1)
+            mean = mean + sigma * step
+
+            # Step size by cumulative path length, diagonal covariance by rank-mu update
+            path = (1 - c_sigma) * path + math.sqrt(c_sigma * (2 - c_sigma) * mueff) * step / variance.sqrt()
+            sigma = sigma * torch.exp((c_sigma / d_sigma) * (path.norm(dim=1, keepdim=True) / chi_n - 1))
+            variance = (1 - c_mu) * variance + c_mu * (weights[None, :, None] * y ** 2).sum(dim=1)
+            variance = variance.clamp(min=1e-8)
+
+        return objective(best_z)
+
+
+def search_latent(autoencoder, property_model, seed_features, target_mean, target_std,
+                  method="gradient", restarts=256, steps=200):
+    """Run one latent search and return (scores, features, predictions)
+    as NumPy arrays, one row per restart, and the number of evaluations"""
+    encoding_mean, encoding_std = latent_distribution(autoencoder, seed_features)
+    objective = LatentObjective(autoencoder, property_model, target_mean, target_std)
+    if method == "gradient":
+        scores, features, predictions = gradient_search(objective, encoding_mean, encoding_std, restarts, steps)
+    elif method == "cmaes":
+        scores, features, predictions = cmaes_search(objective, encoding_mean, encoding_std,
+                                                     restarts=restarts, generations=steps)
+    else:
+        raise ValueError(f"Unknown latent search method '{method}'")
+    return (scores.cpu().numpy(), features.cpu().numpy(), predictions.cpu().numpy()), objective.evaluations
+
+
+def benchmark(autoencoder, property_model, seed_features, target_mean, target_std,
+              restarts=256, steps=200, top=10):
+    """Compare random sampling with both searches at the same number of
+    evaluated latent vectors. Gradient steps cost a forward and a backward
+    pass, which is counted as three evaluations per vector."""
+    encoding_mean, encoding_std = latent_distribution(autoencoder, seed_features)
+    results = {}
+
+    def run(name, search, cost=1):
+        objective = LatentObjective(autoencoder, property_model, target_mean, target_std)
+        start = time.perf_counter()
+        scores, _, _ = search(objective)
+        seconds = time.perf_counter() - start
+        scores = scores.detach().cpu().numpy()
+        best = np.sort(scores)[::-1][:top]
+        results[name] = {
+            'evaluations': objective.evaluations * cost,
+            'seconds': seconds,
+            'best': float(best[0]),
+            f'mean_top_{top}': float(best.mean()),
+        }
+
+    gradient_budget = 3 * restarts * steps
+    run('gradient', lambda f: gradient_search(f, encoding_mean, encoding_std, restarts, steps), cost=3)
+    cmaes_restarts = max(1, restarts // 8)
+    cmaes_generations = max(1, gradient_budget // (cmaes_restarts * 64))
+    run('cmaes', lambda f: cmaes_search(f, encoding_mean, encoding_std, cmaes_restarts, 64, cmaes_generations))
+    run('random', lambda f: random_search(f, encoding_mean, encoding_std, gradient_budget))
+
+    print(f"{'Method':<10}{'Evaluations':>14}{'Seconds':>10}{'Best':>10}{f'Top-{top} mean':>14}")
+    for name, r in results.items():
+        print(f"{name:<10}{r['evaluations']:>14,}{r['seconds']:>10.2f}{r['best']:>10.3f}{r[f'mean_top_{top}']:>14.3f}")
+    return results
+
+
+if __name__ == "__main__":
+    from artifacts import ArtifactStore
+    from mof import device, load_pipeline
+
+    parser = argparse.ArgumentParser(description="Compare latent-space search with random sampling.")
+    parser.add_argument("--artifacts", default="artifacts", help="directory of saved preprocessors and models")
+    parser.add_argument("--restarts", type=int, default=256, help="parallel gradient ascent restarts")
+    parser.add_argument("--steps", type=int, default=200, help="gradient steps per restart")
+    args = parser.parse_args()
+
+    store = ArtifactStore(args.artifacts)
+    key = store.latest()
+    if key is None:
+        raise SystemExit("No saved artifacts; run mof.py once first")
+    pipeline = load_pipeline(store, key)
+    torch.manual_seed(0)
+    benchmark(
+        pipeline['autoencoder'], pipeline['property_model'],
+        torch.FloatTensor(pipeline['seed_features']).to(device),
+        pipeline['y_train'].mean(axis=0), pipeline['y_train'].std(axis=0),
+        restarts=args.restarts, steps=args.steps,
+    )
@@ -1,3 +1,8 @@
+import os
+import sys
+import json
+import argparse
+import time
 import numpy as np
 import pandas as pd
 import torch
@@ -10,21 +15,22 @@ from sklearn.compose import ColumnTransformer
 from sklearn.impute import SimpleImputer
 from sklearn.pipeline import Pipeline
 from sklearn.metrics import mean_squared_error, r2_score
-import matplotlib.pyplot as plt
+from artifacts import ArtifactStore, artifact_key, file_digest
+from feature_cache import FeatureCache, feature_key
+from streaming import make_loader, column_stats
+from generation import screen_candidates
+from ranking import rank_candidates, select_pareto
+from decoder import FeatureDecoder
+from latent_search import search_latent
+from novelty import NoveltyIndex, deduplicate
+from export_models import export_models, load_compiled, model_path, onnx_available
 
-# Set random seeds for reproducibility
-np.random.seed(42)
-torch.manual_seed(42)
-if torch.cuda.is_available():
-    torch.cuda.manual_seed_all(42)
+# telemetry.py in the repository root is shared with the VQE sweep
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import telemetry  # noqa: E402
 
 # Set device (GPU if available, otherwise CPU)
 device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-print(f"Using device: {device}")
-
-# 1. LOAD AND PREPARE DATA
-print("Loading data...")
-df = pd.read_csv('top_MOFs_screening_csv.csv')
 
 # Define important features and targets
 numerical_features = [
@@ -46,166 +52,395 @@ ground_state_col = 'Ground_State_Energy'  # Lower is better
 co2_uptake_col = 'CO2_uptake_P0.15bar_T298K [mmol/g]'  # Higher is better
 selectivity_col = 'CO2/N2_selectivity'  # Higher is better
 heat_adsorption_col = 'heat_adsorption_CO2_P0.15bar_T298K [kcal/mol]'  # Higher is better
+target_cols = [ground_state_col, co2_uptake_col, selectivity_col, heat_adsorption_col]
+
+TARGET_NAMES = ["Ground State Energy", "CO2 Uptake", "Selectivity", "Heat Adsorption"]
+
+# Everything that changes the trained models; part of the artifact key
+HYPERPARAMETERS = {
+    'seed': 42,
+    'test_size': 0.2,
+    'batch_size': 32,
+    'predictor_epochs': 50,
+    'predictor_lr': 0.001,
+    'hidden': [64, 32],
+    'dropout': 0.2,
+    'latent_dim': 16,
+    'ae_epochs': 50,
+    'ae_lr': 0.001,
+}
+
+
+def set_seeds(seed=42):
+    """Set random seeds for reproducibility"""
+    np.random.seed(seed)
+    torch.manual_seed(seed)
+    if torch.cuda.is_available():
+        torch.cuda.manual_seed_all(seed)
+
+# 1. LOAD AND PREPARE DATA
+def load_data(csv_path):
+    """Read the screening CSV and drop rows that cannot be used"""
+    print("Loading data...")
+    with telemetry.span("csv.load"):
+        df = pd.read_csv(csv_path)
+    df = clean_data(df)
+    print(f"Dataset shape after cleaning: {df.shape}")
+    return df
+
+def clean_data(df):
+    """Convert the numeric columns and drop the rows that cannot be used"""
+    # Convert string values to numeric
+    for col in numerical_features + target_cols:
+        df[col] = pd.to_numeric(df[col], errors='coerce')
+
+    # Remove rows with missing values in target and key feature columns
+    return df.dropna(subset=[ground_state_col, co2_uptake_col, selectivity_col] + numerical_features)
+
+def build_preprocessor(categories='auto'):
+    """Create preprocessing pipeline"""
+    return ColumnTransformer(
+        transformers=[
+            ('num', Pipeline([
+                ('imputer', SimpleImputer(strategy='median')),
+                ('scaler', StandardScaler())
+            ]), numerical_features),
+            ('cat', Pipeline([
+                ('imputer', SimpleImputer(strategy='most_frequent')),
+                ('onehot', OneHotEncoder(categories=categories, handle_unknown='ignore', sparse_output=False))
+            ]), categorical_features)
+        ])
+
+def prepare_data(df, test_size=0.2, seed=42):
+    """Split the data, fit the preprocessor and return everything training needs"""
+    # Split the data
+    X = df[numerical_features + categorical_features]
+    y = df[target_cols].values
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=test_size, random_state=seed)
+
+    # Print target ranges
+    print(f"\nGround State Energy: {y[:, 0].min():.4f} to {y[:, 0].max():.4f} eV")
+    print(f"CO2 Uptake: {y[:, 1].min():.4f} to {y[:, 1].max():.4f} mmol/g")
+    print(f"CO2/N2 Selectivity: {y[:, 2].min():.4f} to {y[:, 2].max():.4f}")
+    print(f"Heat Adsorption: {y[:, 3].min():.4f} to {y[:, 3].max():.4f} kcal/mol")
+
+    # Preprocess the data
+    with telemetry.span("preprocess"):
+        preprocessor = build_preprocessor()
+        X_train_processed = preprocessor.fit_transform(X_train)
+        X_test_processed = preprocessor.transform(X_test)
+    print(f"Input dimension after preprocessing: {X_train_processed.shape[1]}")
+
+    return {
+        'preprocessor': preprocessor,
+        'X_train': X_train_processed,
+        'X_test': X_test_processed,
+        'y_train': y_train,  # (N, 4) in the order of TARGET_NAMES
+        'y_test': y_test,
+    }
+
+def stream_features(csv_path, cache, key, test_size=0.2, seed=42, chunk_rows=65536):
+    """Preprocess the CSV chunk by chunk straight into a feature cache
+    entry, so only chunk_rows rows of it are in memory at a time.
+
+    The first pass splits the rows, fits the scaler with partial_fit and
+    counts the categories of the training rows; the second transforms
+    every chunk and writes it into the preallocated cache files. Each
+    row goes to the test split with probability test_size, drawn from a
+    generator seeded with seed, so the split is not train_test_split's.
+    The medians used to fill in missing numbers at inference time come
+    from the first chunk of training rows (training rows never have any)."""
+    def chunks():
+        # Read the categorical columns as text so every chunk types them the same way
+        reader = pd.read_csv(csv_path, chunksize=chunk_rows, dtype={col: str for col in categorical_features})
+        rng = np.random.default_rng(seed)
+        for chunk in reader:
+            chunk = clean_data(chunk)
+            test = rng.random(len(chunk)) < test_size
+            yield chunk[~test], chunk[test]
+
+    print("Loading data in chunks...")
+    scaler = StandardScaler()
+    counts = {col: pd.Series(dtype=np.float64) for col in categorical_features}
+    rows = {'train': 0, 'test': 0}
+    low, high = np.full(len(target_cols), np.inf), np.full(len(target_cols), -np.inf)
+    sample = None
+    with telemetry.span("csv.load"):
+        for train, test in chunks():
+            rows['train'] += len(train)
+            rows['test'] += len(test)
+            for part in (train, test):
+                if len(part):
+                    low = np.fmin(low, part[target_cols].min().values)
+                    high = np.fmax(high, part[target_cols].max().values)
+            if len(train) == 0:
+                continue
+            if sample is None:
+                sample = train[numerical_features + categorical_features]
+            scaler.partial_fit(train[numerical_features].values)
+            for col in categorical_features:
+                counts[col] = counts[col].add(train[col].value_counts(), fill_value=0)
+    if sample is None:
+        raise ValueError(f"'{csv_path}' has no usable training rows")
+    print(f"Dataset shape after cleaning: ({rows['train'] + rows['test']}, {len(target_cols)} targets)")
+    print(f"\nGround State Energy: {low[0]:.4f} to {high[0]:.4f} eV")
+    print(f"CO2 Uptake: {low[1]:.4f} to {high[1]:.4f} mmol/g")
+    print(f"CO2/N2 Selectivity: {low[2]:.4f} to {high[2]:.4f}")
+    print(f"Heat Adsorption: {low[3]:.4f} to {high[3]:.4f} kcal/mol")
+
+    # Fit on the sample for the structure, then put in the statistics of all training rows
+    categories = [sorted(counts[col].index) for col in categorical_features]
+    preprocessor = build_preprocessor(categories).fit(sample)
+    numeric = preprocessor.named_transformers_['num']
+    numeric.steps[-1] = ('scaler', scaler)
+    categorical = preprocessor.named_transformers_['cat']
+    categorical.named_steps['imputer'].statistics_ = np.array(
+        [counts[col].idxmax() for col in categorical_features], dtype=object
+    )
+    input_dim = len(preprocessor.get_feature_names_out())
+    print(f"Input dimension after preprocessing: {input_dim}")
+
+    def blocks():
+        for train, test in chunks():
+            for split, part in (('train', train), ('test', test)):
+                if len(part):
+                    yield f'X_{split}', preprocessor.transform(part[numerical_features + categorical_features])
+                    yield f'y_{split}', part[target_cols].values
 
-# Convert string values to numeric
-for col in numerical_features + [ground_state_col, co2_uptake_col, selectivity_col, heat_adsorption_col]:
-    df[col] = pd.to_numeric(df[col], errors='coerce')
-
-# Remove rows with missing values in target and key feature columns
-df = df.dropna(subset=[ground_state_col, co2_uptake_col, selectivity_col] + numerical_features)
-print(f"Dataset shape after cleaning: {df.shape}")
-
-# Create preprocessing pipeline
-preprocessor = ColumnTransformer(
-    transformers=[
-        ('num', Pipeline([
-            ('imputer', SimpleImputer(strategy='median')),
-            ('scaler', StandardScaler())
-        ]), numerical_features),
-        ('cat', Pipeline([
-            ('imputer', SimpleImputer(strategy='most_frequent')),
-            ('onehot', OneHotEncoder(handle_unknown='ignore', sparse_output=False))
-        ]), categorical_features)
-    ])
-
-# Split the data
-X = df[numerical_features + categorical_features]
-y_gs = df[ground_state_col].values
-y_co2 = df[co2_uptake_col].values
-y_sel = df[selectivity_col].values
-y_heat = df[heat_adsorption_col].values
-
-X_train, X_test, y_gs_train, y_gs_test, y_co2_train, y_co2_test, y_sel_train, y_sel_test, y_heat_train, y_heat_test = train_test_split(
-    X, y_gs, y_co2, y_sel, y_heat, test_size=0.2, random_state=42
-)
-
-# Print target ranges
-print(f"\nGround State Energy: {y_gs.min():.4f} to {y_gs.max():.4f} eV")
-print(f"CO2 Uptake: {y_co2.min():.4f} to {y_co2.max():.4f} mmol/g")
-print(f"CO2/N2 Selectivity: {y_sel.min():.4f} to {y_sel.max():.4f}")
-print(f"Heat Adsorption: {y_heat.min():.4f} to {y_heat.max():.4f} kcal/mol")
-
-# Preprocess the data
-X_train_processed = preprocessor.fit_transform(X_train)
-X_test_processed = preprocessor.transform(X_test)
-
-# Get dimensionality
-input_dim = X_train_processed.shape[1]
-print(f"Input dimension after preprocessing: {input_dim}")
-
-# Convert to PyTorch tensors
-X_train_tensor = torch.FloatTensor(X_train_processed).to(device)
-X_test_tensor = torch.FloatTensor(X_test_processed).to(device)
-
-y_gs_train_tensor = torch.FloatTensor(y_gs_train.reshape(-1, 1)).to(device)
-y_gs_test_tensor = torch.FloatTensor(y_gs_test.reshape(-1, 1)).to(device)
-
-y_co2_train_tensor = torch.FloatTensor(y_co2_train.reshape(-1, 1)).to(device)
-y_co2_test_tensor = torch.FloatTensor(y_co2_test.reshape(-1, 1)).to(device)
-
-y_sel_train_tensor = torch.FloatTensor(y_sel_train.reshape(-1, 1)).to(device)
-y_sel_test_tensor = torch.FloatTensor(y_sel_test.reshape(-1, 1)).to(device)
-
-y_heat_train_tensor = torch.FloatTensor(y_heat_train.reshape(-1, 1)).to(device)
-y_heat_test_tensor = torch.FloatTensor(y_heat_test.reshape(-1, 1)).to(device)
-
-# Create dataloaders
-batch_size = 32
-train_dataset = TensorDataset(X_train_tensor, y_gs_train_tensor, y_co2_train_tensor, y_sel_train_tensor, y_heat_train_tensor)
-train_loader = DataLoader(train_dataset, batch_size=batch_size, shuffle=True)
+    shapes = {
+        'X_train': (rows['train'], input_dim), 'X_test': (rows['test'], input_dim),
+        'y_train': (rows['train'], len(target_cols)), 'y_test': (rows['test'], len(target_cols)),
+    }
+    print(f"Caching features in '{cache.path(key)}'")
+    with telemetry.span("preprocess"):
+        return cache.put_blocks(key, preprocessor, shapes, blocks())
 
 # 2. CREATE PREDICTION MODELS
 class PropertyPredictor(nn.Module):
-    def __init__(self, input_dim):
+    def __init__(self, input_dim, hidden=(64, 32), dropout=0.2):
         super(PropertyPredictor, self).__init__()
         self.model = nn.Sequential(
-            nn.Linear(input_dim, 64),
+            nn.Linear(input_dim, hidden[0]),
             nn.ReLU(),
-            nn.Dropout(0.2),
-            nn.Linear(64, 32),
+            nn.Dropout(dropout),
+            nn.Linear(hidden[0], hidden[1]),
             nn.ReLU(),
-            nn.Linear(32, 1)
+            nn.Linear(hidden[1], 1)
         )
-    
+
     def forward(self, x):
         return self.model(x)
 
-# Create separate models for each property
-ground_state_model = PropertyPredictor(input_dim).to(device)
-co2_uptake_model = PropertyPredictor(input_dim).to(device)
-selectivity_model = PropertyPredictor(input_dim).to(device)
-heat_adsorption_model = PropertyPredictor(input_dim).to(device)
+class MultiTaskPredictor(nn.Module):
+    """Shared trunk with one output head per property, so all four
+    properties come out of a single forward pass as an (N, 4) tensor
+    in the order of TARGET_NAMES"""
+    def __init__(self, input_dim, num_targets=4, hidden=(64, 32), dropout=0.2):
+        super(MultiTaskPredictor, self).__init__()
+        self.trunk = nn.Sequential(
+            nn.Linear(input_dim, hidden[0]),
+            nn.ReLU(),
+            nn.Dropout(dropout),
+            nn.Linear(hidden[0], hidden[1]),
+            nn.ReLU()
+        )
+        self.heads = nn.ModuleList([nn.Linear(hidden[1], 1) for _ in range(num_targets)])
+
+    def forward(self, x):
+        features = self.trunk(x)
+        return torch.cat([head(features) for head in self.heads], dim=1)
 
 # Training function
-def train_model(model, X_train, y_train, X_test, y_test, property_name, epochs=50):
+def train_model(model, X_train, y_train, X_test, y_test, property_name, epochs=50, lr=0.001):
     criterion = nn.MSELoss()
-    optimizer = optim.Adam(model.parameters(), lr=0.001)
-    
+    optimizer = optim.Adam(model.parameters(), lr=lr)
+
     train_losses = []
-    
+
     for epoch in range(epochs):
         model.train()
         optimizer.zero_grad()
-        
+
         # Forward pass
         outputs = model(X_train)
         loss = criterion(outputs, y_train)
-        
+
         # Backward pass and optimize
         loss.backward()
         optimizer.step()
-        
+
         train_losses.append(loss.item())
-        
+
         if (epoch + 1) % 10 == 0:
             print(f'Epoch {epoch+1}/{epochs}, {property_name} Loss: {loss.item():.4f}')
-    
+
     # Evaluate on test data
     model.eval()
     with torch.no_grad():
         test_outputs = model(X_test)
         test_loss = criterion(test_outputs, y_test)
-        
+
         # Convert to numpy for metrics
         y_pred = test_outputs.cpu().numpy()
         y_true = y_test.cpu().numpy()
-        
+
         rmse = np.sqrt(mean_squared_error(y_true, y_pred))
         r2 = r2_score(y_true, y_pred)
-        
+
     print(f"{property_name} - Test Loss: {test_loss.item():.4f}, RMSE: {rmse:.4f}, R²: {r2:.4f}")
     return train_losses, rmse, r2
 
-# Train each model
-print("\nTraining Ground State Energy model...")
-gs_losses, gs_rmse, gs_r2 = train_model(
-    ground_state_model, X_train_tensor, y_gs_train_tensor, 
-    X_test_tensor, y_gs_test_tensor, "Ground State Energy"
-)
-
-print("\nTraining CO2 Uptake model...")
-co2_losses, co2_rmse, co2_r2 = train_model(
-    co2_uptake_model, X_train_tensor, y_co2_train_tensor, 
-    X_test_tensor, y_co2_test_tensor, "CO2 Uptake"
-)
-
-print("\nTraining Selectivity model...")
-sel_losses, sel_rmse, sel_r2 = train_model(
-    selectivity_model, X_train_tensor, y_sel_train_tensor, 
-    X_test_tensor, y_sel_test_tensor, "Selectivity"
-)
-
-print("\nTraining Heat Adsorption model...")
-heat_losses, heat_rmse, heat_r2 = train_model(
-    heat_adsorption_model, X_train_tensor, y_heat_train_tensor, 
-    X_test_tensor, y_heat_test_tensor, "Heat Adsorption"
-)
+def train_multitask_model(model, X_train, y_train, X_test, y_test, loss_weights=None, epochs=50, lr=0.001):
+    """Train all targets together. y_train and y_test are (N, 4) tensors.
+    The loss is a weighted sum of the per-target MSEs; by default each
+    target is weighted by 1 / its training variance so targets on large
+    scales do not drown out the others."""
+    optimizer = optim.Adam(model.parameters(), lr=lr)
+    if loss_weights is None:
+        loss_weights = 1.0 / torch.clamp(y_train.var(dim=0), min=1e-8)
+    loss_weights = torch.as_tensor(loss_weights, dtype=torch.float32, device=y_train.device)
+
+    train_losses = []
+
+    for epoch in range(epochs):
+        model.train()
+        optimizer.zero_grad()
+
+        # One forward pass for all four properties
+        outputs = model(X_train)
+        per_target_loss = ((outputs - y_train) ** 2).mean(dim=0)
+        loss = (per_target_loss * loss_weights).sum()
+
+        loss.backward()
+        optimizer.step()
+
+        train_losses.append(loss.item())
+
+        if (epoch + 1) % 10 == 0:
+            print(f'Epoch {epoch+1}/{epochs}, Multi-task Loss: {loss.item():.4f}')
+
+    # Evaluate on test data
+    model.eval()
+    with torch.no_grad():
+        y_pred = model(X_test).cpu().numpy()
+        y_true = y_test.cpu().numpy()
+
+    metrics = {}
+    for i, name in enumerate(TARGET_NAMES):
+        rmse = np.sqrt(mean_squared_error(y_true[:, i], y_pred[:, i]))
+        r2 = r2_score(y_true[:, i], y_pred[:, i])
+        metrics[name] = (rmse, r2)
+        print(f"{name} - RMSE: {rmse:.4f}, R²: {r2:.4f}")
+    return train_losses, metrics
+
+def train_multitask_streaming(model, train_loader, test_loader, loss_weights, epochs=50, lr=0.001):
+    """Mini-batch version of train_multitask_model for data streamed from
+    disk. The loaders yield (X, y) batches on the CPU; only one batch at a
+    time is moved to the device. Test metrics are accumulated batch by
+    batch, so the test set never has to fit in memory either."""
+    optimizer = optim.Adam(model.parameters(), lr=lr)
+    loss_weights = torch.as_tensor(loss_weights, dtype=torch.float32, device=device)
+
+    train_losses = []
+
+    for epoch in range(epochs):
+        train_loader.dataset.set_epoch(epoch)
+        model.train()
+        running_loss = 0.0
+        rows = 0
+        epoch_start = time.perf_counter()
+
+        for X_batch, y_batch in train_loader:
+            X_batch = X_batch.to(device, non_blocking=True)
+            y_batch = y_batch.to(device, non_blocking=True)
+
+            optimizer.zero_grad()
+            outputs = model(X_batch)
+            per_target_loss = ((outputs - y_batch) ** 2).mean(dim=0)
+            loss = (per_target_loss * loss_weights).sum()
+            loss.backward()
+            optimizer.step()
+
+            running_loss += loss.item() * len(X_batch)
+            rows += len(X_batch)
+
+        seconds = time.perf_counter() - epoch_start
+        train_losses.append(running_loss / max(rows, 1))
+        print(f'Epoch {epoch+1}/{epochs}, Multi-task Loss: {train_losses[-1]:.4f}, '
+              f'{rows / seconds:,.0f} rows/s')
+
+    # Evaluate on test data from running sums
+    model.eval()
+    count = 0
+    sse = np.zeros(len(TARGET_NAMES))
+    total = np.zeros(len(TARGET_NAMES))
+    total_sq = np.zeros(len(TARGET_NAMES))
+    with torch.no_grad():
+        for X_batch, y_batch in test_loader:
+            y_pred = model(X_batch.to(device)).cpu().numpy().astype(np.float64)
+            y_true = y_batch.numpy().astype(np.float64)
+            sse += ((y_true - y_pred) ** 2).sum(axis=0)
+            total += y_true.sum(axis=0)
+            total_sq += (y_true ** 2).sum(axis=0)
+            count += len(y_true)
+
+    metrics = {}
+    sst = total_sq - total ** 2 / max(count, 1)
+    for i, name in enumerate(TARGET_NAMES):
+        rmse = np.sqrt(sse[i] / max(count, 1))
+        r2 = 1.0 - sse[i] / sst[i] if sst[i] > 0 else 0.0
+        metrics[name] = (rmse, r2)
+        print(f"{name} - RMSE: {rmse:.4f}, R²: {r2:.4f}")
+    return train_losses, metrics
+
+def compare_with_separate_models(property_model, multitask_metrics, multitask_train_time,
+                                 X_train_tensor, y_train_tensor, X_test_tensor, y_test_tensor,
+                                 epochs=50, lr=0.001):
+    """Train the original separate models for each property and compare"""
+    input_dim = X_train_tensor.shape[1]
+    separate_models = {}
+    separate_metrics = {}
+    start_time = time.perf_counter()
+    for i, name in enumerate(TARGET_NAMES):
+        print(f"\nTraining {name} model...")
+        separate_models[name] = PropertyPredictor(input_dim).to(device)
+        _, rmse, r2 = train_model(
+            separate_models[name], X_train_tensor, y_train_tensor[:, i:i + 1],
+            X_test_tensor, y_test_tensor[:, i:i + 1], name, epochs=epochs, lr=lr
+        )
+        separate_metrics[name] = (rmse, r2)
+    separate_train_time = time.perf_counter() - start_time
+
+    # Time inference over the test set: four calls against one
+    with torch.no_grad():
+        for model in separate_models.values():
+            model.eval()
+        start_time = time.perf_counter()
+        for _ in range(100):
+            for model in separate_models.values():
+                model(X_test_tensor)
+        separate_predict_time = (time.perf_counter() - start_time) / 100
+        start_time = time.perf_counter()
+        for _ in range(100):
+            property_model(X_test_tensor)
+        multitask_predict_time = (time.perf_counter() - start_time) / 100
+
+    print("\nSeparate vs multi-task models (test set):")
+    print(f"{'Property':<22}{'RMSE (sep)':>12}{'RMSE (mt)':>12}{'R² (sep)':>10}{'R² (mt)':>10}")
+    for name in TARGET_NAMES:
+        (sep_rmse, sep_r2), (mt_rmse, mt_r2) = separate_metrics[name], multitask_metrics[name]
+        print(f"{name:<22}{sep_rmse:>12.4f}{mt_rmse:>12.4f}{sep_r2:>10.4f}{mt_r2:>10.4f}")
+    print(f"Training time: {separate_train_time:.2f}s separate, {multitask_train_time:.2f}s multi-task "
+          f"({separate_train_time / multitask_train_time:.1f}x)")
+    print(f"Inference time: {1000 * separate_predict_time:.2f}ms separate, "
+          f"{1000 * multitask_predict_time:.2f}ms multi-task "
+          f"({separate_predict_time / multitask_predict_time:.1f}x)")
 
 # 3. AUTOENCODER FOR MOF GENERATION
 class Autoencoder(nn.Module):
     def __init__(self, input_dim, latent_dim=16):
         super(Autoencoder, self).__init__()
-        
+
         # Encoder
         self.encoder = nn.Sequential(
             nn.Linear(input_dim, 64),
@@ -215,7 +450,7 @@ class Autoencoder(nn.Module):
             nn.Linear(32, latent_dim),
             nn.ReLU()
         )
-        
+
         # Decoder
         self.decoder = nn.Sequential(
             nn.Linear(latent_dim, 32),
@@ -225,325 +460,594 @@ class Autoencoder(nn.Module):
             nn.Linear(64, input_dim),
             nn.Sigmoid()  # Output normalized between 0-1
         )
-    
+
     def forward(self, x):
         z = self.encoder(x)
         return self.decoder(z)
-    
+
     def encode(self, x):
         return self.encoder(x)
-    
+
     def decode(self, z):
         return self.decoder(z)
 
-# Create and train the autoencoder
-latent_dim = 16
-autoencoder = Autoencoder(input_dim, latent_dim).to(device)
-ae_optimizer = optim.Adam(autoencoder.parameters(), lr=0.001)
-ae_criterion = nn.MSELoss()
-
-# Training loop for autoencoder
-print("\nTraining autoencoder for MOF generation...")
-ae_epochs = 50
-ae_losses = []
-
-for epoch in range(ae_epochs):
-    autoencoder.train()
-    running_loss = 0.0
-    
-    for batch_data in train_loader:
-        inputs = batch_data[0]  # Just the features
-        
-        ae_optimizer.zero_grad()
-        outputs = autoencoder(inputs)
-        loss = ae_criterion(outputs, inputs)
-        loss.backward()
-        ae_optimizer.step()
-        running_loss += loss.item()
-    
-    avg_loss = running_loss / len(train_loader)
-    ae_losses.append(avg_loss)
-    
-    if (epoch + 1) % 10 == 0:
-        print(f'Epoch {epoch+1}/{ae_epochs}, Loss: {avg_loss:.4f}')
+def train_autoencoder(autoencoder, train_loader, epochs=50, lr=0.001):
+    """Training loop for autoencoder"""
+    ae_optimizer = optim.Adam(autoencoder.parameters(), lr=lr)
+    ae_criterion = nn.MSELoss()
+    ae_losses = []
+
+    for epoch in range(epochs):
+        if hasattr(train_loader.dataset, 'set_epoch'):
+            train_loader.dataset.set_epoch(epoch)
+        autoencoder.train()
+        running_loss = 0.0
+        rows = 0
+        epoch_start = time.perf_counter()
+
+        for batch_data in train_loader:
+            inputs = batch_data[0].to(device, non_blocking=True)  # Just the features
+            rows += len(inputs)
+
+            ae_optimizer.zero_grad()
+            outputs = autoencoder(inputs)
+            loss = ae_criterion(outputs, inputs)
+            loss.backward()
+            ae_optimizer.step()
+            running_loss += loss.item()
+
+        avg_loss = running_loss / len(train_loader)
+        ae_losses.append(avg_loss)
+
+        if (epoch + 1) % 10 == 0:
+            rows_per_second = rows / (time.perf_counter() - epoch_start)
+            print(f'Epoch {epoch+1}/{epochs}, Loss: {avg_loss:.4f}, {rows_per_second:,.0f} rows/s')
+    return ae_losses
+
+def select_seed_indices(y_gs_train, y_co2_train):
+    """Pick the training MOFs that generation is biased towards
+    (low ground state energy, high CO2 uptake)"""
+    # Top 20% for ground state (lowest values)
+    gs_indices = np.argsort(y_gs_train)[:int(len(y_gs_train)*0.2)]
+
+    # Top 20% for CO2 uptake (highest values)
+    co2_indices = np.argsort(y_co2_train)[-int(len(y_co2_train)*0.2):]
+
+    # Find intersection of these indices to get MOFs good at both
+    good_indices = np.intersect1d(gs_indices, co2_indices)
+
+    # If intersection is too small, use union instead
+    if len(good_indices) < 10:
+        good_indices = np.union1d(gs_indices, co2_indices)
+        if len(good_indices) > 100:  # Limit the number if union is too large
+            good_indices = good_indices[:100]
+    return good_indices
 
 # 4. GENERATE NEW MOFs
-def generate_mofs(num_samples=200):
-    """Generate new MOFs using the autoencoder and evaluate their properties"""
-    autoencoder.eval()
-    ground_state_model.eval()
-    co2_uptake_model.eval()
-    selectivity_model.eval()
-    heat_adsorption_model.eval()
-    
-    with torch.no_grad():
-        # Sample from latent space with bias toward high-performing MOFs
-        # Get encodings of good MOFs (low ground state energy, high CO2 uptake)
-        
-        # Top 20% for ground state (lowest values)
-        gs_indices = np.argsort(y_gs_train)[:int(len(y_gs_train)*0.2)]
-        
-        # Top 20% for CO2 uptake (highest values)
-        co2_indices = np.argsort(y_co2_train)[-int(len(y_co2_train)*0.2):]
-        
-        # Find intersection of these indices to get MOFs good at both
-        good_indices = np.intersect1d(gs_indices, co2_indices)
-        
-        # If intersection is too small, use union instead
-        if len(good_indices) < 10:
-            good_indices = np.union1d(gs_indices, co2_indices)
-            if len(good_indices) > 100:  # Limit the number if union is too large
-                good_indices = good_indices[:100]
-        
-        print(f"Using {len(good_indices)} high-performing MOFs as generation seeds")
-        
-        # Use these MOFs as seed for generation
-        good_features = X_train_tensor[good_indices]
-        
-        # Encode these high-performing MOFs
-        encodings = autoencoder.encode(good_features)
-        
-        # Calculate mean and std of these encodings
-        encoding_mean = torch.mean(encodings, dim=0)
-        encoding_std = torch.std(encodings, dim=0)
-        
-        # Sample from this distribution with some randomness
-        z_samples = []
-        for _ in range(num_samples):
-            # Sample with bias towards high-performing MOFs
-            z = encoding_mean + encoding_std * torch.randn(latent_dim).to(device)
-            z_samples.append(z)
-        
-        z_tensor = torch.stack(z_samples)
-        
-        # Generate MOF features
-        generated_features = autoencoder.decode(z_tensor)
-        
-        # Predict properties
-        predicted_gs = ground_state_model(generated_features).cpu().numpy()
-        predicted_co2 = co2_uptake_model(generated_features).cpu().numpy()
-        predicted_sel = selectivity_model(generated_features).cpu().numpy()
-        predicted_heat = heat_adsorption_model(generated_features).cpu().numpy()
-        
-        return (
-            generated_features.cpu().numpy(), 
-            predicted_gs, 
-            predicted_co2, 
-            predicted_sel,
-            predicted_heat
-        )
+def rank_mofs(predicted_gs, predicted_co2, predicted_sel, predicted_heat, selection="two-stage"):
+    """Return the indices of the top 10 MOFs and their 0-100 scores"""
+    predictions = np.hstack([predicted_gs, predicted_co2, predicted_sel, predicted_heat])
 
-# Generate MOFs
-print("\nGenerating new MOFs...")
-num_to_generate = 200
-generated_features, predicted_gs, predicted_co2, predicted_sel, predicted_heat = generate_mofs(num_to_generate)
-
-# Calculate ranks for each property
-gs_ranks = np.argsort(np.argsort(predicted_gs.flatten()))  # Lower is better, so don't reverse
-co2_ranks = np.argsort(np.argsort(-predicted_co2.flatten()))  # Higher is better, so reverse with negative
-sel_ranks = np.argsort(np.argsort(-predicted_sel.flatten()))  # Higher is better, so reverse with negative
-heat_ranks = np.argsort(np.argsort(-predicted_heat.flatten()))  # Higher is better, so reverse with negative
-
-# Two-stage ranking method
-# First filter by ground state energy and CO2 uptake, then consider other properties
-print("\nRanking MOFs using two-stage method prioritizing ground state energy and CO2 uptake...")
-gs_threshold = np.percentile(gs_ranks, 30)  # Top 30% in ground state energy
-co2_threshold = np.percentile(co2_ranks, 30)  # Top 30% in CO2 uptake
-
-print(f"Ground state energy threshold (rank): {gs_threshold}")
-print(f"CO2 uptake threshold (rank): {co2_threshold}")
-
-# Find MOFs that meet both primary criteria
-primary_candidates = []
-for i in range(num_to_generate):
-    if gs_ranks[i] <= gs_threshold and co2_ranks[i] <= co2_threshold:
-        primary_candidates.append(i)
-
-print(f"Found {len(primary_candidates)} MOFs meeting both primary criteria")
-
-# If we have enough candidates from the first filter, rank them by secondary criteria
-if len(primary_candidates) >= 10:
-    # Calculate secondary score using selectivity and heat adsorption
-    secondary_scores = {}
-    for idx in primary_candidates:
-        secondary_score = sel_ranks[idx] * 0.5 + heat_ranks[idx] * 0.5
-        secondary_scores[idx] = secondary_score
-    
-    # Sort by secondary score (lower is better)
-    sorted_candidates = sorted(secondary_scores.items(), key=lambda x: x[1])
-    top_indices = [idx for idx, _ in sorted_candidates[:10]]
-else:
-    # Not enough candidates meeting both criteria, use weighted ranking instead
-    print("Not enough candidates meeting both primary criteria. Using weighted ranking instead.")
-    weighted_ranks = (
-        gs_ranks * 0.35 +  # Ground state energy (35%)
-        co2_ranks * 0.35 + # CO2 uptake (35%)
-        sel_ranks * 0.15 + # Selectivity (15%)
-        heat_ranks * 0.15  # Heat adsorption (15%)
-    )
-    top_indices = np.argsort(weighted_ranks)[:10]
-
-# Calculate percentile-based scores for display
-combined_scores = []
-for i in range(num_to_generate):
-    # Calculate percentile-based scores (0-100 scale)
-    gs_percentile = 100 * (1 - (gs_ranks[i] / len(gs_ranks)))  # Reverse for ground state
-    co2_percentile = 100 * (1 - (co2_ranks[i] / len(co2_ranks)))
-    sel_percentile = 100 * (1 - (sel_ranks[i] / len(sel_ranks)))
-    heat_percentile = 100 * (1 - (heat_ranks[i] / len(heat_ranks)))
-    
-    # Weighted average of percentiles
-    score = (
-        gs_percentile * 0.45 +
-        co2_percentile * 0.45 +
-        sel_percentile * 0.05 +
-        heat_percentile * 0.05
-    )
-    combined_scores.append(score)
+    if selection == "pareto":
+        # Non-dominated sorting over all four properties, no weights
+        print("\nSelecting MOFs from the Pareto fronts of the four predicted properties...")
+        top_indices, top_scores, info = select_pareto(predictions, top=10)
+        print(f"Used {len(info['fronts'])} front(s) of sizes {info['fronts']}")
+        return top_indices, top_scores
+
+    # Two-stage ranking method
+    # First filter by ground state energy and CO2 uptake, then consider other properties
+    print("\nRanking MOFs using two-stage method prioritizing ground state energy and CO2 uptake...")
+    top_indices, top_scores, info = rank_candidates(predictions, top=10)
+
+    print(f"Ground state energy cutoff: <= {info['ground_state_cutoff']:.4f} eV")
+    print(f"CO2 uptake cutoff: >= {info['co2_uptake_cutoff']:.4f} mmol/g")
+    print(f"Found {info['primary']} MOFs meeting both primary criteria")
+    if info['method'] == 'weighted':
+        print("Not enough candidates meeting both primary criteria. Using weighted ranking instead.")
+
+    return top_indices, top_scores
 
 # Convert generated MOFs to original feature space
-def processed_to_original_format(processed_features):
+def feature_decoder(preprocessor):
+    """Return a FeatureDecoder for this preprocessor and the features of this script"""
+    return FeatureDecoder(preprocessor, numerical_features, categorical_features)
+
+def processed_to_original_format(processed_features, preprocessor):
     """Convert preprocessed features back to original format"""
-    result = {}
-    
-    # Reverse transform numerical features
-    num_transformer = preprocessor.transformers_[0][1]
-    num_scaler = num_transformer.named_steps['scaler']
-    
-    for i, feature in enumerate(numerical_features):
-        # Find feature index in preprocessed data
-        feature_idx = list(preprocessor.get_feature_names_out()).index(f'num__{feature}')
-        # Reverse scaling
-        orig_value = processed_features[feature_idx] * num_scaler.scale_[i] + num_scaler.mean_[i]
-        result[feature] = orig_value
-    
-    # Decode categorical features
-    cat_transformer = preprocessor.transformers_[1][1]
-    cat_encoder = cat_transformer.named_steps['onehot']
-    
-    for i, feature in enumerate(categorical_features):
-        # Get categories for this feature
-        categories = cat_encoder.categories_[i]
-        
-        # Get offset in column names
-        prefix = f'cat__{feature}_'
-        matching_cols = [col for col in preprocessor.get_feature_names_out() if col.startswith(prefix)]
-        if matching_cols:
-            start_idx = list(preprocessor.get_feature_names_out()).index(matching_cols[0])
-            
-            # Find which category has highest value
-            category_values = processed_features[start_idx:start_idx + len(categories)]
-            category_idx = np.argmax(category_values)
-            if 0 <= category_idx < len(categories):
-                result[feature] = categories[category_idx]
-            else:
-                result[feature] = "Unknown"  # Fallback if index is out of range
+    return feature_decoder(preprocessor).decode_one(processed_features)
+
+def report_top_mofs(top_indices, top_scores, generated_features, predicted_gs, predicted_co2,
+                    predicted_sel, predicted_heat, preprocessor, output='generated_top_mofs.csv'):
+    """Print the top MOFs, save them to CSV and return them as dictionaries"""
+    print("\nTop Generated MOFs:")
+    print("------------------")
+
+    # Decode all top MOFs in one batched call
+    with telemetry.span("decode"):
+        decoded = feature_decoder(preprocessor).decode(generated_features[np.asarray(top_indices, dtype=np.int64)])
+
+    top_mofs_data = []
+
+    for rank, idx in enumerate(top_indices):
+        try:
+            mof_dict = {feature: values[rank] for feature, values in decoded.items()}
+
+            # Add predicted properties and score
+            mof_dict['mof_id'] = f"GEN-MOF-{rank+1}"
+            mof_dict['predicted_ground_state_energy'] = float(predicted_gs[idx][0])
+            mof_dict['predicted_co2_uptake'] = float(predicted_co2[idx][0])
+            mof_dict['predicted_selectivity'] = float(predicted_sel[idx][0])
+            mof_dict['predicted_heat_adsorption'] = float(predicted_heat[idx][0])
+            mof_dict['performance_score'] = float(top_scores[rank])
+
+            top_mofs_data.append(mof_dict)
+
+            # Print details
+            print(f"MOF #{rank+1}")
+            print(f"MOF_ID: {mof_dict['mof_id']}")
+            print(f"Predicted Ground State Energy: {mof_dict['predicted_ground_state_energy']:.4f} eV")
+            print(f"Predicted CO2 Uptake: {mof_dict['predicted_co2_uptake']:.4f} mmol/g")
+            print(f"Predicted CO2/N2 Selectivity: {mof_dict['predicted_selectivity']:.4f}")
+            print(f"Predicted Heat Adsorption: {mof_dict['predicted_heat_adsorption']:.4f} kcal/mol")
+            print(f"Generated Surface Area: {mof_dict['surface_area [m^2/g]']:.1f} m²/g")
+            print(f"Generated Void Fraction: {mof_dict['void_fraction']:.4f}")
+            print(f"Suggested Topology: {mof_dict['topology']}")
+            print(f"Suggested Functional Groups: {mof_dict['functional_groups']}")
+            print(f"Performance Score: {mof_dict['performance_score']:.1f}")
+            print("------------------")
+        except Exception as e:
+            print(f"Error processing MOF #{rank+1}: {e}")
+
+    # Save results to CSV
+    if top_mofs_data:
+        with telemetry.span("csv.write"):
+            top_mofs_df = pd.DataFrame(top_mofs_data)
+            top_mofs_df.to_csv(output, index=False)
+        print(f"\nBest MOFs saved to '{output}'")
+    else:
+        print("\nWarning: No valid MOFs generated to save to CSV")
+    return top_mofs_data
+
+def plot_results(y_gs_train, y_co2_train, y_sel_train, top_mofs_data, output='mof_generation_results.png'):
+    """Create visualization comparing original vs generated MOFs"""
+    import matplotlib.pyplot as plt  # Imported here so generation-only runs start fast
+
+    plt.figure(figsize=(12, 8))
+
+    # Plot 1: Ground State Energy vs CO2 Uptake
+    plt.subplot(2, 2, 1)
+    plt.scatter(y_gs_train, y_co2_train, alpha=0.5, label='Original MOFs', s=10)
+    if top_mofs_data:
+        plt.scatter([m['predicted_ground_state_energy'] for m in top_mofs_data],
+                   [m['predicted_co2_uptake'] for m in top_mofs_data],
+                   color='red', s=100, label='Generated MOFs')
+    plt.xlabel('Ground State Energy (eV)')
+    plt.ylabel('CO2 Uptake (mmol/g)')
+    plt.title('Ground State Energy vs CO2 Uptake')
+    plt.legend()
+
+    # Plot 2: CO2 Uptake vs Selectivity
+    plt.subplot(2, 2, 2)
+    plt.scatter(y_co2_train, y_sel_train, alpha=0.5, label='Original MOFs', s=10)
+    if top_mofs_data:
+        plt.scatter([m['predicted_co2_uptake'] for m in top_mofs_data],
+                   [m['predicted_selectivity'] for m in top_mofs_data],
+                   color='red', s=100, label='Generated MOFs')
+    plt.xlabel('CO2 Uptake (mmol/g)')
+    plt.ylabel('CO2/N2 Selectivity')
+    plt.title('CO2 Uptake vs Selectivity')
+    plt.legend()
+
+    # Plot 3: Ground State Energy Distribution
+    plt.subplot(2, 2, 3)
+    plt.hist(y_gs_train, bins=30, alpha=0.5, label='Original MOFs')
+    if top_mofs_data:
+        plt.axvline(np.mean([m['predicted_ground_state_energy'] for m in top_mofs_data]),
+                    color='red', linestyle='--', linewidth=2,
+                    label='Avg. Generated')
+        for gs in [m['predicted_ground_state_energy'] for m in top_mofs_data]:
+            plt.axvline(gs, color='red', alpha=0.3)
+    plt.xlabel('Ground State Energy (eV)')
+    plt.ylabel('Count')
+    plt.title('Ground State Energy Distribution')
+    plt.legend()
+
+    # Plot 4: CO2 Uptake Distribution
+    plt.subplot(2, 2, 4)
+    plt.hist(y_co2_train, bins=30, alpha=0.5, label='Original MOFs')
+    if top_mofs_data:
+        plt.axvline(np.mean([m['predicted_co2_uptake'] for m in top_mofs_data]),
+                    color='red', linestyle='--', linewidth=2,
+                    label='Avg. Generated')
+        for co2 in [m['predicted_co2_uptake'] for m in top_mofs_data]:
+            plt.axvline(co2, color='red', alpha=0.3)
+    plt.xlabel('CO2 Uptake (mmol/g)')
+    plt.ylabel('Count')
+    plt.title('CO2 Uptake Distribution')
+    plt.legend()
+
+    plt.tight_layout()
+    plt.savefig(output)
+    print(f"Results visualization saved to '{output}'")
+
+# 5. TRAIN OR LOAD MODELS
+def load_features(csv_path, data_digest, hyperparameters, cache_dir=None):
+    """Return the preprocessed features of the CSV, from the feature cache
+    when it holds an entry for this exact file. With streaming set in the
+    hyperparameters a missing entry is built chunk by chunk."""
+    hp = hyperparameters
+    if cache_dir is None:
+        return prepare_data(load_data(csv_path), test_size=hp['test_size'], seed=hp['seed'])
+
+    cache = FeatureCache(cache_dir)
+    settings = {
+        'numerical_features': numerical_features,
+        'categorical_features': categorical_features,
+        'targets': target_cols,
+        'test_size': hp['test_size'],
+        'seed': hp['seed'],
+    }
+    if hp.get('streaming'):
+        settings['split'] = 'streamed'  # A different split from train_test_split's
+    key = feature_key(data_digest, settings)
+    data = cache.get(key)
+    telemetry.count("feature_cache.hits" if data is not None else "feature_cache.misses")
+    if data is not None:
+        print(f"Loaded features from '{cache.path(key)}'")
+        return data
+
+    if hp.get('streaming'):
+        return stream_features(csv_path, cache, key, test_size=hp['test_size'], seed=hp['seed'],
+                               chunk_rows=hp['chunk_rows'])
+    data = prepare_data(load_data(csv_path), test_size=hp['test_size'], seed=hp['seed'])
+    print(f"Caching features in '{cache.path(key)}'")
+    return cache.put(key, data)
+
+def train_pipeline(data, hyperparameters, compare_separate=False):
+    """Train both models on preprocessed features and return what generation needs"""
+    hp = hyperparameters
+    input_dim = data['X_train'].shape[1]
+
+    # Convert to PyTorch tensors
+    X_train_tensor = torch.FloatTensor(data['X_train']).to(device)
+    X_test_tensor = torch.FloatTensor(data['X_test']).to(device)
+    y_train_tensor = torch.FloatTensor(data['y_train']).to(device)
+    y_test_tensor = torch.FloatTensor(data['y_test']).to(device)
+
+    # Create dataloaders
+    train_dataset = TensorDataset(X_train_tensor, y_train_tensor)
+    train_loader = DataLoader(train_dataset, batch_size=hp['batch_size'], shuffle=True)
+
+    # Train one model for all properties
+    print("\nTraining multi-task property model...")
+    property_model = MultiTaskPredictor(input_dim, hidden=hp['hidden'], dropout=hp['dropout']).to(device)
+    start_time = time.perf_counter()
+    with telemetry.span("train.property_model"):
+        _, multitask_metrics = train_multitask_model(
+            property_model, X_train_tensor, y_train_tensor, X_test_tensor, y_test_tensor,
+            epochs=hp['predictor_epochs'], lr=hp['predictor_lr']
+        )
+    multitask_train_time = time.perf_counter() - start_time
+
+    if compare_separate:
+        with telemetry.span("train.separate_models"):
+            compare_with_separate_models(
+                property_model, multitask_metrics, multitask_train_time,
+                X_train_tensor, y_train_tensor, X_test_tensor, y_test_tensor,
+                epochs=hp['predictor_epochs'], lr=hp['predictor_lr']
+            )
+
+    # Create and train the autoencoder
+    print("\nTraining autoencoder for MOF generation...")
+    autoencoder = Autoencoder(input_dim, hp['latent_dim']).to(device)
+    with telemetry.span("train.autoencoder"):
+        train_autoencoder(autoencoder, train_loader, epochs=hp['ae_epochs'], lr=hp['ae_lr'])
+
+    y_train = np.asarray(data['y_train'])
+    seed_indices = select_seed_indices(y_train[:, 0], y_train[:, 1])
+    return {
+        'preprocessor': data['preprocessor'],
+        'property_model': property_model,
+        'autoencoder': autoencoder,
+        'seed_features': np.asarray(data['X_train'][seed_indices]),
+        'y_train': y_train,
+        'metrics': {name: [float(rmse), float(r2)] for name, (rmse, r2) in multitask_metrics.items()},
+    }
+
+def train_pipeline_streaming(data, hyperparameters, num_workers=0, prefetch_factor=2):
+    """Train both models on mini-batches streamed from the feature cache
+    files. Peak memory depends on the chunk size, batch size, number of
+    workers and prefetch depth, not on the number of rows."""
+    hp = hyperparameters
+    paths = data['paths']
+    input_dim = data['X_train'].shape[1]
+
+    def loader(split, shuffle):
+        return make_loader(
+            paths[f'X_{split}'], paths[f'y_{split}'], batch_size=hp['batch_size'],
+            chunk_rows=hp['chunk_rows'], shuffle=shuffle, num_workers=num_workers,
+            prefetch_factor=prefetch_factor, seed=hp['seed']
+        )
+    train_loader = loader('train', True)
+    test_loader = loader('test', False)
+
+    # Train one model for all properties, weighting targets by 1 / variance
+    print(f"\nTraining multi-task property model on {train_loader.dataset.num_rows} streamed rows...")
+    _, y_var = column_stats(paths['y_train'], hp['chunk_rows'])
+    property_model = MultiTaskPredictor(input_dim, hidden=hp['hidden'], dropout=hp['dropout']).to(device)
+    with telemetry.span("train.property_model"):
+        _, multitask_metrics = train_multitask_streaming(
+            property_model, train_loader, test_loader, 1.0 / np.maximum(y_var, 1e-8),
+            epochs=hp['predictor_epochs'], lr=hp['predictor_lr']
+        )
+
+    # Create and train the autoencoder
+    print("\nTraining autoencoder for MOF generation...")
+    autoencoder = Autoencoder(input_dim, hp['latent_dim']).to(device)
+    with telemetry.span("train.autoencoder"):
+        train_autoencoder(autoencoder, train_loader, epochs=hp['ae_epochs'], lr=hp['ae_lr'])
+
+    # Targets are a few floats per row; features are only read for the seed rows
+    y_train = np.asarray(data['y_train'])
+    seed_indices = select_seed_indices(y_train[:, 0], y_train[:, 1])
+    return {
+        'preprocessor': data['preprocessor'],
+        'property_model': property_model,
+        'autoencoder': autoencoder,
+        'seed_features': np.asarray(data['X_train'][seed_indices]),
+        'y_train': y_train,
+        'metrics': {name: [float(rmse), float(r2)] for name, (rmse, r2) in multitask_metrics.items()},
+    }
+
+def save_pipeline(store, key, pipeline, hyperparameters, csv_path):
+    """Write a trained pipeline to the artifact store"""
+    store.save(
+        key,
+        pipeline['preprocessor'],
+        {'property_model': pipeline['property_model'], 'autoencoder': pipeline['autoencoder']},
+        {'seed_features': pipeline['seed_features'], 'y_train': pipeline['y_train']},
+        {
+            'data': os.path.abspath(csv_path),
+            'hyperparameters': hyperparameters,
+            'input_dim': int(pipeline['seed_features'].shape[1]),
+            'feature_names': [str(name) for name in pipeline['preprocessor'].get_feature_names_out()],
+            'metrics': pipeline['metrics'],
+        },
+    )
+    print(f"Saved artifacts to '{store.path(key)}'")
+
+def load_pipeline(store, key):
+    """Rebuild a trained pipeline from the artifact store"""
+    preprocessor, state_dicts, arrays, metadata = store.load(key, device=device)
+    hp = metadata['hyperparameters']
+
+    # Artifacts from before the widths were tunable used the defaults
+    property_model = MultiTaskPredictor(
+        metadata['input_dim'], hidden=hp.get('hidden', (64, 32)), dropout=hp.get('dropout', 0.2)
+    ).to(device)
+    property_model.load_state_dict(state_dicts['property_model'])
+    autoencoder = Autoencoder(metadata['input_dim'], hp['latent_dim']).to(device)
+    autoencoder.load_state_dict(state_dicts['autoencoder'])
+
+    return {
+        'preprocessor': preprocessor,
+        'property_model': property_model,
+        'autoencoder': autoencoder,
+        'seed_features': arrays['seed_features'],
+        'y_train': arrays['y_train'],
+        'metrics': metadata['metrics'],
+    }
+
+def load_novelty_index(path, data, csv_path, data_digest, hyperparameters, cache_dir=None):
+    """Open the index of known MOFs saved with the artifacts, building it
+    from the training and test features first if it is missing or was
+    built from a different CSV"""
+    if os.path.exists(os.path.join(path, 'meta.json')):
+        index = NoveltyIndex.load(path)
+        if data_digest is None or index.source == data_digest:
+            return index
+        print("The novelty index was built from different training data; rebuilding it")
+    if data is None:
+        if data_digest is None:
+            print("No novelty index saved and no training data to build one; skipping the novelty filter")
+            return None
+        data = load_features(csv_path, data_digest, hyperparameters, cache_dir)
+
+    start_time = time.perf_counter()
+    with telemetry.span("novelty.build_index"):
+        # Built chunk by chunk from the (memory-mapped) feature files
+        index = NoveltyIndex.build(path, [data['X_train'], data['X_test']], source=data_digest)
+    kind = "exact" if index.centroids is None else f"{len(index.centroids)}-cell approximate"
+    print(f"Built {kind} novelty index over {len(index)} known MOFs in {time.perf_counter() - start_time:.2f}s")
+    return index
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Train property predictors and generate new MOFs.")
+    parser.add_argument("--data", default="top_MOFs_screening_csv.csv", help="screening CSV to train on")
+    parser.add_argument("--config", default=None,
+                        help="JSON file of hyperparameters to use instead of the defaults (e.g. from tuning.py)")
+    parser.add_argument("--artifacts", default="artifacts", help="directory of saved preprocessors and models")
+    parser.add_argument("--feature-cache", default="feature_cache",
+                        help="directory of cached preprocessed features")
+    parser.add_argument("--no-feature-cache", action="store_true", help="always parse and preprocess the CSV")
+    parser.add_argument("--streaming", action="store_true",
+                        help="train on mini-batches streamed from the feature cache instead of holding all rows in memory")
+    parser.add_argument("--batch-size", type=int, default=256, help="mini-batch size for --streaming")
+    parser.add_argument("--chunk-rows", type=int, default=65536, help="rows read from disk at a time for --streaming")
+    parser.add_argument("--loader-workers", type=int, default=0, help="data loader processes for --streaming")
+    parser.add_argument("--prefetch", type=int, default=2, help="batches each loader process keeps ready")
+    parser.add_argument("--retrain", action="store_true",
+                        help="train even if artifacts for this CSV and these settings exist")
+    parser.add_argument("--generate-only", action="store_true",
+                        help="load saved artifacts and only generate; never trains")
+    parser.add_argument("--num-samples", type=int, default=200, help="number of MOFs to generate")
+    parser.add_argument("--block-size", type=int, default=65536, help="MOFs generated and scored per batched call")
+    parser.add_argument("--top-k", type=int, default=1000,
+                        help="best-scoring MOFs kept in memory and passed to the final ranking")
+    parser.add_argument("--candidates-dir", default="generated_candidates",
+                        help="directory that every generated MOF is streamed to ('' to keep only the top-k)")
+    parser.add_argument("--output", default="generated_top_mofs.csv", help="CSV for the top generated MOFs")
+    parser.add_argument("--search", choices=["sample", "gradient", "cmaes"], default="sample",
+                        help="sample the seed distribution, or optimize latent codes by gradient ascent or CMA-ES")
+    parser.add_argument("--restarts", type=int, default=256, help="parallel restarts for --search gradient/cmaes")
+    parser.add_argument("--search-steps", type=int, default=200,
+                        help="gradient steps or CMA-ES generations per restart")
+    parser.add_argument("--compiled", choices=["torchscript", "onnx"], default=None,
+                        help="screen with exported CPU graphs of the property model and decoder "
+                             "(exported next to the artifacts on first use; --search sample only)")
+    parser.add_argument("--int8", action="store_true", help="use the dynamically quantized int8 graphs with --compiled")
+    parser.add_argument("--decode-candidates", action="store_true",
+                        help="also write every generated MOF in the original schema to candidates.csv")
+    parser.add_argument("--novelty-distance", type=float, default=0.05,
+                        help="drop candidates closer than this to a known MOF in preprocessed feature space (0 disables)")
+    parser.add_argument("--dedupe-distance", type=float, default=0.05,
+                        help="keep only the best of candidates closer than this to each other (0 disables)")
+    parser.add_argument("--selection", choices=["two-stage", "pareto"], default="two-stage",
+                        help="pick the top MOFs by the weighted two-stage ranking or by Pareto fronts")
+    parser.add_argument("--no-plot", action="store_true", help="skip the results figure")
+    parser.add_argument("--compare-separate", action="store_true",
+                        help="also train the four single-target predictors and compare them with the multi-task model")
+    parser.add_argument("--metrics", default=None,
+                        help="record per-stage spans and counters and write them to this file "
+                             "(Prometheus text for a .prom file, JSON lines otherwise)")
+    parser.add_argument("--profile", nargs="+", default=None, metavar="SPAN",
+                        help="run these spans (e.g. train.autoencoder) under cProfile")
+    parser.add_argument("--profile-output", default="mof.prof",
+                        help="file for the --profile statistics (read with pstats or snakeviz)")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.compiled and args.search != "sample":
+        raise SystemExit("--compiled needs --search sample; latent search differentiates through the eager models")
+    if args.compiled == "onnx" and not onnx_available():
+        raise SystemExit("--compiled onnx needs onnx and onnxruntime")
+    start_time = time.perf_counter()
+    if args.metrics or args.profile:
+        telemetry.enable(profile=args.profile)
+    print(f"Using device: {device}")
+
+    hyperparameters = HYPERPARAMETERS
+    if args.config:
+        with open(args.config) as f:
+            hyperparameters = dict(HYPERPARAMETERS, **json.load(f))
+        print(f"Using hyperparameters from '{args.config}'")
+    set_seeds(hyperparameters['seed'])
+    if args.streaming:
+        if args.no_feature_cache:
+            raise SystemExit("--streaming reads from the feature cache; drop --no-feature-cache")
+        hyperparameters = dict(hyperparameters, streaming=True, batch_size=args.batch_size,
+                               chunk_rows=args.chunk_rows)
+
+    store = ArtifactStore(args.artifacts)
+    data = data_digest = None
+    if os.path.exists(args.data):
+        # Hashing the CSV is cheap; parsing and training are not
+        data_digest = file_digest(args.data)
+        key = artifact_key(data_digest, hyperparameters)
+    elif args.generate_only:
+        key = store.latest()
+        print(f"'{args.data}' not found, using the latest artifacts")
+    else:
+        raise SystemExit(f"Training data '{args.data}' not found")
+
+    have_artifacts = key is not None and store.exists(key)
+    if args.generate_only and not have_artifacts:
+        raise SystemExit("No saved artifacts for this data and these settings; run once without --generate-only")
+
+    if have_artifacts and not args.retrain and not args.compare_separate:
+        print(f"Loading artifacts from '{store.path(key)}'")
+        with telemetry.span("artifacts.load"):
+            pipeline = load_pipeline(store, key)
+    else:
+        data = load_features(args.data, data_digest, hyperparameters,
+                             None if args.no_feature_cache else args.feature_cache)
+        if args.streaming:
+            pipeline = train_pipeline_streaming(data, hyperparameters, args.loader_workers, args.prefetch)
         else:
-            result[feature] = "Unknown"  # Fallback if no matching columns
-    
-    return result
-
-# Print results for top MOFs
-print("\nTop Generated MOFs:")
-print("------------------")
-
-top_mofs_data = []
-
-for rank, idx in enumerate(top_indices):
-    try:
-        mof_dict = processed_to_original_format(generated_features[idx])
-        
-        # Add predicted properties and score
-        mof_dict['mof_id'] = f"GEN-MOF-{rank+1}"
-        mof_dict['predicted_ground_state_energy'] = float(predicted_gs[idx][0])
-        mof_dict['predicted_co2_uptake'] = float(predicted_co2[idx][0])
-        mof_dict['predicted_selectivity'] = float(predicted_sel[idx][0])
-        mof_dict['predicted_heat_adsorption'] = float(predicted_heat[idx][0])
-        mof_dict['performance_score'] = float(combined_scores[idx])
-        
-        top_mofs_data.append(mof_dict)
-        
-        # Print details
-        print(f"MOF #{rank+1}")
-        print(f"MOF_ID: {mof_dict['mof_id']}")
-        print(f"Predicted Ground State Energy: {mof_dict['predicted_ground_state_energy']:.4f} eV")
-        print(f"Predicted CO2 Uptake: {mof_dict['predicted_co2_uptake']:.4f} mmol/g")
-        print(f"Predicted CO2/N2 Selectivity: {mof_dict['predicted_selectivity']:.4f}")
-        print(f"Predicted Heat Adsorption: {mof_dict['predicted_heat_adsorption']:.4f} kcal/mol")
-        print(f"Generated Surface Area: {mof_dict['surface_area [m^2/g]']:.1f} m²/g")
-        print(f"Generated Void Fraction: {mof_dict['void_fraction']:.4f}")
-        print(f"Suggested Topology: {mof_dict['topology']}")
-        print(f"Suggested Functional Groups: {mof_dict['functional_groups']}")
-        print(f"Performance Score: {mof_dict['performance_score']:.1f}")
-        print("------------------")
-    except Exception as e:
-        print(f"Error processing MOF #{rank+1}: {e}")
-
-# Save results to CSV
-if top_mofs_data:
-    top_mofs_df = pd.DataFrame(top_mofs_data)
-    top_mofs_df.to_csv('generated_top_mofs.csv', index=False)
-    print("\nBest MOFs saved to 'generated_top_mofs.csv'")
-else:
-    print("\nWarning: No valid MOFs generated to save to CSV")
-
-# Create visualization comparing original vs generated MOFs
-plt.figure(figsize=(12, 8))
-
-# Plot 1: Ground State Energy vs CO2 Uptake
-plt.subplot(2, 2, 1)
-plt.scatter(y_gs_train, y_co2_train, alpha=0.5, label='Original MOFs', s=10)
-if top_mofs_data:
-    plt.scatter([m['predicted_ground_state_energy'] for m in top_mofs_data], 
-               [m['predicted_co2_uptake'] for m in top_mofs_data], 
-               color='red', s=100, label='Generated MOFs')
-plt.xlabel('Ground State Energy (eV)')
-plt.ylabel('CO2 Uptake (mmol/g)')
-plt.title('Ground State Energy vs CO2 Uptake')
-plt.legend()
-
-# Plot 2: CO2 Uptake vs Selectivity
-plt.subplot(2, 2, 2)
-plt.scatter(y_co2_train, y_sel_train, alpha=0.5, label='Original MOFs', s=10)
-if top_mofs_data:
-    plt.scatter([m['predicted_co2_uptake'] for m in top_mofs_data], 
-               [m['predicted_selectivity'] for m in top_mofs_data], 
-               color='red', s=100, label='Generated MOFs')
-plt.xlabel('CO2 Uptake (mmol/g)')
-plt.ylabel('CO2/N2 Selectivity')
-plt.title('CO2 Uptake vs Selectivity')
-plt.legend()
-
-# Plot 3: Ground State Energy Distribution
-plt.subplot(2, 2, 3)
-plt.hist(y_gs_train, bins=30, alpha=0.5, label='Original MOFs')
-if top_mofs_data:
-    plt.axvline(np.mean([m['predicted_ground_state_energy'] for m in top_mofs_data]), 
-                color='red', linestyle='--', linewidth=2,
-                label='Avg. Generated')
-    for gs in [m['predicted_ground_state_energy'] for m in top_mofs_data]:
-        plt.axvline(gs, color='red', alpha=0.3)
-plt.xlabel('Ground State Energy (eV)')
-plt.ylabel('Count')
-plt.title('Ground State Energy Distribution')
-plt.legend()
-
-# Plot 4: CO2 Uptake Distribution
-plt.subplot(2, 2, 4)
-plt.hist(y_co2_train, bins=30, alpha=0.5, label='Original MOFs')
-if top_mofs_data:
-    plt.axvline(np.mean([m['predicted_co2_uptake'] for m in top_mofs_data]), 
-                color='red', linestyle='--', linewidth=2,
-                label='Avg. Generated')
-    for co2 in [m['predicted_co2_uptake'] for m in top_mofs_data]:
-        plt.axvline(co2, color='red', alpha=0.3)
-plt.xlabel('CO2 Uptake (mmol/g)')
-plt.ylabel('Count')
-plt.title('CO2 Uptake Distribution')
-plt.legend()
-
-plt.tight_layout()
-plt.savefig('mof_generation_results.png')
-print("Results visualization saved to 'mof_generation_results.png'")
-
-print("\nDone! MOF generation complete.")
\ No newline at end of file
+            pipeline = train_pipeline(data, hyperparameters, compare_separate=args.compare_separate)
+        with telemetry.span("artifacts.save"):
+            save_pipeline(store, key, pipeline, hyperparameters, args.data)
+    print(f"Ready to generate after {time.perf_counter() - start_time:.2f}s")
+
+    # Index of all known MOFs for the novelty filter, kept next to the models
+    novelty = None
+    if args.novelty_distance > 0:
+        novelty = load_novelty_index(
+            os.path.join(store.path(key), 'novelty_index'), data, args.data, data_digest, hyperparameters,
+            None if args.no_feature_cache else args.feature_cache
+        )
+
+    # Generate MOFs block by block, keeping only the best top-k for ranking
+    print("\nGenerating new MOFs...")
+    seed_features = torch.FloatTensor(pipeline['seed_features']).to(device)
+    print(f"Using {len(seed_features)} high-performing MOFs as generation seeds")
+    y_train = pipeline['y_train']
+    if args.search == "sample":
+        autoencoder, property_model = pipeline['autoencoder'], pipeline['property_model']
+        if args.compiled:
+            compiled_dir = os.path.join(store.path(key), 'compiled')
+            if not os.path.exists(model_path(compiled_dir, 'property_model', args.compiled, args.int8)):
+                export_models(pipeline, compiled_dir, onnx=args.compiled == "onnx")
+            property_model, autoencoder = load_compiled(compiled_dir, autoencoder, args.compiled, args.int8)
+            print(f"Screening with {'int8 ' if args.int8 else ''}{args.compiled} models from '{compiled_dir}'")
+        with telemetry.span("generation"):
+            (_, _, generated_features, predictions), _ = screen_candidates(
+                autoencoder, property_model, seed_features, args.num_samples,
+                y_train.mean(axis=0), y_train.std(axis=0), block_size=args.block_size, top_k=args.top_k,
+                output_dir=args.candidates_dir or None,
+                decoder=feature_decoder(pipeline['preprocessor']) if args.decode_candidates else None,
+                novelty=novelty, min_distance=args.novelty_distance, dedupe_distance=args.dedupe_distance
+            )
+        telemetry.count("generation.candidates", args.num_samples)
+    else:
+        # Optimize the latent codes directly, one candidate per restart
+        search_start = time.perf_counter()
+        with telemetry.span("generation"):
+            (scores, generated_features, predictions), evaluations = search_latent(
+                pipeline['autoencoder'], pipeline['property_model'], seed_features,
+                y_train.mean(axis=0), y_train.std(axis=0), method=args.search,
+                restarts=args.restarts, steps=args.search_steps
+            )
+        telemetry.count("generation.candidates", len(predictions))
+        telemetry.count("generation.evaluations", evaluations)
+        print(f"Latent {args.search} search: {len(predictions)} candidates from {evaluations:,} evaluations "
+              f"in {time.perf_counter() - search_start:.2f}s")
+
+        # Best first, without the ones that landed on known MOFs
+        order = np.argsort(-scores)
+        if novelty is not None:
+            with telemetry.span("novelty.filter"):
+                order = order[novelty.is_novel(generated_features[order], args.novelty_distance)]
+            print(f"Left out {len(scores) - len(order)} candidates within {args.novelty_distance} of a known MOF")
+        generated_features, predictions = generated_features[order], predictions[order]
+
+        # Candidates are best first, so the best of each group of near-duplicates is kept
+        if args.dedupe_distance > 0:
+            with telemetry.span("novelty.deduplicate"):
+                keep = deduplicate(generated_features, args.dedupe_distance)
+            print(f"Dropped {len(generated_features) - len(keep)} near-duplicate candidates")
+            generated_features, predictions = generated_features[keep], predictions[keep]
+    if len(predictions) == 0:
+        raise SystemExit("No novel candidates left; generate more or lower --novelty-distance")
+    predicted_gs, predicted_co2, predicted_sel, predicted_heat = np.split(predictions, 4, axis=1)
+
+    with telemetry.span("ranking"):
+        top_indices, top_scores = rank_mofs(
+            predicted_gs, predicted_co2, predicted_sel, predicted_heat, args.selection
+        )
+    top_mofs_data = report_top_mofs(
+        top_indices, top_scores, generated_features, predicted_gs, predicted_co2,
+        predicted_sel, predicted_heat, pipeline['preprocessor'], args.output
+    )
+
+    if not args.no_plot:
+        with telemetry.span("plot"):
+            plot_results(y_train[:, 0], y_train[:, 1], y_train[:, 2], top_mofs_data)
+
+    print("\nDone! MOF generation complete.")
+    telemetry.finish(args.metrics, args.profile_output, labels={'pipeline': 'mof'})
+
+if __name__ == "__main__":
+    main()
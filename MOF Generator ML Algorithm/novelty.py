@@ -0,0 +1,264 @@
+import os
+import json
+import shutil
+import numpy as np
+
+# Up to this many known MOFs every query is compared with all of them
+EXACT_LIMIT = 50000
+
+
+def squared_distances(queries, vectors, vector_norms=None):
+    """Return the (Q, N) squared Euclidean distances between two sets of rows"""
+    if vector_norms is None:
+        vector_norms = (vectors ** 2).sum(axis=1)
+    d = (queries ** 2).sum(axis=1)[:, None] + vector_norms[None, :] - 2.0 * queries @ vectors.T
+    return np.maximum(d, 0.0)
+
+
+def kmeans(vectors, k, iterations=10, sample=None, seed=0):
+    """Lloyd's k-means on (a sample of) the rows; returns the centroids"""
+    rng = np.random.default_rng(seed)
+    if sample is not None and len(vectors) > sample:
+        vectors = vectors[rng.choice(len(vectors), sample, replace=False)]
+    centroids = vectors[rng.choice(len(vectors), k, replace=False)].copy()
+    for _ in range(iterations):
+        assignment = np.argmin(squared_distances(vectors, centroids), axis=1)
+        counts = np.bincount(assignment, minlength=k)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, vectors)
+        filled = counts > 0
+        centroids[filled] = sums[filled] / counts[filled, None]
+    return centroids
+
+
+class NoveltyIndex:
+    """Nearest-neighbour index over the preprocessed features of the known
+    MOFs. Small sets are searched exactly. Large sets are split into
+    k-means cells (an inverted file): a query is only compared with the
+    members of its `nprobe` closest cells, which makes the answer
+    approximate but keeps the cost per query near sqrt(N) distances.
+    Vectors are stored sorted by cell, so every cell is one contiguous
+    slice."""
+    def __init__(self, vectors, nlist=None, nprobe=8, exact_limit=EXACT_LIMIT, seed=0):
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        self.nprobe = nprobe
+        self.source = None
+        if len(vectors) <= exact_limit:
+            self.centroids = None
+            self.order = np.arange(len(vectors))
+            self.offsets = np.array([0, len(vectors)])
+        else:
+            nlist = nlist or int(np.sqrt(len(vectors)))
+            self.centroids = kmeans(vectors, nlist, sample=256 * nlist, seed=seed).astype(np.float32)
+            cells = self._nearest_cells(vectors, 1)[:, 0]
+            self.order = np.argsort(cells, kind='stable')
+            self.offsets = np.concatenate([[0], np.cumsum(np.bincount(cells, minlength=nlist))])
+        self.vectors = vectors[self.order]
+        self.norms = (self.vectors ** 2).sum(axis=1)
+
+    def __len__(self):
+        return len(self.vectors)
+
+    def _nearest_cells(self, queries, n, block_size=65536):
+        cells = np.empty((len(queries), n), dtype=np.int64)
+        for start in range(0, len(queries), block_size):
+            d = squared_distances(queries[start:start + block_size], self.centroids)
+            if n < d.shape[1]:
+                cells[start:start + block_size] = np.argpartition(d, n - 1, axis=1)[:, :n]
+            else:
+                cells[start:start + block_size] = np.argsort(d, axis=1)[:, :n]
+        return cells
+
+    def nearest(self, queries, block_size=4096):
+        """Return the distance to, and the row of, the closest known MOF for every query"""
+        queries = np.ascontiguousarray(np.atleast_2d(queries), dtype=np.float32)
+        best = np.full(len(queries), np.inf, dtype=np.float32)
+        best_row = np.full(len(queries), -1, dtype=np.int64)
+
+        def search(query_rows, cell):
+            members = slice(self.offsets[cell], self.offsets[cell + 1])
+            if members.start == members.stop:
+                return
+            # Keep each distance matrix to about 16M entries
+            step = max(1, min(block_size, (1 << 24) // (members.stop - members.start)))
+            for start in range(0, len(query_rows), step):
+                rows = query_rows[start:start + step]
+                d = squared_distances(queries[rows], self.vectors[members], self.norms[members])
+                j = np.argmin(d, axis=1)
+                closest = d[np.arange(len(rows)), j]
+                better = closest < best[rows]
+                best[rows[better]] = closest[better]
+                best_row[rows[better]] = members.start + j[better]
+
+        if self.centroids is None:
+            search(np.arange(len(queries)), 0)
+        else:
+            # Group the queries by probed cell so each cell is compared in one matrix product
+            probes = self._nearest_cells(queries, min(self.nprobe, len(self.centroids)))
+            for p in range(probes.shape[1]):
+                by_cell = np.argsort(probes[:, p], kind='stable')
+                cells, starts = np.unique(probes[by_cell, p], return_index=True)
+                for cell, rows in zip(cells, np.split(by_cell, starts[1:])):
+                    search(rows, cell)
+
+        return np.sqrt(best), np.where(best_row >= 0, self.order[np.maximum(best_row, 0)], -1)
+
+    def is_novel(self, queries, min_distance):
+        """Return a mask of the queries at least min_distance from every known MOF"""
+        distances, _ = self.nearest(queries)
+        return distances >= min_distance
+
+    def save(self, path, source=None):
+        """Write the index to a directory, replacing any previous one"""
+        self.source = source
+        tmp = path + f'.tmp-{os.getpid()}'
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+        np.save(os.path.join(tmp, 'vectors.npy'), self.vectors)
+        np.save(os.path.join(tmp, 'order.npy'), self.order)
+        np.save(os.path.join(tmp, 'offsets.npy'), self.offsets)
+        if self.centroids is not None:
+            np.save(os.path.join(tmp, 'centroids.npy'), self.centroids)
+        with open(os.path.join(tmp, 'meta.json'), 'w') as f:
+            json.dump({'size': len(self), 'nprobe': self.nprobe, 'source': source}, f)
+        shutil.rmtree(path, ignore_errors=True)
+        os.replace(tmp, path)
+
+    @classmethod
+    def build(cls, path, arrays, nlist=None, nprobe=8, exact_limit=EXACT_LIMIT, seed=0,
+              chunk_rows=65536, source=None):
+        """Build an index over the rows of several (memory-mapped) arrays
+        and write it to path, a chunk at a time, so the vectors are never
+        all in memory: k-means is fitted on a sample, then one pass counts
+        the members of every cell and a second writes each chunk to its
+        rows of the saved, cell-sorted vectors. Returns the saved index."""
+        sizes = [len(array) for array in arrays]
+        bounds = np.cumsum([0] + sizes)
+        total = int(bounds[-1])
+
+        def chunks():
+            for array, base in zip(arrays, bounds):
+                for start in range(0, len(array), chunk_rows):
+                    yield base + start, np.ascontiguousarray(array[start:start + chunk_rows], dtype=np.float32)
+
+        index = cls.__new__(cls)
+        index.nprobe = nprobe
+        index.centroids = None
+        if total > exact_limit:
+            nlist = nlist or int(np.sqrt(total))
+            rng = np.random.default_rng(seed)
+            rows = np.sort(rng.choice(total, min(total, 256 * nlist), replace=False))
+            sample = np.concatenate([
+                np.asarray(array[rows[(rows >= lo) & (rows < hi)] - lo], dtype=np.float32)
+                for array, lo, hi in zip(arrays, bounds[:-1], bounds[1:])
+            ])
+            index.centroids = kmeans(sample, nlist, seed=seed).astype(np.float32)
+        else:
+            nlist = 1
+
+        def cells_of(block):
+            if index.centroids is None:
+                return np.zeros(len(block), dtype=np.int64)
+            return index._nearest_cells(block, 1)[:, 0]
+
+        counts = np.zeros(nlist, dtype=np.int64)
+        if index.centroids is not None:
+            for _, block in chunks():
+                counts += np.bincount(cells_of(block), minlength=nlist)
+        else:
+            counts[0] = total
+        offsets = np.concatenate([[0], np.cumsum(counts)])
+
+        tmp = path + f'.tmp-{os.getpid()}'
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+        if total:
+            dim = next(array.shape[1] for array in arrays if len(array))
+            vectors = np.lib.format.open_memmap(os.path.join(tmp, 'vectors.npy'), mode='w+',
+                                                dtype=np.float32, shape=(total, dim))
+            order = np.lib.format.open_memmap(os.path.join(tmp, 'order.npy'), mode='w+',
+                                              dtype=np.int64, shape=(total,))
+            cursor = offsets[:-1].copy()
+            for start, block in chunks():
+                # Rows keep their original order within a cell, as with a stable sort
+                cells = cells_of(block)
+                by_cell = np.argsort(cells, kind='stable')
+                sorted_cells = cells[by_cell]
+                within = np.arange(len(block)) - np.searchsorted(sorted_cells, sorted_cells, side='left')
+                positions = cursor[sorted_cells] + within
+                vectors[positions] = block[by_cell]
+                order[positions] = start + by_cell
+                cursor += np.bincount(cells, minlength=nlist)
+            vectors.flush()
+            order.flush()
+            del vectors, order
+        else:
+            np.save(os.path.join(tmp, 'vectors.npy'), np.zeros((0, arrays[0].shape[1]), dtype=np.float32))
+            np.save(os.path.join(tmp, 'order.npy'), np.zeros(0, dtype=np.int64))
+        np.save(os.path.join(tmp, 'offsets.npy'), offsets)
+        if index.centroids is not None:
+            np.save(os.path.join(tmp, 'centroids.npy'), index.centroids)
+        with open(os.path.join(tmp, 'meta.json'), 'w') as f:
+            json.dump({'size': total, 'nprobe': nprobe, 'source': source}, f)
+        shutil.rmtree(path, ignore_errors=True)
+        os.replace(tmp, path)
+        return cls.load(path)
+
+    @classmethod
+    def load(cls, path):
+        """Open a saved index; the vectors are memory-mapped"""
+        index = cls.__new__(cls)
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+        index.nprobe = meta['nprobe']
+        index.source = meta.get('source')
+        index.vectors = np.load(os.path.join(path, 'vectors.npy'), mmap_mode='r')
+        index.order = np.load(os.path.join(path, 'order.npy'))
+        index.offsets = np.load(os.path.join(path, 'offsets.npy'))
+        centroids = os.path.join(path, 'centroids.npy')
+        index.centroids = np.load(centroids) if os.path.exists(centroids) else None
+        # Squared norms a chunk at a time, so the mapped vectors are never copied whole
+        index.norms = np.zeros(len(index.vectors), dtype=np.float32)
+        for start in range(0, len(index.vectors), 65536):
+            index.norms[start:start + 65536] = (np.asarray(index.vectors[start:start + 65536]) ** 2).sum(axis=1)
+        return index
+
+
+def deduplicate(features, min_distance, limit=None, block_size=1024):
+    """Return the positions of the rows to keep so that no two kept rows
+    are closer than min_distance. Rows are taken in order, so with rows
+    sorted best first the best of every group of near-duplicates stays.
+    Rows are handled a block at a time: each block is compared with the
+    rows kept so far, then with itself, so no N x N matrix is built.
+    With a limit, stops once that many rows are kept."""
+    features = np.ascontiguousarray(features, dtype=np.float32)
+    threshold = min_distance ** 2
+    kept = np.zeros((0, features.shape[1]), dtype=np.float32)
+    kept_norms = np.zeros(0, dtype=np.float32)
+    keep = []
+    step = max(1, (1 << 24) // block_size)  # Kept rows per distance matrix
+    for start in range(0, len(features), block_size):
+        block = features[start:start + block_size]
+        alive = np.ones(len(block), dtype=bool)
+        for k in range(0, len(kept), step):
+            alive &= ~(squared_distances(block, kept[k:k + step], kept_norms[k:k + step]) < threshold).any(axis=1)
+
+        # Greedy over the survivors of the block, best first
+        rows = np.flatnonzero(alive)
+        close = squared_distances(block[rows], block[rows]) < threshold
+        dropped = np.zeros(len(rows), dtype=bool)
+        taken = []
+        for i in range(len(rows)):
+            if dropped[i]:
+                continue
+            taken.append(i)
+            dropped |= close[i]
+            if limit is not None and len(keep) + len(taken) >= limit:
+                break
+        new = rows[taken]
+        keep.extend(start + new)
+        kept = np.concatenate([kept, block[new]])
+        kept_norms = np.concatenate([kept_norms, (block[new] ** 2).sum(axis=1)])
+        if limit is not None and len(keep) >= limit:
+            break
+    return np.array(keep, dtype=np.int64)
@@ -0,0 +1,421 @@
+import os
+import json
+import time
+import queue
+import socket
+import argparse
+import threading
+import socketserver
+import http.client
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+import pandas as pd
+import torch
+from artifacts import ArtifactStore
+from generation import PREDICTION_COLUMNS, latent_distribution, candidate_scores
+from mof import device, numerical_features, categorical_features, feature_decoder, load_pipeline
+
+
+class Overloaded(Exception):
+    """Raised when a request arrives while the batch queue is full"""
+
+
+class LatencyRecorder:
+    """Latencies of the last `window` requests of every endpoint, and the
+    sizes of the batches they were served in"""
+    def __init__(self, window=10000):
+        self.window = window
+        self.lock = threading.Lock()
+        self.latencies = {}  # endpoint -> (ring buffer of seconds, requests so far)
+        self.batches = {}  # endpoint -> [batches, rows]
+
+    def add(self, endpoint, seconds):
+        with self.lock:
+            samples, total = self.latencies.get(endpoint, (np.zeros(self.window), 0))
+            samples[total % self.window] = seconds
+            self.latencies[endpoint] = (samples, total + 1)
+
+    def add_batch(self, endpoint, rows):
+        with self.lock:
+            counts = self.batches.setdefault(endpoint, [0, 0])
+            counts[0] += 1
+            counts[1] += rows
+
+    def summary(self):
+        """Return {endpoint: {requests, p50_ms, p99_ms, max_ms, batches, rows_per_batch}}"""
+        with self.lock:
+            result = {}
+            for endpoint, (samples, total) in self.latencies.items():
+                recent = 1000 * samples[:min(total, self.window)]
+                batches, rows = self.batches.get(endpoint, (0, 0))
+                result[endpoint] = {
+                    'requests': total,
+                    'p50_ms': float(np.percentile(recent, 50)),
+                    'p99_ms': float(np.percentile(recent, 99)),
+                    'max_ms': float(recent.max()),
+                    'batches': batches,
+                    'rows_per_batch': rows / batches if batches else 0.0,
+                }
+            return result
+
+
+class MicroBatcher:
+    """Coalesces concurrent requests into batched calls. submit() puts a
+    payload on a bounded queue and returns a Future. One thread takes the
+    first waiting payload, keeps collecting more for up to `max_wait`
+    seconds or until the next one would take the batch past `max_rows`
+    rows (that one starts the next batch), and passes the whole list to
+    `process`, which returns one result per payload. A full queue raises
+    Overloaded instead of letting requests pile up."""
+    def __init__(self, name, process, recorder, max_rows=4096, max_wait=0.002, max_queue=1024):
+        self.name = name
+        self.process = process
+        self.recorder = recorder
+        self.max_rows = max_rows
+        self.max_wait = max_wait
+        self.queue = queue.Queue(max_queue)
+        self.thread = threading.Thread(target=self._run, name=f"batcher-{name}", daemon=True)
+        self.thread.start()
+
+    def submit(self, payload, rows):
+        future = Future()
+        try:
+            self.queue.put_nowait((payload, rows, future))
+        except queue.Full:
+            raise Overloaded(f"{self.name} queue is full") from None
+        return future
+
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
+
+    def _run(self):
+        held = None  # A request that did not fit in the previous batch
+        while True:
+            item = held if held is not None else self.queue.get()
+            held = None
+            if item is None:
+                return
+            batch = [item]
+            rows = item[1]
+            deadline = time.perf_counter() + self.max_wait
+            stop = False
+            while rows < self.max_rows:
+                remaining = deadline - time.perf_counter()
+                try:
+                    item = self.queue.get(timeout=remaining) if remaining > 0 else self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                if rows + item[1] > self.max_rows:
+                    held = item
+                    break
+                batch.append(item)
+                rows += item[1]
+
+            try:
+                results = self.process([payload for payload, _, _ in batch])
+                for (_, _, future), result in zip(batch, results):
+                    future.set_result(result)
+            except Exception as e:
+                for _, _, future in batch:
+                    future.set_exception(e)
+            self.recorder.add_batch(self.name, rows)
+            if stop:
+                return
+
+
+class InferenceService:
+    """Trained models loaded once, behind one micro-batcher per endpoint.
+    score() takes preprocessed feature vectors, score_mofs() rows in the
+    original schema of the screening CSV and generate() a number of MOFs
+    to sample; all three return plain lists ready for JSON. Requests are
+    checked before they are queued, so a bad request fails on its own
+    instead of failing the batch it would have joined, and no request may
+    ask for more than max_rows rows."""
+    def __init__(self, pipeline, max_rows=4096, max_wait=0.002, max_queue=1024):
+        self.max_rows = max_rows
+        self.property_model = pipeline['property_model'].eval()
+        self.autoencoder = pipeline['autoencoder'].eval()
+        self.preprocessor = pipeline['preprocessor']
+        self.decoder = feature_decoder(self.preprocessor)
+        self.input_dim = pipeline['seed_features'].shape[1]
+        y_train = np.asarray(pipeline['y_train'])
+        self.target_mean, self.target_std = y_train.mean(axis=0), y_train.std(axis=0)
+        seed_features = torch.FloatTensor(pipeline['seed_features']).to(device)
+        self.encoding_mean, self.encoding_std = latent_distribution(self.autoencoder, seed_features)
+
+        self.recorder = LatencyRecorder()
+        self.batchers = {
+            name: MicroBatcher(name, process, self.recorder, max_rows, max_wait, max_queue)
+            for name, process in (('score', self._score_batch), ('score_mofs', self._score_batch),
+                                  ('generate', self._generate_batch))
+        }
+
+    def _predict(self, features):
+        with torch.no_grad():
+            predictions = self.property_model(torch.as_tensor(features, dtype=torch.float32, device=device))
+        predictions = predictions.cpu().numpy()
+        return predictions, candidate_scores(predictions, self.target_mean, self.target_std)
+
+    def _split(self, sizes, *arrays):
+        """Split batched arrays back into one (predictions, scores, ...) tuple per request"""
+        bounds = np.cumsum(sizes)[:-1]
+        return list(zip(*(np.split(array, bounds) for array in arrays)))
+
+    def _score_batch(self, payloads):
+        features = np.concatenate(payloads)
+        predictions, scores = self._predict(features)
+        return self._split([len(p) for p in payloads], predictions, scores)
+
+    def _generate_batch(self, payloads):
+        total = sum(payloads)
+        with torch.no_grad():
+            z = self.encoding_mean + self.encoding_std * torch.randn(
+                total, len(self.encoding_mean), device=self.encoding_mean.device
+            )
+            features = self.autoencoder.decode(z).cpu().numpy()
+        predictions, scores = self._predict(features)
+        return self._split(payloads, features, predictions, scores)
+
+    def _call(self, endpoint, payload, rows, timeout):
+        start = time.perf_counter()
+        result = self.batchers[endpoint].submit(payload, rows).result(timeout)
+        self.recorder.add(endpoint, time.perf_counter() - start)
+        return result
+
+    def _scored(self, predictions, scores):
+        return {
+            'predictions': [dict(zip(PREDICTION_COLUMNS, row)) for row in predictions.tolist()],
+            'scores': scores.tolist(),
+        }
+
+    def _check_rows(self, rows):
+        if not 1 <= rows <= self.max_rows:
+            raise ValueError(f"a request must have between 1 and {self.max_rows} rows, got {rows}")
+
+    def _check_features(self, features):
+        if features.ndim != 2 or features.shape[1] != self.input_dim:
+            raise ValueError(f"features must be rows of {self.input_dim} values, got shape {features.shape}")
+        if not np.isfinite(features).all():
+            raise ValueError("features must be finite numbers")
+
+    def score(self, features, timeout=30.0):
+        features = np.asarray(features, dtype=np.float32)
+        self._check_features(features)
+        self._check_rows(len(features))
+        return self._scored(*self._call('score', features, len(features), timeout))
+
+    def score_mofs(self, mofs, timeout=30.0):
+        """Preprocess the rows on the caller's thread, then score them in a batch"""
+        if not isinstance(mofs, list) or not all(isinstance(mof, dict) for mof in mofs):
+            raise ValueError("mofs must be a list of objects")
+        self._check_rows(len(mofs))
+        columns = numerical_features + categorical_features
+        unknown = sorted({key for mof in mofs for key in mof} - set(columns))
+        if unknown:
+            raise ValueError(f"unknown columns {unknown}")
+        frame = pd.DataFrame(mofs, columns=columns)
+        for column in numerical_features:
+            frame[column] = pd.to_numeric(frame[column], errors='raise')  # Missing values are imputed
+        for column in categorical_features:
+            frame[column] = frame[column].astype(object)
+        features = np.asarray(self.preprocessor.transform(frame), dtype=np.float32)
+        self._check_features(features)
+        return self._scored(*self._call('score_mofs', features, len(features), timeout))
+
+    def generate(self, count, decode=True, timeout=30.0):
+        count = int(count)
+        self._check_rows(count)
+        features, predictions, scores = self._call('generate', count, count, timeout)
+        result = self._scored(predictions, scores)
+        if decode:
+            result['mofs'] = self.decoder.decode_frame(features).to_dict(orient='records')
+        else:
+            result['features'] = features.tolist()
+        return result
+
+    def stats(self):
+        return {
+            'latency': self.recorder.summary(),
+            'queued': {name: batcher.queue.qsize() for name, batcher in self.batchers.items()},
+        }
+
+    def close(self):
+        for batcher in self.batchers.values():
+            batcher.close()
+
+
+class InferenceHandler(BaseHTTPRequestHandler):
+    """JSON over HTTP/1.1 with keep-alive:
+    POST /score {"features": [[...], ...]} or {"mofs": [{column: value}, ...]}
+    POST /generate {"count": n, "decode": true}
+    GET /stats, GET /health"""
+    protocol_version = "HTTP/1.1"
+
+    def _send(self, status, body):
+        data = json.dumps(body, default=_json_default).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path == "/stats":
+            self._send(200, self.server.service.stats())
+        elif self.path == "/health":
+            self._send(200, {'status': 'ok'})
+        else:
+            self._send(404, {'error': f"Unknown path '{self.path}'"})
+
+    def do_POST(self):
+        service = self.server.service
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            if not isinstance(request, dict):
+                raise ValueError("the body must be a JSON object")
+            if self.path == "/score":
+                if 'mofs' in request:
+                    self._send(200, service.score_mofs(request['mofs']))
+                else:
+                    self._send(200, service.score(request['features']))
+            elif self.path == "/generate":
+                self._send(200, service.generate(request.get('count', 1), request.get('decode', True)))
+            else:
+                self._send(404, {'error': f"Unknown path '{self.path}'"})
+        except Overloaded as e:
+            self._send(503, {'error': str(e)})
+        except FutureTimeout:
+            self._send(504, {'error': "Timed out waiting for the model"})
+        except (KeyError, ValueError, TypeError) as e:
+            self._send(400, {'error': f"Bad request: {e}"})
+        except Exception as e:
+            self._send(500, {'error': f"{type(e).__name__}: {e}"})
+
+    def address_string(self):
+        return self.client_address[0] if self.client_address else "unix"
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+class UnixHTTPServer(ThreadingHTTPServer):
+    address_family = socket.AF_UNIX
+
+    def server_bind(self):
+        if os.path.exists(self.server_address):
+            os.unlink(self.server_address)
+        socketserver.TCPServer.server_bind(self)  # HTTPServer.server_bind expects a (host, port) address
+        self.server_name, self.server_port = "localhost", 0
+
+
+def _json_default(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def make_server(service, host="127.0.0.1", port=8000, unix_socket=None, verbose=False):
+    """Return an HTTP server for the service on a TCP port or a Unix socket"""
+    if unix_socket:
+        server = UnixHTTPServer(unix_socket, InferenceHandler)
+    else:
+        server = ThreadingHTTPServer((host, port), InferenceHandler)
+    server.daemon_threads = True
+    server.service = service
+    server.verbose = verbose
+    return server
+
+
+def load_test(service, requests=20000, concurrency=32, rows=1):
+    """Serve on a free local port and send `requests` /score requests of
+    `rows` feature vectors from `concurrency` keep-alive connections;
+    print the throughput and the latency the service recorded"""
+    server = make_server(service, port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    port = server.server_address[1]
+    body = json.dumps({'features': np.random.rand(rows, service.input_dim).tolist()})
+    per_client = requests // concurrency
+    errors = []
+
+    def client():
+        connection = http.client.HTTPConnection("127.0.0.1", port)
+        for _ in range(per_client):
+            connection.request("POST", "/score", body, {"Content-Type": "application/json"})
+            response = connection.getresponse()
+            response.read()
+            if response.status != 200:
+                errors.append(response.status)
+        connection.close()
+
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    seconds = time.perf_counter() - start
+    server.shutdown()
+
+    stats = service.stats()['latency']['score']
+    print(f"{per_client * concurrency:,} requests ({rows} row(s) each) from {concurrency} connections "
+          f"in {seconds:.2f}s: {per_client * concurrency / seconds:,.0f} requests/s, {len(errors)} errors")
+    print(f"Latency p50 {stats['p50_ms']:.2f}ms, p99 {stats['p99_ms']:.2f}ms; "
+          f"{stats['rows_per_batch']:.1f} rows per batch")
+    return stats
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the trained property model and generator over HTTP.")
+    parser.add_argument("--artifacts", default="artifacts", help="directory of saved preprocessors and models")
+    parser.add_argument("--key", default=None, help="artifact key to serve (default: the latest)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--unix-socket", default=None, help="listen on this Unix socket instead of a TCP port")
+    parser.add_argument("--max-batch-rows", type=int, default=4096, help="rows coalesced into one model call; also the most rows one request may ask for")
+    parser.add_argument("--max-wait-ms", type=float, default=2.0,
+                        help="how long a batch waits for more requests after the first one arrives")
+    parser.add_argument("--max-queue", type=int, default=1024,
+                        help="requests waiting per endpoint before new ones get 503")
+    parser.add_argument("--load-test", type=int, default=0, metavar="REQUESTS",
+                        help="instead of serving, measure throughput and latency with this many requests")
+    parser.add_argument("--concurrency", type=int, default=32, help="client connections for --load-test")
+    parser.add_argument("--verbose", action="store_true", help="log every request")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    store = ArtifactStore(args.artifacts)
+    key = args.key or store.latest()
+    if key is None or not store.exists(key):
+        raise SystemExit("No saved artifacts; run mof.py once first")
+    pipeline = load_pipeline(store, key)
+    service = InferenceService(pipeline, args.max_batch_rows, args.max_wait_ms / 1000, args.max_queue)
+    print(f"Loaded artifacts from '{store.path(key)}'")
+
+    if args.load_test:
+        load_test(service, args.load_test, args.concurrency)
+        service.close()
+        return
+
+    server = make_server(service, args.host, args.port, args.unix_socket, args.verbose)
+    where = args.unix_socket or f"http://{args.host}:{args.port}"
+    print(f"Serving on {where} (POST /score, POST /generate, GET /stats); Ctrl+C to stop")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+        print(json.dumps(service.stats()['latency'], indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+import numpy as np
+import torch
+from torch.utils.data import DataLoader, IterableDataset, get_worker_info
+
+
+class ChunkedArrayDataset(IterableDataset):
+    """Mini-batches streamed from a pair of .npy files (features and
+    targets) without loading them whole. Each worker opens the files
+    memory-mapped, takes every num_workers-th chunk of chunk_rows rows,
+    copies just that chunk into memory and yields shuffled mini-batches
+    from it, so memory use depends on chunk_rows and not on the number
+    of rows in the files. Chunk order and the rows within a chunk are
+    reshuffled every epoch when shuffle is set."""
+    def __init__(self, X_path, y_path, batch_size=256, chunk_rows=65536, shuffle=True, seed=42):
+        super(ChunkedArrayDataset, self).__init__()
+        self.X_path = X_path
+        self.y_path = y_path
+        self.batch_size = batch_size
+        self.chunk_rows = chunk_rows
+        self.shuffle = shuffle
+        self.seed = seed
+        self.epoch = 0
+        self.num_rows = len(np.load(X_path, mmap_mode='r'))
+
+    def set_epoch(self, epoch):
+        """Change the shuffle order; call before iterating each epoch"""
+        self.epoch = epoch
+
+    def __len__(self):
+        # Number of mini-batches, counting the short last batch of every chunk
+        full_chunks, rest = divmod(self.num_rows, self.chunk_rows)
+        per_chunk = -(-self.chunk_rows // self.batch_size)
+        return full_chunks * per_chunk + -(-rest // self.batch_size)
+
+    def __iter__(self):
+        info = get_worker_info()
+        worker_id, num_workers = (0, 1) if info is None else (info.id, info.num_workers)
+
+        # Every worker uses the same generator so they agree on the chunk order
+        rng = np.random.default_rng(self.seed + self.epoch)
+        starts = np.arange(0, self.num_rows, self.chunk_rows)
+        if self.shuffle:
+            rng.shuffle(starts)
+
+        X = np.load(self.X_path, mmap_mode='r')
+        y = np.load(self.y_path, mmap_mode='r')
+        for start in starts[worker_id::num_workers]:
+            X_chunk = np.asarray(X[start:start + self.chunk_rows], dtype=np.float32)
+            y_chunk = np.asarray(y[start:start + self.chunk_rows], dtype=np.float32)
+            order = rng.permutation(len(X_chunk)) if self.shuffle else np.arange(len(X_chunk))
+            for b in range(0, len(order), self.batch_size):
+                rows = order[b:b + self.batch_size]
+                yield torch.from_numpy(X_chunk[rows]), torch.from_numpy(y_chunk[rows])
+
+
+def make_loader(X_path, y_path, batch_size=256, chunk_rows=65536, shuffle=True,
+                num_workers=0, prefetch_factor=2, seed=42):
+    """Return a DataLoader over a ChunkedArrayDataset; each worker keeps
+    prefetch_factor batches ready ahead of the training loop"""
+    dataset = ChunkedArrayDataset(X_path, y_path, batch_size, chunk_rows, shuffle, seed)
+    options = {}
+    if num_workers > 0:
+        options['prefetch_factor'] = prefetch_factor
+    return DataLoader(dataset, batch_size=None, num_workers=num_workers,
+                      pin_memory=torch.cuda.is_available(), **options)
+
+
+def column_stats(path, chunk_rows=65536):
+    """Return the mean and variance of every column of a .npy file, read in chunks"""
+    array = np.load(path, mmap_mode='r')
+    count = 0
+    mean = np.zeros(array.shape[1])
+    m2 = np.zeros(array.shape[1])
+    for start in range(0, len(array), chunk_rows):
+        chunk = np.asarray(array[start:start + chunk_rows], dtype=np.float64)
+        n = len(chunk)
+        chunk_mean = chunk.mean(axis=0)
+        delta = chunk_mean - mean
+        # Merge the chunk into the running statistics
+        m2 += ((chunk - chunk_mean) ** 2).sum(axis=0) + delta ** 2 * count * n / (count + n)
+        mean += delta * n / (count + n)
+        count += n
+    return mean, m2 / max(count - 1, 1)
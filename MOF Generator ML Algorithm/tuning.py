@@ -0,0 +1,230 @@
+import io
+import os
+import json
+import time
+import argparse
+import itertools
+import contextlib
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+import numpy as np
+import pandas as pd
+import torch
+from torch.utils.data import DataLoader, TensorDataset
+from sklearn.model_selection import KFold
+
+# Values tried for each hyperparameter (keys as in mof.HYPERPARAMETERS). A
+# grid search tries every combination; a random search draws each value
+# from its list, except for the keys in CONTINUOUS, which are drawn from
+# the range their list spans.
+SEARCH_SPACE = {
+    'predictor_lr': [1e-4, 3e-4, 1e-3, 3e-3, 1e-2],
+    'hidden': [[32, 16], [64, 32], [128, 64], [256, 128]],
+    'dropout': [0.0, 0.1, 0.2, 0.3],
+    'predictor_epochs': [25, 50, 100, 200],
+    'latent_dim': [8, 16, 32],
+}
+CONTINUOUS = {'predictor_lr': 'log', 'dropout': 'linear'}
+
+
+def grid_configs(space):
+    """Yield every combination of the values in the space"""
+    keys = list(space)
+    for values in itertools.product(*(space[key] for key in keys)):
+        yield dict(zip(keys, values))
+
+
+def random_configs(space, trials, seed=0):
+    """Yield `trials` random points of the space"""
+    rng = np.random.default_rng(seed)
+    for _ in range(trials):
+        config = {}
+        for key, values in space.items():
+            if CONTINUOUS.get(key) == 'log':
+                config[key] = float(np.exp(rng.uniform(np.log(min(values)), np.log(max(values)))))
+            elif CONTINUOUS.get(key) == 'linear':
+                config[key] = float(rng.uniform(min(values), max(values)))
+            else:
+                config[key] = values[rng.integers(len(values))]
+        yield config
+
+
+# The training features and the folds of this worker process, set up by _init_worker
+_worker = {}
+
+
+def _init_worker(paths, folds, seed, threads):
+    """Open the cached feature matrices memory-mapped, so every worker
+    reads the same pages instead of holding its own copy"""
+    torch.set_num_threads(threads)
+    _worker['X'] = np.load(paths['X_train'], mmap_mode='r')
+    _worker['y'] = np.load(paths['y_train'], mmap_mode='r')
+    _worker['folds'] = list(KFold(folds, shuffle=True, random_state=seed).split(np.arange(len(_worker['X']))))
+    _worker['reconstruction'] = {}  # Autoencoder losses already measured by this worker
+
+
+def _reconstruction_loss(config, fold, X_train, X_val):
+    """Validation reconstruction error of an autoencoder as a fraction of
+    the feature variance. It only depends on the autoencoder settings, so
+    trials that share them reuse the result."""
+    import mof
+
+    key = (config['latent_dim'], config['ae_epochs'], config['ae_lr'], config['batch_size'], fold)
+    if key not in _worker['reconstruction']:
+        mof.set_seeds(config['seed'])
+        autoencoder = mof.Autoencoder(X_train.shape[1], config['latent_dim']).to(mof.device)
+        loader = DataLoader(TensorDataset(X_train), batch_size=config['batch_size'], shuffle=True)
+        mof.train_autoencoder(autoencoder, loader, epochs=config['ae_epochs'], lr=config['ae_lr'])
+        autoencoder.eval()
+        with torch.no_grad():
+            error = ((autoencoder(X_val) - X_val) ** 2).sum()
+            variance = ((X_val - X_val.mean(dim=0)) ** 2).sum()
+        _worker['reconstruction'][key] = float(error / torch.clamp(variance, min=1e-12))
+    return _worker['reconstruction'][key]
+
+
+def run_trial(trial, config, thresholds):
+    """Cross-validate one configuration. The predictor loss is the mean
+    of 1 - R² over the four targets; the objective is the mean of it and
+    the reconstruction loss, both 1.0 for a model that predicts the mean.
+    After each fold the running objective is compared with thresholds[fold]
+    and the trial stops early (is pruned) if it is worse."""
+    import mof
+
+    start = time.perf_counter()
+    X, y = _worker['X'], _worker['y']
+    predictor_losses, reconstruction_losses, running = [], [], []
+    pruned = False
+    for fold, (train_index, val_index) in enumerate(_worker['folds']):
+        X_train = torch.from_numpy(np.asarray(X[train_index], dtype=np.float32)).to(mof.device)
+        X_val = torch.from_numpy(np.asarray(X[val_index], dtype=np.float32)).to(mof.device)
+        y_train = torch.from_numpy(np.asarray(y[train_index], dtype=np.float32)).to(mof.device)
+        y_val = torch.from_numpy(np.asarray(y[val_index], dtype=np.float32)).to(mof.device)
+
+        with contextlib.redirect_stdout(io.StringIO()):  # The training loops print progress
+            mof.set_seeds(config['seed'])
+            model = mof.MultiTaskPredictor(X.shape[1], hidden=config['hidden'], dropout=config['dropout'])
+            _, metrics = mof.train_multitask_model(
+                model.to(mof.device), X_train, y_train, X_val, y_val,
+                epochs=config['predictor_epochs'], lr=config['predictor_lr']
+            )
+            predictor_losses.append(float(np.mean([1.0 - r2 for _, r2 in metrics.values()])))
+            reconstruction_losses.append(_reconstruction_loss(config, fold, X_train, X_val))
+
+        running.append((np.mean(predictor_losses) + np.mean(reconstruction_losses)) / 2)
+        last_fold = fold == len(_worker['folds']) - 1
+        if not last_fold and thresholds[fold] is not None and running[-1] > thresholds[fold]:
+            pruned = True
+            break
+
+    return {
+        'trial': trial,
+        **config,
+        'folds': len(running),
+        'predictor_loss': float(np.mean(predictor_losses)),
+        'reconstruction_loss': float(np.mean(reconstruction_losses)),
+        'objective': float(running[-1]),
+        'pruned': pruned,
+        'seconds': time.perf_counter() - start,
+        'fold_objectives': running,
+    }
+
+
+def search(paths, configs, folds=5, workers=None, seed=42, min_trials=5, threads=1):
+    """Run the trials in a process pool, `workers` at a time, and return
+    their results in the order they finished. A trial is pruned after a
+    fold if its running objective is worse than the median that the
+    trials finished before it reached after the same fold (once at least
+    min_trials have)."""
+    workers = workers or os.cpu_count() or 1
+    history = [[] for _ in range(folds)]  # Running objective of every finished trial after each fold
+    results = []
+    pending = {}
+    configs = enumerate(configs)
+    start = time.perf_counter()
+
+    context = mp.get_context("spawn")  # Forking a process that has used torch can deadlock
+    with ProcessPoolExecutor(workers, mp_context=context, initializer=_init_worker,
+                             initargs=(paths, folds, seed, threads)) as pool:
+        def submit():
+            item = next(configs, None)
+            if item is None:
+                return
+            thresholds = [float(np.median(h)) if len(h) >= min_trials else None for h in history]
+            pending[pool.submit(run_trial, item[0], item[1], thresholds)] = item[0]
+
+        for _ in range(workers):
+            submit()
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                del pending[future]
+                result = future.result()
+                for fold, value in enumerate(result['fold_objectives']):
+                    history[fold].append(value)
+                results.append(result)
+                status = f"pruned after {result['folds']} fold(s)" if result['pruned'] else "done"
+                print(f"Trial {result['trial']}: objective {result['objective']:.4f} ({status}, "
+                      f"{result['seconds']:.1f}s); {len(results)} finished in {time.perf_counter() - start:.0f}s")
+                submit()
+    return results
+
+
+def rank(results, space):
+    """Return the results as a DataFrame, completed trials first, best first"""
+    table = pd.DataFrame(results).drop(columns=['fold_objectives'])
+    table['hidden'] = table['hidden'].map(lambda hidden: 'x'.join(str(h) for h in hidden))
+    table = table.sort_values(['pruned', 'objective']).reset_index(drop=True)
+    columns = ['trial'] + list(space) + ['folds', 'predictor_loss', 'reconstruction_loss', 'objective',
+                                         'pruned', 'seconds']
+    return table[columns]
+
+
+if __name__ == "__main__":
+    from mof import HYPERPARAMETERS, load_features
+    from artifacts import file_digest
+
+    parser = argparse.ArgumentParser(description="Cross-validated hyperparameter search for the MOF models.")
+    parser.add_argument("--data", default="top_MOFs_screening_csv.csv", help="screening CSV to train on")
+    parser.add_argument("--feature-cache", default="feature_cache",
+                        help="directory of cached preprocessed features, shared by the workers")
+    parser.add_argument("--method", choices=["random", "grid"], default="random")
+    parser.add_argument("--trials", type=int, default=40, help="configurations to try with --method random")
+    parser.add_argument("--folds", type=int, default=5, help="cross-validation folds")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="trials run in parallel")
+    parser.add_argument("--threads", type=int, default=1, help="torch threads per worker")
+    parser.add_argument("--min-trials", type=int, default=5,
+                        help="finished trials needed before others are pruned against their median")
+    parser.add_argument("--output", default="tuning", help="directory for results.csv and best_config.json")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.data):
+        raise SystemExit(f"Training data '{args.data}' not found")
+    hp = HYPERPARAMETERS
+    # Only the training split is cross-validated; the test split stays held out
+    data = load_features(args.data, file_digest(args.data), hp, args.feature_cache)
+
+    if args.method == "grid":
+        configs = list(grid_configs(SEARCH_SPACE))
+    else:
+        configs = list(random_configs(SEARCH_SPACE, args.trials, seed=hp['seed']))
+    print(f"Searching {len(configs)} configurations with {args.folds}-fold cross-validation "
+          f"on {len(data['X_train'])} rows, {args.workers} at a time")
+    results = search(
+        data['paths'], (dict(hp, **config) for config in configs), folds=args.folds,
+        workers=args.workers, seed=hp['seed'], min_trials=args.min_trials, threads=args.threads
+    )
+
+    table = rank(results, SEARCH_SPACE)
+    os.makedirs(args.output, exist_ok=True)
+    table.to_csv(os.path.join(args.output, 'results.csv'), index=False)
+    with pd.option_context('display.width', 200, 'display.max_columns', None):
+        print("\n" + table.head(20).to_string(index=False, float_format=lambda v: f"{v:.4g}"))
+
+    best = next(result for result in results if result['trial'] == table['trial'][0])
+    best_config = {key: best[key] for key in SEARCH_SPACE}
+    with open(os.path.join(args.output, 'best_config.json'), 'w') as f:
+        json.dump(best_config, f, indent=2)
+    print(f"\nBest configuration: {best_config}")
+    print(f"Saved to '{os.path.join(args.output, 'best_config.json')}'; train with it using "
+          f"python mof.py --config {os.path.join(args.output, 'best_config.json')}")
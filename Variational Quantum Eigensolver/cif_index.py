@@ -0,0 +1,466 @@
+import os  # For listing and stat-ing the CIF files
+import re  # For splitting CIF lines that contain quoted values
+import json  # For storing small lists as text in the index
+import hashlib  # For a signature of the indexed files
+import math  # For computing the cell volume when a CIF leaves it out
+import time  # For timing index rebuilds
+import sqlite3  # For an index file that survives between runs
+import argparse  # For the command line interface
+import multiprocessing as mp  # For parsing many CIF files at once
+import numpy as np  # For the atom coordinate arrays
+
+"""
+A streaming reader for the CIF files in MOF_Database and a persistent
+index of the parsed structures. The reader goes through a file line by
+line, keeping only the tags and loops the pipeline needs: the cell
+lengths and angles, the volume, the space group and its symmetry
+operations, the atom sites (with partial charges when present) and
+the bond list. The index stores every parsed structure in a SQLite
+file together with the file's modification time and size, so a rebuild
+only parses the files that were added or changed since the last one.
+"""
+
+# Matches a quoted value or a run of non-space characters
+_TOKEN = re.compile(r"'[^']*'|\"[^\"]*\"|\S+")
+
+# Matches one signed term of a symmetry operation component, e.g. "-x" or "+1/2"
+_SYMOP_TERM = re.compile(r"([+-]?)([^+-]+)")
+
+# Tags that name the space group and its symmetry operations, old and new CIF dictionaries
+_SPACE_GROUP_TAGS = ("_symmetry_space_group_name_h-m", "_space_group_name_h-m_alt")
+_SPACE_GROUP_NUMBER_TAGS = ("_symmetry_int_tables_number", "_space_group_it_number")
+_SYMOP_TAGS = ("_symmetry_equiv_pos_as_xyz", "_space_group_symop_operation_xyz")
+
+"""
+This function splits a CIF data line into values. Lines without
+quotes, which is nearly all atom site rows, take the fast str.split
+path.
+"""
+def _tokens(line):
+    if "'" not in line and '"' not in line:
+        return line.split()
+    return [t[1:-1] if t[0] in "'\"" and len(t) > 1 else t for t in _TOKEN.findall(line)]
+
+"""
+This function reads a CIF number, dropping a standard uncertainty in
+brackets such as 12.345(6). Unknown values ("?" or ".") become NaN.
+"""
+def _number(value):
+    if value in ("?", "."):
+        return float("nan")
+    bracket = value.find("(")
+    return float(value[:bracket] if bracket >= 0 else value)
+
+"""
+This function reads a CIF file into its tag values and loops in one
+pass. Tags are lower-cased because CIF tags are case-insensitive.
+Each loop is returned as (list of column tags, list of rows).
+"""
+def _read_blocks(path):
+    tags = {}
+    loops = []
+    columns = None  # Column tags of the loop being read, None outside a loop
+    values = []  # Values of the loop being read
+    reading_rows = False
+    pending_tag = None  # Tag whose value is on the next line
+    in_text_field = False
+
+    def finish_loop():
+        if columns:
+            width = len(columns)
+            rows = [values[i:i + width] for i in range(0, len(values) - width + 1, width)]
+            loops.append((columns, rows))
+
+    with open(path, "r", errors="replace") as f:
+        for line in f:
+            # Multi-line text fields start and end with a ';' in the first column
+            if line.startswith(";"):
+                in_text_field = not in_text_field
+                continue
+            if in_text_field:
+                continue
+
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+
+            if line.startswith("loop_"):
+                finish_loop()
+                columns, values, reading_rows = [], [], False
+            elif line.startswith("_"):
+                if columns is not None and not reading_rows:
+                    columns.append(line.split()[0].lower())  # Another column of the loop header
+                    continue
+                finish_loop()
+                columns = None
+                parts = line.split(None, 1)
+                if len(parts) == 2:
+                    value = _tokens(parts[1])
+                    tags[parts[0].lower()] = value[0] if value else ""
+                else:
+                    pending_tag = parts[0].lower()
+            elif line.startswith("data_"):
+                finish_loop()
+                columns = None
+                tags["data_"] = line[len("data_"):]
+            elif columns is not None:
+                reading_rows = True
+                values.extend(_tokens(line))
+            elif pending_tag is not None:
+                value = _tokens(line)
+                tags[pending_tag] = value[0] if value else ""
+                pending_tag = None
+
+    finish_loop()
+    return tags, loops
+
+"""
+This function returns the loop that has the given column, or None.
+"""
+def _find_loop(loops, column):
+    for columns, rows in loops:
+        if column in columns:
+            return columns, rows
+    return None
+
+"""
+This function computes the volume of a unit cell from its lengths and
+angles (in degrees).
+"""
+def cell_volume(a, b, c, alpha, beta, gamma):
+    ca, cb, cg = (math.cos(math.radians(x)) for x in (alpha, beta, gamma))
+    return a * b * c * math.sqrt(max(0.0, 1 - ca * ca - cb * cb - cg * cg + 2 * ca * cb * cg))
+
+"""
+This function parses a CIF file into a dictionary with the MOF name,
+the cell (a, b, c, alpha, beta, gamma), volume, space group name and
+number, symmetry operations, atom labels and element symbols, the
+fractional coordinates as an (n, 3) array, the partial charges (or
+None when the file has none) and the bonds as an (m, 2) array of atom
+indices.
+"""
+def parse_cif(path):
+    tags, loops = _read_blocks(path)
+
+    cell = tuple(
+        _number(tags.get(f"_cell_{key}", "nan"))
+        for key in ("length_a", "length_b", "length_c", "angle_alpha", "angle_beta", "angle_gamma")
+    )
+    volume = _number(tags["_cell_volume"]) if "_cell_volume" in tags else cell_volume(*cell)
+
+    space_group = next((tags[t] for t in _SPACE_GROUP_TAGS if t in tags), "P1")
+    space_group_number = next((int(_number(tags[t])) for t in _SPACE_GROUP_NUMBER_TAGS if t in tags), 1)
+
+    symops = ["x, y, z"]
+    for tag in _SYMOP_TAGS:
+        loop = _find_loop(loops, tag)
+        if loop is not None:
+            columns, rows = loop
+            symops = [row[columns.index(tag)] for row in rows]
+            break
+
+    labels, symbols, charges = [], [], None
+    fract = np.zeros((0, 3))
+    loop = _find_loop(loops, "_atom_site_fract_x")
+    if loop is not None:
+        columns, rows = loop
+        label_col = columns.index("_atom_site_label") if "_atom_site_label" in columns else None
+        xyz_cols = [columns.index(f"_atom_site_fract_{axis}") for axis in "xyz"]
+        labels = [row[label_col] for row in rows] if label_col is not None else [str(i) for i in range(len(rows))]
+        if "_atom_site_type_symbol" in columns:
+            symbol_col = columns.index("_atom_site_type_symbol")
+            symbols = [row[symbol_col] for row in rows]
+        else:
+            # Without a type symbol, the element is the leading letters of the label
+            symbols = [re.sub(r"[^A-Za-z].*$", "", label)[:2] or "X" for label in labels]
+        fract = np.array([[_number(row[c]) for c in xyz_cols] for row in rows], dtype=float).reshape(-1, 3)
+        if "_atom_type_partial_charge" in columns:
+            charge_col = columns.index("_atom_type_partial_charge")
+            charges = np.array([_number(row[charge_col]) for row in rows], dtype=float)
+
+    bonds = np.zeros((0, 2), dtype=np.int64)
+    loop = _find_loop(loops, "_geom_bond_atom_site_label_1")
+    if loop is not None and labels:
+        columns, rows = loop
+        first = columns.index("_geom_bond_atom_site_label_1")
+        second = columns.index("_geom_bond_atom_site_label_2")
+        index = {label: i for i, label in enumerate(labels)}
+        bonds = np.array(
+            [(index[row[first]], index[row[second]]) for row in rows
+             if row[first] in index and row[second] in index],
+            dtype=np.int64,
+        ).reshape(-1, 2)
+
+    name = os.path.basename(path)
+    if name.endswith(".cif"):
+        name = name[:-len(".cif")]
+
+    return {
+        "name": name,
+        "cell": cell,
+        "volume": volume,
+        "space_group": space_group,
+        "space_group_number": space_group_number,
+        "symops": symops,
+        "labels": labels,
+        "symbols": symbols,
+        "fract": fract,
+        "charges": charges,
+        "bonds": bonds,
+    }
+
+
+"""
+This function turns a symmetry operation such as "-x+1/2, y, -z" into
+a 3x3 rotation matrix and a translation vector, so that the operation
+maps fractional coordinates f to rotation @ f + translation.
+"""
+def parse_symop(op):
+    parts = op.replace(" ", "").lower().split(",")
+    if len(parts) != 3:
+        raise ValueError(f"Bad symmetry operation '{op}'")
+    rotation = np.zeros((3, 3))
+    translation = np.zeros(3)
+    for row, part in enumerate(parts):
+        for sign, term in _SYMOP_TERM.findall(part):
+            value = -1.0 if sign == "-" else 1.0
+            if term[-1] in "xyz":
+                factor = term[:-1].rstrip("*")
+                rotation[row, "xyz".index(term[-1])] += value * (_fraction(factor) if factor else 1.0)
+            else:
+                translation[row] += value * _fraction(term)
+    return rotation, translation
+
+"""
+This function reads a number in a symmetry operation, which may be a
+fraction such as 1/2.
+"""
+def _fraction(value):
+    numerator, _, denominator = value.partition("/")
+    return float(numerator) / float(denominator) if denominator else float(numerator)
+
+"""
+This function expands a parsed structure that lists only its 
+asymmetric unit into the full unit cell. Every symmetry operation is
+applied to every site, positions are wrapped into the cell, and an
+image within `tolerance` (in fractional coordinates, per axis) of a
+site already kept is dropped. The bond list of the CIF names the 
+asymmetric unit's atoms only, so the expanded structure has none and
+gets its bonds by distance. A structure with no operation besides the
+identity is returned unchanged.
+"""
+def expand_symmetry(structure, tolerance=1e-3):
+    ops = [parse_symop(op) for op in structure.get("symops") or ["x, y, z"]]
+    ops = [(r, t) for r, t in ops if not (np.allclose(r, np.eye(3)) and np.allclose(t % 1.0, 0.0))]
+    if not ops:
+        if (structure.get("space_group_number") or 1) > 1:
+            print(f"Warning: '{structure['name']}' is in space group {structure['space_group']} "
+                  f"but lists no symmetry operations; using its sites as the whole cell")
+        return structure
+
+    fract = np.asarray(structure["fract"], dtype=np.float64).reshape(-1, 3)
+    n = len(fract)
+    kept = [np.mod(fract, 1.0)]
+    sources = [np.arange(n)]
+    step = max(1, (1 << 22) // max(n, 1))  # Kept sites compared at once
+    for rotation, translation in ops:
+        images = np.mod(fract @ rotation.T + translation, 1.0)
+        fresh = np.ones(n, dtype=bool)
+        previous = np.concatenate(kept)
+        for start in range(0, len(previous), step):
+            delta = images[:, None, :] - previous[None, start:start + step, :]
+            delta -= np.round(delta)  # Across the cell boundary
+            fresh &= ~(np.abs(delta) < tolerance).all(axis=2).any(axis=1)
+        kept.append(images[fresh])
+        sources.append(np.flatnonzero(fresh))
+
+    source = np.concatenate(sources)
+    charges = structure.get("charges")
+    return dict(
+        structure,
+        symops=["x, y, z"],
+        labels=[structure["labels"][i] for i in source],
+        symbols=[structure["symbols"][i] for i in source],
+        fract=np.concatenate(kept),
+        charges=None if charges is None else np.asarray(charges, dtype=np.float64)[source],
+        bonds=np.zeros((0, 2), dtype=np.int64),
+    )
+
+"""
+This function parses one CIF file for the index and returns the row
+to store and None, or None and the error message if the file could 
+not be parsed, so one malformed file does not stop the others. It 
+runs inside the worker processes of CifIndex.update.
+"""
+def _index_row(entry):
+    path, mtime_ns, size = entry
+    try:
+        s = parse_cif(path)
+    except Exception as e:
+        return None, f"{type(e).__name__}: {e}"
+    return (
+        s["name"], path, mtime_ns, size,
+        *s["cell"], s["volume"], s["space_group"], s["space_group_number"],
+        len(s["labels"]),
+        json.dumps(s["symops"]),
+        json.dumps(s["labels"]),
+        json.dumps(s["symbols"]),
+        s["fract"].astype(np.float64).tobytes(),
+        None if s["charges"] is None else s["charges"].astype(np.float64).tobytes(),
+        s["bonds"].astype(np.int64).tobytes(),
+    ), None
+
+
+"""
+This class is the on-disk index of parsed CIF files, keyed by MOF name
+(the file name without .cif). update() brings it in line with a
+directory, re-parsing only files whose modification time or size
+changed, and get() returns a structure in the same form as parse_cif.
+Files that fail to parse are recorded with their modification time and
+size in a separate table and are only tried again once they change.
+"""
+class CifIndex:
+    _COLUMNS = (
+        "name TEXT PRIMARY KEY, path TEXT NOT NULL, mtime_ns INTEGER NOT NULL, size INTEGER NOT NULL,"
+        " a REAL, b REAL, c REAL, alpha REAL, beta REAL, gamma REAL, volume REAL,"
+        " space_group TEXT, space_group_number INTEGER, num_atoms INTEGER,"
+        " symops TEXT, labels TEXT, symbols TEXT, fract BLOB, charges BLOB, bonds BLOB"
+    )
+
+    def __init__(self, path="cif_index.sqlite"):
+        self.path = path
+        self.conn = sqlite3.connect(path, timeout=60)
+        self.conn.execute(f"CREATE TABLE IF NOT EXISTS structures ({self._COLUMNS})")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS failed"
+            " (path TEXT PRIMARY KEY, mtime_ns INTEGER NOT NULL, size INTEGER NOT NULL, error TEXT)"
+        )
+        self.conn.commit()
+
+    def update(self, cif_dir, workers=None, chunksize=32):
+        """Parse new and changed CIF files in cif_dir and drop deleted ones.
+        Returns a dictionary with the number of parsed, unchanged, removed
+        and failed files."""
+        known = {
+            path: (mtime_ns, size)
+            for path, mtime_ns, size in self.conn.execute(
+                "SELECT path, mtime_ns, size FROM structures UNION ALL SELECT path, mtime_ns, size FROM failed"
+            )
+        }
+
+        seen = set()
+        stale = []
+        with os.scandir(cif_dir) as it:
+            for entry in it:
+                if not entry.name.endswith(".cif"):
+                    continue
+                stat = entry.stat()
+                path = os.path.join(cif_dir, entry.name)
+                seen.add(path)
+                if known.get(path) != (stat.st_mtime_ns, stat.st_size):
+                    stale.append((path, stat.st_mtime_ns, stat.st_size))
+        stale.sort()
+
+        removed = [
+            (path,) for path in known
+            if path not in seen and os.path.normpath(os.path.dirname(path)) == os.path.normpath(cif_dir)
+        ]
+
+        workers = workers or os.cpu_count() or 1
+        if workers == 1 or len(stale) < 2 * chunksize:
+            results = [_index_row(entry) for entry in stale]
+        else:
+            with mp.Pool(workers) as pool:
+                results = pool.map(_index_row, stale, chunksize=chunksize)
+
+        rows = [row for row, _ in results if row is not None]
+        failed = []
+        for (path, mtime_ns, size), (_, error) in zip(stale, results):
+            if error is not None:
+                print(f"Warning: skipping '{path}': {error}")
+                failed.append((path, mtime_ns, size, error))
+
+        placeholders = ", ".join("?" * 20)
+        with self.conn:
+            # A changed file that no longer parses must not keep its old structure
+            self.conn.executemany("DELETE FROM structures WHERE path = ?", [(path,) for path, *_ in failed])
+            self.conn.executemany("DELETE FROM failed WHERE path = ?", [(row[1],) for row in rows])
+            self.conn.executemany(f"INSERT OR REPLACE INTO structures VALUES ({placeholders})", rows)
+            self.conn.executemany("INSERT OR REPLACE INTO failed VALUES (?, ?, ?, ?)", failed)
+            self.conn.executemany("DELETE FROM structures WHERE path = ?", removed)
+            self.conn.executemany("DELETE FROM failed WHERE path = ?", removed)
+
+        return {"parsed": len(rows), "unchanged": len(seen) - len(stale), "removed": len(removed),
+                "failed": len(failed)}
+
+    def get(self, name):
+        """Return the parsed structure for a MOF name, or None if it is not indexed"""
+        row = self.conn.execute(
+            "SELECT name, a, b, c, alpha, beta, gamma, volume, space_group, space_group_number,"
+            " symops, labels, symbols, fract, charges, bonds FROM structures WHERE name = ?",
+            (name,),
+        ).fetchone()
+        if row is None:
+            return None
+        (name, a, b, c, alpha, beta, gamma, volume, space_group, space_group_number,
+         symops, labels, symbols, fract, charges, bonds) = row
+        return {
+            "name": name,
+            "cell": (a, b, c, alpha, beta, gamma),
+            "volume": volume,
+            "space_group": space_group,
+            "space_group_number": space_group_number,
+            "symops": json.loads(symops),
+            "labels": json.loads(labels),
+            "symbols": json.loads(symbols),
+            "fract": np.frombuffer(fract, dtype=np.float64).reshape(-1, 3),
+            "charges": None if charges is None else np.frombuffer(charges, dtype=np.float64),
+            "bonds": np.frombuffer(bonds, dtype=np.int64).reshape(-1, 2),
+        }
+
+    def names(self):
+        """Return the names of all indexed MOFs, sorted"""
+        return [name for (name,) in self.conn.execute("SELECT name FROM structures ORDER BY name")]
+
+    def file_stats(self):
+        """Return {name: (mtime_ns, size)} of the source file of every indexed MOF"""
+        return {
+            name: (mtime_ns, size)
+            for name, mtime_ns, size in self.conn.execute("SELECT name, mtime_ns, size FROM structures")
+        }
+
+    def signature(self):
+        """Return a hash of the names, modification times and sizes of all
+        indexed files; it changes whenever the index content changes"""
+        digest = hashlib.sha256()
+        for name, mtime_ns, size in self.conn.execute(
+            "SELECT name, mtime_ns, size FROM structures ORDER BY name"
+        ):
+            digest.update(f"{name}\t{mtime_ns}\t{size}\n".encode("utf-8"))
+        return digest.hexdigest()
+
+    def __contains__(self, name):
+        return self.conn.execute("SELECT 1 FROM structures WHERE name = ?", (name,)).fetchone() is not None
+
+    def __len__(self):
+        return self.conn.execute("SELECT COUNT(*) FROM structures").fetchone()[0]
+
+    def close(self):
+        self.conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build or refresh the CIF structure index.")
+    parser.add_argument("cif_dir", nargs="?", default="../MOF_Database",
+                        help="directory containing the .cif files to index")
+    parser.add_argument("--index", default="cif_index.sqlite", help="index file to create or update")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="number of parser processes")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    index = CifIndex(args.index)
+    counts = index.update(args.cif_dir, workers=args.workers)
+    print(f"Indexed {len(index)} MOFs in {time.perf_counter() - start:.2f}s "
+          f"({counts['parsed']} parsed, {counts['unchanged']} unchanged, {counts['removed']} removed, "
+          f"{counts['failed']} failed)")
+    index.close()
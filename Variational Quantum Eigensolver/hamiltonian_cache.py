@@ -0,0 +1,97 @@
+import hashlib  # For the content-addressed cache key
+import json  # For storing parameters and energy histories as text
+import sqlite3  # For a cache file that is shared by worker processes and survives between runs
+import pennylane as pl  # For turning a Hamiltonian into its Pauli terms
+
+"""
+This function reduces a Hamiltonian to a sorted list of its Pauli 
+terms as (pauli word, coefficient) pairs. Duplicate terms are merged 
+and terms that cancel out are dropped. A Pauli word is written as a
+string such as "X0 Z1", so two Hamiltonians built in a different term
+order give the same list.
+"""
+def hamiltonian_terms(H):
+    terms = []
+    for word, coeff in pl.pauli.pauli_sentence(H).items():
+        coeff = float(pl.math.real(coeff))
+        if coeff == 0.0:
+            continue  # Terms that cancel out do not change the Hamiltonian
+        # A Pauli word maps wires to "X", "Y" or "Z"; sort it by wire
+        paulis = " ".join(f"{pauli}{wire}" for wire, pauli in sorted(word.items(), key=lambda x: str(x[0])))
+        terms.append((paulis, coeff))
+    terms.sort()
+    return terms
+
+"""
+This function computes a canonical fingerprint of a Hamiltonian from
+its Pauli terms. Coefficients are rounded to `decimals` places, so two
+Hamiltonians that differ only in term order or floating point noise 
+get the same fingerprint. Anything else that changes the answer 
+(number of qubits, optimizer settings, ...) goes in `solver_key`.
+"""
+def hamiltonian_fingerprint(H, solver_key=None, decimals=10):
+    terms = [(word, round(coeff, decimals)) for word, coeff in hamiltonian_terms(H)]
+    terms = [(word, coeff) for word, coeff in terms if coeff != 0.0]
+
+    payload = json.dumps({"terms": terms, "solver": solver_key}, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+"""
+This class is an on-disk cache of solved Hamiltonians. It maps a
+fingerprint to the ground state energy, the optimal parameters and
+the energy history, so a Hamiltonian that has been solved before, in
+this run or an earlier one, never touches the simulator again. The
+cache is a SQLite file, which lets every worker process of a batch
+sweep read and write it at the same time.
+"""
+class HamiltonianCache:
+    def __init__(self, path="hamiltonian_cache.sqlite"):
+        self.path = path
+        self.hits = 0  # Lookups answered from the cache
+        self.misses = 0  # Lookups that had to run VQE
+
+        self.conn = sqlite3.connect(path, timeout=60)
+        self.conn.execute("PRAGMA journal_mode=WAL")  # Readers do not block the writer
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS solutions ("
+            " fingerprint TEXT PRIMARY KEY,"
+            " energy REAL NOT NULL,"
+            " params TEXT NOT NULL,"
+            " energy_history TEXT NOT NULL)"
+        )
+        self.conn.commit()
+
+    def get(self, fingerprint):
+        """Return (energy, params, energy_history) or None on a miss"""
+        row = self.conn.execute(
+            "SELECT energy, params, energy_history FROM solutions WHERE fingerprint = ?",
+            (fingerprint,),
+        ).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        energy, params, energy_history = row
+        history = [(int(i), float(e)) for i, e in json.loads(energy_history)]
+        return energy, json.loads(params), history
+
+    def put(self, fingerprint, energy, params, energy_history):
+        """Store a solved Hamiltonian"""
+        self.conn.execute(
+            "INSERT OR REPLACE INTO solutions VALUES (?, ?, ?, ?)",
+            (
+                fingerprint,
+                float(energy),
+                json.dumps([float(p) for p in params]),
+                json.dumps([[int(i), float(e)] for i, e in energy_history]),
+            ),
+        )
+        self.conn.commit()
+
+    def __len__(self):
+        return self.conn.execute("SELECT COUNT(*) FROM solutions").fetchone()[0]
+
+    def close(self):
+        self.conn.close()
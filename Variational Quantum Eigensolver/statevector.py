@@ -0,0 +1,237 @@
+import numpy as np  # Plain NumPy; nothing here needs autograd
+
+"""
+A small NumPy statevector simulator for the VQE ansatz. It is meant
+for the few-qubit Hamiltonians we run in production, where the cost
+of dispatching through a PennyLane QNode is much larger than the
+simulation itself. The state of a whole batch of circuits is held in
+one array of shape (batch, 2, 2, ..., 2), every gate is a small dense
+matrix applied with einsum, and gradients come from the adjoint
+method, so one call returns the energies and the exact gradients of
+every parameter set in the batch.
+"""
+
+"""
+This function lists the gates of the ansatz in the order they are
+applied, as (gate name, wires, parameter index). It has to match
+ansatz() in variational_quantum_eigensolver.py: a layer of RX (even
+wires) and RY (odd wires) rotations, a chain of CNOTs, and a second
+layer of rotations.
+"""
+def ansatz_gates(num_qubits=2):
+    rotations = ["RX" if i % 2 == 0 else "RY" for i in range(num_qubits)]
+    gates = [(rotations[i], (i,), i) for i in range(num_qubits)]
+    gates += [("CNOT", (i, i + 1), None) for i in range(num_qubits - 1)]
+    gates += [(rotations[i], (i,), num_qubits + i) for i in range(num_qubits)]
+    return gates
+
+"""
+These functions build the gate matrices and their derivatives for a
+batch of angles. The result has shape (batch, 2, 2).
+"""
+def _rotation(name, theta):
+    c = np.cos(theta / 2)
+    s = np.sin(theta / 2)
+    if name == "RX":
+        return np.stack([np.stack([c, -1j * s], -1), np.stack([-1j * s, c], -1)], -2)
+    return np.stack([np.stack([c, -s], -1), np.stack([s, c], -1)], -2).astype(complex)
+
+def _rotation_derivative(name, theta):
+    c = np.cos(theta / 2) / 2
+    s = np.sin(theta / 2) / 2
+    if name == "RX":
+        return np.stack([np.stack([-s, -1j * c], -1), np.stack([-1j * c, -s], -1)], -2)
+    return np.stack([np.stack([-s, -c], -1), np.stack([c, -s], -1)], -2).astype(complex)
+
+"""
+These functions apply a gate to the batched state. Axis 0 is the
+batch and axis 1 + w is wire w, so wire 0 is the most significant
+bit, the same ordering PennyLane uses.
+"""
+def _apply_single(state, matrices, wire):
+    state = np.moveaxis(state, wire + 1, -1)
+    state = np.einsum("bij,b...j->b...i", matrices, state)
+    return np.moveaxis(state, -1, wire + 1)
+
+def _apply_cnot(state, control, target):
+    state = state.copy()
+    index = [slice(None)] * state.ndim
+    index[control + 1] = 1
+    # Once the control axis is sliced away, later axes move down by one
+    target_axis = target + 1 - (1 if target > control else 0)
+    state[tuple(index)] = np.flip(state[tuple(index)], axis=target_axis)
+    return state
+
+
+"""
+This class evaluates the ansatz energy <psi(params)|H|psi(params)>
+and its gradient. `hamiltonians` is either one Hamiltonian shared by
+the whole batch or a list with one Hamiltonian per parameter set, so
+many MOFs can be evaluated in one call. Hamiltonians are turned into
+dense matrices once, when the simulator is built; a NumPy array is
+taken as the matrix itself (or a stack of them), which needs no
+PennyLane at all.
+"""
+class StatevectorSimulator:
+    def __init__(self, hamiltonians, num_qubits=2):
+        self.num_qubits = num_qubits
+        self.gates = ansatz_gates(num_qubits)
+        self.num_params = sum(1 for _, _, p in self.gates if p is not None)
+        self.executions = 0  # Circuits simulated so far, counting every batch entry
+
+        if isinstance(hamiltonians, np.ndarray):
+            self.matrix = hamiltonians.astype(complex)
+            return
+        import pennylane as pl  # Only needed to turn Hamiltonians into matrices
+
+        wire_order = list(range(num_qubits))
+        if isinstance(hamiltonians, (list, tuple)):
+            self.matrix = np.stack([pl.matrix(H, wire_order=wire_order) for H in hamiltonians])
+        else:
+            self.matrix = np.asarray(pl.matrix(hamiltonians, wire_order=wire_order))
+
+    def _as_batch(self, params):
+        params = np.asarray(params, dtype=float)
+        single = params.ndim == 1
+        return np.atleast_2d(params), single
+
+    def _initial_state(self, batch):
+        state = np.zeros((batch,) + (2,) * self.num_qubits, dtype=complex)
+        state[(slice(None),) + (0,) * self.num_qubits] = 1.0
+        return state
+
+    def _apply_gate(self, state, name, wires, theta, adjoint=False):
+        if name == "CNOT":
+            return _apply_cnot(state, *wires)  # CNOT is its own inverse
+        matrices = _rotation(name, theta)
+        if adjoint:
+            matrices = np.conj(np.swapaxes(matrices, -1, -2))
+        return _apply_single(state, matrices, wires[0])
+
+    def _apply_hamiltonian(self, flat):
+        if self.matrix.ndim == 2:
+            return flat @ self.matrix.T
+        return np.einsum("bij,bj->bi", self.matrix, flat)
+
+    def state(self, params):
+        """Return the flattened statevectors, shape (batch, 2**num_qubits)"""
+        params, single = self._as_batch(params)
+        self.executions += len(params)
+        state = self._initial_state(len(params))
+        for name, wires, p in self.gates:
+            theta = None if p is None else params[:, p]
+            state = self._apply_gate(state, name, wires, theta)
+        flat = state.reshape(len(params), -1)
+        return flat[0] if single else flat
+
+    def energy(self, params):
+        """Return the energy for one parameter set, or an array for a batch"""
+        params, single = self._as_batch(params)
+        flat = self.state(params)
+        energies = np.real(np.sum(np.conj(flat) * self._apply_hamiltonian(flat), axis=1))
+        return energies[0] if single else energies
+
+    def energy_and_grad(self, params):
+        """Return the energies and their exact gradients using the adjoint method"""
+        params, single = self._as_batch(params)
+        batch = len(params)
+        shape = (batch,) + (2,) * self.num_qubits
+
+        phi = self.state(params).reshape(shape)
+        lam = self._apply_hamiltonian(phi.reshape(batch, -1))
+        energies = np.real(np.sum(np.conj(phi.reshape(batch, -1)) * lam, axis=1))
+        lam = lam.reshape(shape)
+
+        grads = np.zeros_like(params)
+        # Walk the circuit backwards, undoing one gate at a time
+        for name, wires, p in reversed(self.gates):
+            theta = None if p is None else params[:, p]
+            phi = self._apply_gate(phi, name, wires, theta, adjoint=True)
+            if p is not None:
+                mu = _apply_single(phi, _rotation_derivative(name, theta), wires[0])
+                overlap = np.sum(np.conj(lam.reshape(batch, -1)) * mu.reshape(batch, -1), axis=1)
+                grads[:, p] = 2 * np.real(overlap)
+            lam = self._apply_gate(lam, name, wires, theta, adjoint=True)
+
+        if single:
+            return energies[0], grads[0]
+        return energies, grads
+
+
+"""
+This function optimizes a whole batch of MOFs at once with plain
+gradient descent. Every iteration is a single vectorized call for
+the batch; MOFs whose energy changes by less than energy_tol stop
+being updated. Returns the energies at the final parameters, the
+parameters and the number of iterations each MOF needed.
+"""
+def optimize_batch(hamiltonians, num_qubits=2, max_iterations=100, stepsize=0.1,
+                   energy_tol=None, params=None, seed=None):
+    sim = StatevectorSimulator(list(hamiltonians), num_qubits)
+    batch = len(sim.matrix)
+    if params is None:
+        params = np.random.default_rng(seed).random((batch, sim.num_params))
+    params = np.array(params, dtype=float)
+
+    active = np.ones(batch, dtype=bool)
+    iterations = np.zeros(batch, dtype=int)
+    previous = np.full(batch, np.inf)
+    energies = previous.copy()
+
+    for _ in range(max_iterations):
+        energies, grads = sim.energy_and_grad(params)
+        iterations += active
+        params -= stepsize * grads * active[:, None]
+        if energy_tol is not None:
+            active &= np.abs(energies - previous) >= energy_tol
+            if not active.any():
+                break
+        previous = energies
+
+    # Energies at the returned parameters (the last update came after the last evaluation)
+    energies = sim.energy(params)
+    return energies, params, iterations
+
+
+"""
+This function checks the statevector backend against PennyLane's
+default.qubit for random parameters, for both the energies and the
+gradients, and returns the largest difference it saw. diff_method is
+passed on to the PennyLane QNode.
+"""
+def cross_check(H, num_qubits=2, samples=32, atol=1e-10, seed=0, diff_method="best"):
+    import pennylane as pl
+    from pennylane import numpy as pnp
+    from variational_quantum_eigensolver import build_cost_fn
+
+    cost_fn = build_cost_fn(num_qubits, diff_method=diff_method)
+    sim = StatevectorSimulator(H, num_qubits)
+    params = np.random.default_rng(seed).uniform(-np.pi, np.pi, (samples, sim.num_params))
+    energies, grads = sim.energy_and_grad(params)
+
+    worst = 0.0
+    for p, energy, grad in zip(params, energies, grads):
+        p = pnp.array(p, requires_grad=True)
+        expected_energy = float(cost_fn(p, H))
+        expected_grad = pl.grad(lambda x: cost_fn(x, H))(p)
+        worst = max(worst, abs(energy - expected_energy), float(np.max(np.abs(grad - expected_grad))))
+
+    if worst > atol:
+        raise AssertionError(f"Statevector backend differs from default.qubit by {worst:.3e}")
+    return worst
+
+
+if __name__ == "__main__":
+    import os
+    from variational_quantum_eigensolver import fixed_hamiltonian, get_hamiltonian_from_cif
+
+    worst = cross_check(fixed_hamiltonian())
+    print(f"Fixed 2-qubit Hamiltonian: matches default.qubit (largest difference {worst:.3e})")
+
+    cif_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "generated mofs", "gen-mof-1.cif")
+    if os.path.exists(cif_file):
+        for num_qubits in (2, 3, 4):
+            H, _ = get_hamiltonian_from_cif(cif_file, num_qubits)
+            worst = cross_check(H, num_qubits)
+            print(f"{num_qubits}-qubit gen-mof-1 Hamiltonian: matches default.qubit "
+                  f"(largest difference {worst:.3e})")
@@ -0,0 +1,227 @@
+import os  # For the store directory
+import json  # For the names and space groups of the stored MOFs
+import time  # For timing builds and loads
+import argparse  # For the command line interface
+import numpy as np  # For the packed arrays and memory mapping
+from cif_index import CifIndex, expand_symmetry  # Parsed structures to pack
+
+"""
+A packed, columnar store for the parsed MOF structures. All atoms of
+all MOFs sit in a few contiguous arrays (float64 fractional
+coordinates, uint8 element codes, float64 partial charges) and a
+per-MOF offset table says where each MOF starts and ends; the bonds
+are packed the same way. Coordinates and charges keep the precision
+of the CIF index, so a MOF read from the store gives exactly the
+Hamiltonian (and hamiltonian_cache fingerprint) that parsing its CIF
+file gives. The modification time and size of every source file are
+stored too, so a CIF that changed after the store was built is
+noticed and parsed again instead. Structures are stored expanded to
+the full unit cell by their symmetry operations. Every array is a .npy file that is opened
+memory-mapped, so loading the whole database only reads a small
+header and looking up a MOF returns views into the mapped files
+without copying any atom data.
+Only the VQE sweep reads the store. mof.py featurizes MOFs from the
+tabular columns of the screening CSV (volume, surface area, topology
+and so on), which have no per-atom data and no key matching the CIF
+names, so it has nothing to look up here.
+"""
+
+# Element symbols indexed by atomic number; code 0 is an unknown element
+ELEMENTS = (
+    "X", "H", "He", "Li", "Be", "B", "C", "N", "O", "F", "Ne",
+    "Na", "Mg", "Al", "Si", "P", "S", "Cl", "Ar", "K", "Ca",
+    "Sc", "Ti", "V", "Cr", "Mn", "Fe", "Co", "Ni", "Cu", "Zn",
+    "Ga", "Ge", "As", "Se", "Br", "Kr", "Rb", "Sr", "Y", "Zr",
+    "Nb", "Mo", "Tc", "Ru", "Rh", "Pd", "Ag", "Cd", "In", "Sn",
+    "Sb", "Te", "I", "Xe", "Cs", "Ba", "La", "Ce", "Pr", "Nd",
+    "Pm", "Sm", "Eu", "Gd", "Tb", "Dy", "Ho", "Er", "Tm", "Yb",
+    "Lu", "Hf", "Ta", "W", "Re", "Os", "Ir", "Pt", "Au", "Hg",
+    "Tl", "Pb", "Bi", "Po", "At", "Rn", "Fr", "Ra", "Ac", "Th",
+    "Pa", "U",
+)
+ELEMENT_CODES = {symbol: code for code, symbol in enumerate(ELEMENTS)}
+
+# The arrays of a store; each one is saved as <name>.npy
+_ARRAYS = ("fract", "elements", "charges", "atom_offsets", "bonds", "bond_offsets", "cells", "volumes",
+           "mtimes", "sizes")
+
+# Bump this whenever the layout of the arrays changes; older stores are rebuilt
+STORE_VERSION = 3
+
+
+"""
+This function turns element symbols into atomic numbers. Symbols are
+matched case-insensitively and anything unknown becomes 0.
+"""
+def element_codes(symbols):
+    codes = np.zeros(len(symbols), dtype=np.uint8)
+    for i, symbol in enumerate(symbols):
+        symbol = symbol.strip().capitalize()
+        codes[i] = ELEMENT_CODES.get(symbol, ELEMENT_CODES.get(symbol[:1], 0))
+    return codes
+
+
+"""
+This class reads a structure store. Arrays are memory-mapped, so
+opening a store is close to free, and structure() returns views into
+them. Structures can be looked up by position or by MOF name.
+"""
+class StructureStore:
+    def __init__(self, path="structure_store"):
+        self.path = path
+        with open(os.path.join(path, "meta.json")) as f:
+            meta = json.load(f)
+        if meta.get("version") != STORE_VERSION:
+            raise ValueError(f"The structure store in '{path}' has an old layout; rebuild it with structure_store.py")
+        self.names = meta["names"]
+        self.space_groups = meta["space_groups"]
+        self.source = meta.get("source")
+        self._positions = {name: i for i, name in enumerate(self.names)}
+
+        for name in _ARRAYS:
+            setattr(self, name, np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r"))
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, name):
+        return name in self._positions
+
+    def position(self, name):
+        """Return the position of a MOF in the store"""
+        return self._positions[name]
+
+    def is_current(self, name, path):
+        """Return whether the store holds the MOF as the file at path is
+        now, judged by the file's modification time and size"""
+        if name not in self._positions:
+            return False
+        i = self._positions[name]
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return False
+        return (stat.st_mtime_ns, stat.st_size) == (int(self.mtimes[i]), int(self.sizes[i]))
+
+    def atom_slice(self, i):
+        """Return the slice of the atom arrays that belongs to MOF number i"""
+        return slice(int(self.atom_offsets[i]), int(self.atom_offsets[i + 1]))
+
+    def structure(self, key):
+        """Return one MOF, by position or name, as a dictionary of array views"""
+        i = self._positions[key] if isinstance(key, str) else key
+        atoms = self.atom_slice(i)
+        bonds = slice(int(self.bond_offsets[i]), int(self.bond_offsets[i + 1]))
+        return {
+            "name": self.names[i],
+            "cell": self.cells[i],
+            "volume": float(self.volumes[i]),
+            "space_group": self.space_groups[i],
+            "fract": self.fract[atoms],  # (n, 3) float64 view
+            "elements": self.elements[atoms],  # (n,) atomic numbers
+            "charges": self.charges[atoms],  # (n,) float64, NaN when the CIF had none
+            "bonds": self.bonds[bonds],  # (m, 2) atom indices within this MOF
+        }
+
+    def nbytes(self):
+        """Return the size of all arrays in bytes"""
+        return sum(getattr(self, name).nbytes for name in _ARRAYS)
+
+
+"""
+This function packs every structure in a CifIndex into a store
+directory. The arrays are written to temporary files first and moved
+into place at the end, so readers never see a half-written store.
+"""
+def build_store(index, path="structure_store"):
+    names = index.names()
+    file_stats = index.file_stats()
+    counts = np.zeros(len(names), dtype=np.int64)
+    bond_counts = np.zeros(len(names), dtype=np.int64)
+    cells = np.zeros((len(names), 6), dtype=np.float64)
+    volumes = np.zeros(len(names), dtype=np.float64)
+    mtimes = np.array([file_stats[name][0] for name in names], dtype=np.int64)
+    sizes = np.array([file_stats[name][1] for name in names], dtype=np.int64)
+    space_groups = []
+    fract, elements, charges, bonds = [], [], [], []
+
+    for i, name in enumerate(names):
+        s = expand_symmetry(index.get(name))  # Pack the whole unit cell
+        n = len(s["fract"])
+        counts[i] = n
+        bond_counts[i] = len(s["bonds"])
+        cells[i] = s["cell"]
+        volumes[i] = s["volume"]
+        space_groups.append(s["space_group"])
+        fract.append(s["fract"].astype(np.float64))
+        elements.append(element_codes(s["symbols"]))
+        charges.append(
+            np.full(n, np.nan, dtype=np.float64) if s["charges"] is None
+            else s["charges"].astype(np.float64)
+        )
+        bonds.append(s["bonds"].astype(np.int32))
+
+    arrays = {
+        "fract": np.concatenate(fract) if fract else np.zeros((0, 3), np.float64),
+        "elements": np.concatenate(elements) if elements else np.zeros(0, np.uint8),
+        "charges": np.concatenate(charges) if charges else np.zeros(0, np.float64),
+        "atom_offsets": np.concatenate([[0], np.cumsum(counts)]),
+        "bonds": np.concatenate(bonds) if bonds else np.zeros((0, 2), np.int32),
+        "bond_offsets": np.concatenate([[0], np.cumsum(bond_counts)]),
+        "cells": cells,
+        "volumes": volumes,
+        "mtimes": mtimes,
+        "sizes": sizes,
+    }
+
+    os.makedirs(path, exist_ok=True)
+    for name, array in arrays.items():
+        tmp = os.path.join(path, f"{name}.tmp.npy")
+        np.save(tmp, np.ascontiguousarray(array))
+        os.replace(tmp, os.path.join(path, f"{name}.npy"))
+
+    meta = {"version": STORE_VERSION, "names": names, "space_groups": space_groups, "source": index.signature()}
+    tmp = os.path.join(path, "meta.json.tmp")
+    with open(tmp, "w") as f:
+        json.dump(meta, f)
+    os.replace(tmp, os.path.join(path, "meta.json"))
+
+    return StructureStore(path)
+
+"""
+This function opens the store at `path`, rebuilding it first if it is
+missing, has an old layout or was built from a different state of the
+index.
+"""
+def open_store(index, path="structure_store"):
+    if os.path.exists(os.path.join(path, "meta.json")):
+        try:
+            store = StructureStore(path)
+        except ValueError:
+            store = None  # Old layout
+        if store is not None and store.source == index.signature():
+            return store
+    return build_store(index, path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pack the CIF index into a memory-mapped structure store.")
+    parser.add_argument("cif_dir", nargs="?", default="../MOF_Database",
+                        help="directory containing the .cif files")
+    parser.add_argument("--index", default="cif_index.sqlite", help="CIF index file")
+    parser.add_argument("--store", default="structure_store", help="directory of the structure store")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="number of parser processes")
+    args = parser.parse_args()
+
+    index = CifIndex(args.index)
+    index.update(args.cif_dir, workers=args.workers)
+
+    start = time.perf_counter()
+    store = open_store(index, args.store)
+    print(f"Store ready in {time.perf_counter() - start:.2f}s")
+
+    start = time.perf_counter()
+    store = StructureStore(args.store)
+    atoms = len(store.elements)
+    print(f"Loaded {len(store)} MOFs / {atoms} atoms in {1000 * (time.perf_counter() - start):.1f}ms, "
+          f"{store.nbytes() / max(atoms, 1):.1f} bytes per atom")
@@ -1,14 +1,29 @@
 import os  # For reading files from the filesystem
+import sys  # For finding telemetry.py in the repository root
+import csv  # For appending results to the CSV file as they arrive
+import argparse  # For the command line interface
+import functools  # For binding sweep settings to the worker function
+import multiprocessing as mp  # For fanning MOFs out across worker processes
+import time  # For timing each VQE run
+import contextlib  # For running without a tracker on the NumPy backend
 from pennylane import numpy as np  # PennyLane's numpy with autograd support
-import pandas as pd  # For saving the final results into a CSV file
+import json  # For the checkpoint manifest
 import pennylane as pl  # Main PennyLane library for quantum computations
+from hamiltonian_cache import HamiltonianCache, hamiltonian_fingerprint  # Reuse solved Hamiltonians
+from statevector import StatevectorSimulator  # NumPy fast path for small qubit counts
+from warm_start import WarmStartIndex  # Start from the parameters of similar solved MOFs
+from cif_index import parse_cif, expand_symmetry  # Streaming CIF reader and symmetry expansion
+from structure_store import StructureStore  # Memory-mapped parsed structures
+from hamiltonian_builder import structure_coefficients  # Site model coefficients from a structure
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import telemetry  # Per-stage spans and counters shared with the MOF generator
 
 """
-This function creates the Hamiltonian for simulating the Variational
-Quantum Eigensolver.
-We are simulating a 2-qubit Hamiltonian.
+This function creates the fixed 2-qubit Hamiltonian the pipeline was 
+first run with. It is the same for every MOF and is kept to reproduce
+the earlier results (--hamiltonian fixed).
 """
-def get_hamiltonian_from_cif(cif_file):
+def fixed_hamiltonian():
     # Coefficients of the Hamiltonian terms
     # Arbitrary values are set before we run our simulations
     coeffs = [0.5, -0.2, 0.3]
@@ -24,129 +39,674 @@ def get_hamiltonian_from_cif(cif_file):
     H = pl.Hamiltonian(coeffs, ops)
     return H
 
+"""
+This function turns site model coefficients (see hamiltonian_builder.py)
+into a PennyLane Hamiltonian: an X and a Z field on every qubit and a
+ZZ coupling for every pair of qubits. Terms with a zero coefficient 
+are left out.
+"""
+def hamiltonian_from_coefficients(x, z, zz):
+    coeffs = []
+    ops = []
+    num_qubits = len(x)
+    for i in range(num_qubits):
+        if x[i] != 0:
+            coeffs.append(float(x[i]))
+            ops.append(pl.PauliX(i))  # Pauli-X on qubit i
+        if z[i] != 0:
+            coeffs.append(float(z[i]))
+            ops.append(pl.PauliZ(i))  # Pauli-Z on qubit i
+    for i in range(num_qubits):
+        for j in range(i + 1, num_qubits):
+            if zz[i, j] != 0:
+                coeffs.append(float(zz[i, j]))
+                ops.append(pl.PauliZ(i) @ pl.PauliZ(j))  # Tensor product on qubits i and j
+    return pl.Hamiltonian(coeffs, ops)
+
+"""
+This function creates the Hamiltonian for simulating the Variational
+Quantum Eigensolver from the structure in a CIF file. Each qubit is a
+slab of the unit cell and the coefficients come from the bonds and 
+partial charges of the atoms (see hamiltonian_builder.py). If a 
+StructureStore is given and holds the MOF as the CIF file is now 
+(same modification time and size), the structure is read from the 
+store instead of parsing the CIF file. Returns the Hamiltonian 
+and the seconds spent loading the structure and building the 
+Hamiltonian.
+"""
+def get_hamiltonian_from_cif(cif_file, num_qubits=2, store=None):
+    start = time.perf_counter()
+    mof_name = os.path.basename(cif_file).replace(".cif", "")
+    with telemetry.span("cif.load"):
+        if store is not None and store.is_current(mof_name, cif_file):
+            structure = store.structure(mof_name)
+        else:
+            structure = expand_symmetry(parse_cif(cif_file))
+    loaded = time.perf_counter()
+
+    with telemetry.span("hamiltonian.build"):
+        H = hamiltonian_from_coefficients(*structure_coefficients(structure, num_qubits))
+    timings = {"load_seconds": loaded - start, "hamiltonian_seconds": time.perf_counter() - loaded}
+    return H, timings
+
 """
 This function creates the answatz for the algorithm.We have to 
 define the ansatz for the problem. An Ansatz is an educated guess 
 we make and the algorithm optimizes our ansatz to calculate the 
-ground state energy.
+ground state energy. Even wires get RX rotations and odd wires get RY
+rotations, with a chain of CNOTs in between, so it takes 
+2 * len(wires) parameters. For 2 qubits this is RX, RY, CNOT, RX, RY.
 """
 def ansatz(params, wires):
+    num_qubits = len(wires)
+
     # First layer of single-qubit rotations
-    pl.RX(params[0], wires=wires[0])
-    pl.RY(params[1], wires=wires[1])
+    for i in range(num_qubits):
+        rotation = pl.RX if i % 2 == 0 else pl.RY
+        rotation(params[i], wires=wires[i])
     
     # Apply entanglement between qubits
-    pl.CNOT(wires=[wires[0], wires[1]])
+    for i in range(num_qubits - 1):
+        pl.CNOT(wires=[wires[i], wires[i + 1]])
     
     # Second layer of single-qubit rotations
-    pl.RX(params[2], wires=wires[0])
-    pl.RY(params[3], wires=wires[1])
+    for i in range(num_qubits):
+        rotation = pl.RX if i % 2 == 0 else pl.RY
+        rotation(params[num_qubits + i], wires=wires[i])
 
 
 """
-This function runs the Variational Quantum Eigensolver. We need a 
-Hamiltonian to minimize the ground state energy. We are running a 
-2-qubit system. We will be running this 100 times and optimizing after
-every run.
+This function builds the quantum circuit as a QNode. The device and 
+the QNode are created once and the Hamiltonian is passed in on every 
+call, so the same QNode can be reused for every MOF in a sweep.
+diff_method picks how gradients are computed: "parameter-shift" runs
+two extra circuits per parameter, while "adjoint" and "backprop" get
+the whole gradient from about one simulation.
 """
-def run_vqe(H, num_qubits=2, max_iterations=100):
-    # Use a PennyLane simulator backend with 2 qubits
+def build_cost_fn(num_qubits=2, diff_method="best"):
+    # Use a PennyLane simulator backend with num_qubits qubits
     dev = pl.device("default.qubit", wires=num_qubits)
 
     # Define the quantum circuit as a QNode
-    @pl.qnode(dev)
-    def cost_fn(params): ##Define a cost function
-        ansatz(params, wires=range(num_qubits))  # Build ansatz circuit
+    @pl.qnode(dev, diff_method=diff_method)
+    def cost_fn(params, H): ##Define a cost function
+        ansatz(params, wires=list(range(num_qubits)))  # Build ansatz circuit
         return pl.expval(H)  # Measure expectation value of the Hamiltonian
 
+    return cost_fn
+
+
+"""
+This function does one optimization step with a backtracking line 
+search. It starts from the current step size and halves it until the 
+energy drops enough (the Armijo condition), then lets the next step 
+try a slightly larger step again. If no step size is accepted the 
+parameters are left as they were and the shrunken step size is kept.
+"""
+def _line_search_step(objective, params, energy, grad, stepsize, shrink=0.5, grow=1.5, max_halvings=10):
+    grad_sq = np.sum(grad ** 2)
+    for _ in range(max_halvings):
+        new_params = params - stepsize * grad
+        if objective(new_params) <= energy - 1e-4 * stepsize * grad_sq:
+            return np.array(new_params, requires_grad=True), stepsize * grow
+        stepsize *= shrink
+
+    return params, stepsize  # No step lowered the energy enough
+
+"""
+This function runs the Variational Quantum Eigensolver. We need a 
+Hamiltonian to minimize the ground state energy. We are running a 
+system of num_qubits qubits (2 by default). We will be running this 
+up to 100 times and optimizing after every run. A prebuilt cost 
+function from build_cost_fn can be passed in to skip creating a new 
+device and QNode.
+
+The optimizer can be plain gradient descent ("gd"), "adam" or 
+"line-search". The loop stops early once the gradient norm falls 
+below grad_tol, or once the energy has changed by less than 
+energy_tol for `patience` iterations in a row. Both checks are off 
+when their tolerance is None. The reason the loop stopped is 
+returned as "max_iterations", "gradient_tolerance" or 
+"energy_tolerance".
+
+Along with the energy, parameters and energy history, run_vqe returns
+an info dictionary with the stop reason, the number of iterations, 
+the number of circuit executions and the wall time in seconds.
+
+With backend="numpy" the energies and gradients come from the NumPy 
+statevector simulator in statevector.py instead of a PennyLane QNode.
+initial_params replaces the random starting point, e.g. to warm start
+from the optimum of a similar MOF.
+"""
+def run_vqe(H, num_qubits=2, max_iterations=100, cost_fn=None, verbose=True,
+            optimizer="gd", stepsize=0.1, energy_tol=None, grad_tol=None, patience=1,
+            backend="pennylane", diff_method="best", initial_params=None):
+    start_time = time.perf_counter()
+
+    if backend == "numpy":
+        sim = StatevectorSimulator(H, num_qubits)
+        objective = sim.energy
+        value_and_grad = sim.energy_and_grad
+    elif backend == "pennylane":
+        # Build the device and QNode if the caller did not provide one
+        if cost_fn is None:
+            cost_fn = build_cost_fn(num_qubits, diff_method)
+
+        def objective(p):
+            return cost_fn(p, H)
+
+        def value_and_grad(p):
+            grad_fn = pl.grad(objective)
+            grad = grad_fn(p)
+            return grad_fn.forward, grad  # The energy comes for free with the gradient
+    else:
+        raise ValueError(f"Unknown backend '{backend}'")
+
     # Random initial parameters with gradient tracking enabled
-    params = np.random.random(4, requires_grad=True)
+    if initial_params is None:
+        params = np.random.random(2 * num_qubits, requires_grad=True)
+    else:
+        params = np.array(initial_params, dtype=float, requires_grad=True)
     
     # Choose optimizer
-    optimizer = pl.GradientDescentOptimizer(stepsize=0.1)
+    if optimizer == "gd":
+        opt = pl.GradientDescentOptimizer(stepsize=stepsize)
+    elif optimizer == "adam":
+        opt = pl.AdamOptimizer(stepsize=stepsize)
+    elif optimizer == "line-search":
+        opt = None  # Steps are taken by _line_search_step
+    else:
+        raise ValueError(f"Unknown optimizer '{optimizer}'")
 
     # Track energy vs iteration
     energy_history = []
+    stop_reason = "max_iterations"
+    calm_iterations = 0  # Iterations in a row with an energy change below energy_tol
+
+    # Count circuit executions on the PennyLane device (the NumPy backend counts its own)
+    tracker = pl.Tracker(cost_fn.device) if backend == "pennylane" else contextlib.nullcontext()
+    with tracker:
+        # Optimization loop
+        for i in range(max_iterations):
+            with telemetry.span("vqe.step"):
+                # Same as step_and_cost, but keeps the gradient for the convergence check
+                energy, grad = value_and_grad(params)
+                if opt is None:
+                    params, stepsize = _line_search_step(objective, params, energy, grad, stepsize)
+                else:
+                    params = opt.apply_grad((grad,), (params,))[0]
 
-    # Optimization loop
-    for i in range(max_iterations):
-        params, energy = optimizer.step_and_cost(cost_fn, params)
-        # Save iteration and energy as a tuple
-        energy_history.append((i, float(energy)))
+            # Save iteration and energy as a tuple
+            energy_history.append((i, float(energy)))
         
-        if i % 10 == 0:
-            print(f"Iteration {i}: Energy = {energy}")  # Log progress
+            if verbose and i % 10 == 0:
+                print(f"Iteration {i}: Energy = {energy}")  # Log progress
+
+            # Convergence checks
+            if grad_tol is not None and float(np.linalg.norm(grad)) < grad_tol:
+                stop_reason = "gradient_tolerance"
+                break
+            if energy_tol is not None and i > 0:
+                if abs(energy_history[-1][1] - energy_history[-2][1]) < energy_tol:
+                    calm_iterations += 1
+                else:
+                    calm_iterations = 0
+                if calm_iterations >= patience:
+                    stop_reason = "energy_tolerance"
+                    break
+
+    if backend == "pennylane":
+        executions = int(tracker.totals.get("executions", 0))
+    else:
+        executions = sim.executions
+    telemetry.count("vqe.executions", executions)
+    telemetry.count("vqe.iterations", len(energy_history))
+
+    info = {
+        "stop_reason": stop_reason,
+        "iterations": len(energy_history),
+        "executions": executions,
+        "seconds": time.perf_counter() - start_time,
+    }
+    if verbose:
+        print(f"Stopped after {info['iterations']} iterations ({stop_reason}), "
+              f"{executions} circuit executions in {info['seconds']:.2f}s")
 
     final_energy = energy_history[-1][1]
-    return final_energy, params, energy_history
+    return final_energy, params, energy_history, info
+
+# The QNode, cache and warm start index owned by this worker process, built once by _init_worker
+_worker_cost_fn = None
+_worker_cache = None
+_worker_warm_start = None
+_worker_store = None
+_worker_hamiltonian = "structure"
+_worker_telemetry = False
 
 """
-This function saves the energy vs iteration data for all MOFs to a CSV file
+This function runs once in every worker process of the batch pool. 
+It builds the device and QNode that the worker reuses for all of its 
+MOFs and opens the Hamiltonian cache and warm start index if they 
+are used. With record_telemetry=True the worker records spans and 
+counters and sends them back with every result.
 """
-def save_energy_iterations_to_csv(energy_data_dict, output_file="energy_vs_iterations_tuple.csv"):
-    # Create a list to hold all data rows
-    all_data = []
-    
-    # For each MOF, add its energy history to the data
-    for mof_name, energy_history in energy_data_dict.items():
-        for iteration, energy in energy_history:
-            all_data.append({
-                "MOF": mof_name,
-                "(x,y)": (iteration,energy)
-            })
-    
-    # Create DataFrame and save to CSV
-    df = pd.DataFrame(all_data)
-    df.to_csv(output_file, index=False)
-    print(f"Energy vs iteration data saved to '{output_file}'")
+def _init_worker(num_qubits=2, diff_method="best", cache_path=None,
+                 warm_start=None, warm_start_path="warm_start.sqlite",
+                 hamiltonian="structure", store_path=None, record_telemetry=False):
+    global _worker_cost_fn, _worker_cache, _worker_warm_start, _worker_store, _worker_hamiltonian
+    global _worker_telemetry
+    # Reseed so forked workers do not all start from the same parameters
+    np.random.seed()
+    _worker_cost_fn = build_cost_fn(num_qubits, diff_method)
+    _worker_cache = HamiltonianCache(cache_path) if cache_path else None
+    _worker_warm_start = WarmStartIndex(warm_start_path, warm_start) if warm_start else None
+    _worker_store = StructureStore(store_path) if store_path else None
+    _worker_hamiltonian = hamiltonian
+    _worker_telemetry = record_telemetry
+    if record_telemetry:
+        telemetry.enable()  # Spawned workers do not inherit the parent's setting
+
+# Options that change how the answer is computed but not the answer itself
+_CACHE_NEUTRAL_OPTIONS = {"backend", "diff_method"}
+
+"""
+This function solves a single MOF inside a worker process and returns
+plain Python values so the result is cheap to send back to the parent.
+If the same Hamiltonian (with the same solver settings) was solved 
+before, the cached answer is returned without running the simulator.
+Otherwise VQE starts from the parameters of the most similar solved 
+MOF when warm starting is on.
+"""
+def _solve_mof(cif_path, **vqe_options):
+    mof_name = os.path.basename(cif_path)
+
+    # Build the Hamiltonian from the structure
+    if _worker_hamiltonian == "fixed":
+        H, timings = fixed_hamiltonian(), {"load_seconds": 0.0, "hamiltonian_seconds": 0.0}
+    else:
+        H, timings = get_hamiltonian_from_cif(cif_path, vqe_options.get("num_qubits", 2), _worker_store)
+
+    fingerprint = None
+    cached = None
+    if _worker_cache is not None:
+        solver_key = sorted((k, v) for k, v in vqe_options.items() if k not in _CACHE_NEUTRAL_OPTIONS)
+        fingerprint = hamiltonian_fingerprint(H, solver_key=solver_key)
+        cached = _worker_cache.get(fingerprint)
+
+    initial_params = None
+    if cached is not None:
+        energy, params, energy_history = cached
+        info = {"stop_reason": "cached", "executions": 0, "seconds": 0.0}
+    else:
+        if _worker_warm_start is not None:
+            initial_params = _worker_warm_start.nearest(mof_name, H)
+            if initial_params is not None and len(initial_params) != 2 * vqe_options.get("num_qubits", 2):
+                initial_params = None  # Solved with a different number of qubits
+
+        # Run VQE with the QNode this worker built at startup
+        with telemetry.span("vqe.solve"):
+            energy, params, energy_history, info = run_vqe(
+                H, cost_fn=_worker_cost_fn, verbose=False, initial_params=initial_params, **vqe_options
+            )
+        params = [float(p) for p in params]
+        if _worker_cache is not None:
+            _worker_cache.put(fingerprint, energy, params, energy_history)
+        if _worker_warm_start is not None:
+            _worker_warm_start.add(mof_name, H, params)
+
+    telemetry.count("hamiltonian_cache.hits" if cached is not None else "hamiltonian_cache.misses")
+
+    return {
+        "file": mof_name,
+        "energy": energy,
+        "params": params,
+        "energy_history": energy_history,
+        "iterations": len(energy_history),
+        "stop_reason": info["stop_reason"],
+        "executions": info["executions"],
+        "seconds": info["seconds"],
+        "load_seconds": timings["load_seconds"],
+        "hamiltonian_seconds": timings["hamiltonian_seconds"],
+        "cache_hit": cached is not None,
+        "warm_started": initial_params is not None,
+        # What this MOF added to the worker's spans and counters, merged by the parent
+        "telemetry": telemetry.snapshot(reset=True) if _worker_telemetry else None,
+    }
+
+"""
+This function runs VQE over many CIF files using a pool of worker 
+processes. A result dictionary is yielded for every MOF in the order 
+the MOFs finish, not the order they were submitted. With a single 
+worker everything runs in the current process. warm_start is None,
+"coeffs" or "family" (see warm_start.py). hamiltonian is "structure"
+for Hamiltonians built from the CIF files (read from the structure 
+store at store_path when given) or "fixed" for the original fixed 
+Hamiltonian. When telemetry is enabled the spans and counters of the
+workers are merged into this process as their results arrive. Extra 
+keyword arguments are passed on to run_vqe.
+"""
+def run_batch(cif_paths, workers=None, chunksize=1, cache_path=None,
+              warm_start=None, warm_start_path="warm_start.sqlite",
+              hamiltonian="structure", store_path=None, **vqe_options):
+    solve = functools.partial(_solve_mof, **vqe_options)
+    workers = workers or os.cpu_count() or 1
+    init = functools.partial(
+        _init_worker,
+        num_qubits=vqe_options.get("num_qubits", 2),
+        diff_method=vqe_options.get("diff_method", "best"),
+        cache_path=cache_path,
+        warm_start=warm_start,
+        warm_start_path=warm_start_path,
+        hamiltonian=hamiltonian,
+        store_path=store_path,
+        record_telemetry=telemetry.enabled(),
+    )
+
+    if workers == 1:
+        init()
+        for cif_path in cif_paths:
+            result = solve(cif_path)
+            telemetry.merge(result["telemetry"])
+            yield result
+        return
+
+    # Each worker builds its device and QNode once in the initializer
+    with mp.Pool(workers, initializer=init) as pool:
+        for result in pool.imap_unordered(solve, cif_paths, chunksize=chunksize):
+            telemetry.merge(result["telemetry"])
+            yield result
+
+"""
+This class writes the results of a sweep as they arrive. Every MOF 
+appends one row to the ground state energy CSV and its energy history
+to the energy vs iteration CSV, then a line to a checkpoint manifest 
+recording the MOF and how far both CSV files had been written. 
+Nothing is kept in memory except the names of the finished MOFs.
+
+With resume=True the manifest of an earlier sweep is read back, both 
+CSV files are cut back to the sizes recorded for the last finished 
+MOF (dropping anything a crash left half written) and new results are 
+appended after them. A CSV file that no longer exists is started 
+again with its header. Resuming a sweep that was run with different 
+settings raises ValueError unless allow_settings_change=True, in 
+which case the new settings are added to the manifest.
+"""
+class SweepWriter:
+    def __init__(self, output="ground_state_energies.csv",
+                 iterations_output="energy_vs_iterations_tuple.csv",
+                 checkpoint="sweep_checkpoint.jsonl", settings=None, resume=False,
+                 allow_settings_change=False):
+        self.completed = set()  # Names of the MOFs already written
+        self.output = output
+        self.iterations_output = iterations_output
+
+        resume = resume and os.path.exists(checkpoint)
+        missing = set()  # Output files named in the manifest that are gone
+        if resume:
+            offsets = None
+            previous_settings = None
+            with open(checkpoint) as f:
+                for line in f:
+                    entry = json.loads(line)
+                    if "settings" in entry:
+                        previous_settings = entry["settings"]
+                        continue
+                    self.completed.add(entry["mof"])
+                    offsets = entry["offsets"]
+            settings_changed = settings is not None and previous_settings != settings
+            if settings_changed and not allow_settings_change:
+                raise ValueError(f"The sweep in '{checkpoint}' was run with different settings: "
+                                 f"{previous_settings}")
+            if offsets is None:
+                resume = False  # Nothing finished yet, start over
+            else:
+                for path, size in zip((output, iterations_output), offsets):
+                    if not os.path.exists(path):
+                        missing.add(path)
+                        print(f"Warning: '{path}' is missing; starting it again without the "
+                              f"{len(self.completed)} MOFs finished earlier")
+                        continue
+                    with open(path, "r+b") as f:
+                        f.truncate(size)
+
+        if not resume:
+            self.completed = set()
+
+        def open_csv(path, header):
+            fresh = not resume or path in missing
+            f = open(path, "w" if fresh else "a", newline="")
+            writer = csv.writer(f, lineterminator="\n")
+            if fresh:
+                writer.writerow(header)
+            return f, writer
+
+        self.energies_file, self.energies = open_csv(output, ["MOF", "Ground_State_Energy"])
+        self.iterations_file, self.iterations = open_csv(iterations_output, ["MOF", "(x,y)"])
+        if resume:
+            self.checkpoint_file = open(checkpoint, "a")
+            if settings_changed:
+                self.checkpoint_file.write(json.dumps({"settings": settings}) + "\n")
+        else:
+            self.checkpoint_file = open(checkpoint, "w")
+            self.checkpoint_file.write(json.dumps({"settings": settings}) + "\n")
+        self._flush()
+
+    def _flush(self):
+        self.energies_file.flush()
+        self.iterations_file.flush()
+        self.checkpoint_file.flush()
+
+    def write(self, file, ground_state_energy, energy_history):
+        """Append one finished MOF to both CSV files and the manifest"""
+        with telemetry.span("csv.write"):
+            self.energies.writerow([file, ground_state_energy])
+            mof_name = file.replace(".cif", "")
+            self.iterations.writerows([mof_name, (iteration, energy)] for iteration, energy in energy_history)
+
+            # Both CSV files must be on disk before the manifest says the MOF is done
+            self.energies_file.flush()
+            self.iterations_file.flush()
+            offsets = [self.energies_file.tell(), self.iterations_file.tell()]
+            self.checkpoint_file.write(json.dumps({"mof": file, "offsets": offsets}) + "\n")
+            self.checkpoint_file.flush()
+            self.completed.add(file)
+
+    def close(self):
+        self.energies_file.close()
+        self.iterations_file.close()
+        self.checkpoint_file.close()
+
+"""
+This function reads the command line options for a sweep.
+"""
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Run VQE over a directory of MOF CIF files.")
+    parser.add_argument("--cif-dir", default="generated mofs",
+                        help="directory containing the .cif files to process")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(),
+                        help="number of worker processes (1 runs everything in this process)")
+    parser.add_argument("--chunksize", type=int, default=1,
+                        help="number of MOFs handed to a worker at a time")
+    parser.add_argument("--num-qubits", type=int, default=2,
+                        help="number of qubits (slabs of the unit cell) in the structure Hamiltonian")
+    parser.add_argument("--hamiltonian", choices=["structure", "fixed"], default="structure",
+                        help="build each Hamiltonian from its CIF structure, or use the original fixed 2-qubit one")
+    parser.add_argument("--structure-store", default=None,
+                        help="read structures from this structure store (see structure_store.py) "
+                             "instead of parsing every CIF file")
+    parser.add_argument("--max-iterations", type=int, default=100,
+                        help="maximum optimizer steps per MOF")
+    parser.add_argument("--optimizer", choices=["gd", "adam", "line-search"], default="gd",
+                        help="gradient descent, Adam, or gradient descent with a backtracking line search")
+    parser.add_argument("--stepsize", type=float, default=0.1,
+                        help="optimizer step size (initial step size for line-search)")
+    parser.add_argument("--energy-tol", type=float, default=1e-6,
+                        help="stop once the energy changes by less than this for --patience iterations")
+    parser.add_argument("--grad-tol", type=float, default=None,
+                        help="stop once the gradient norm falls below this")
+    parser.add_argument("--patience", type=int, default=5,
+                        help="iterations in a row below --energy-tol before stopping")
+    parser.add_argument("--backend", choices=["pennylane", "numpy"], default="pennylane",
+                        help="simulate with a PennyLane QNode or the built-in NumPy statevector simulator")
+    parser.add_argument("--diff-method", choices=["best", "adjoint", "backprop", "parameter-shift"],
+                        default="best", help="how the PennyLane backend computes gradients")
+    parser.add_argument("--cache", default="hamiltonian_cache.sqlite",
+                        help="file that stores solved Hamiltonians between runs")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="always run VQE, even for Hamiltonians solved before")
+    parser.add_argument("--warm-start", choices=["none", "coeffs", "family"], default="none",
+                        help="start each MOF from the optimum of the nearest solved MOF, by "
+                             "Hamiltonian coefficients or by CIF name family")
+    parser.add_argument("--warm-start-db", default="warm_start.sqlite",
+                        help="file that stores the optima used for warm starts")
+    parser.add_argument("--output", default="ground_state_energies.csv",
+                        help="CSV file for the ground state energies")
+    parser.add_argument("--iterations-output", default="energy_vs_iterations_tuple.csv",
+                        help="CSV file for the energy vs iteration data")
+    parser.add_argument("--checkpoint", default="sweep_checkpoint.jsonl",
+                        help="manifest of finished MOFs used by --resume")
+    parser.add_argument("--resume", action="store_true",
+                        help="skip MOFs finished by an earlier sweep and append to its output files")
+    parser.add_argument("--allow-settings-change", action="store_true",
+                        help="with --resume, continue a sweep even though it was run with different settings")
+    parser.add_argument("--metrics", default=None,
+                        help="record per-stage spans and counters and write them to this file "
+                             "(Prometheus text for a .prom file, JSON lines otherwise)")
+    parser.add_argument("--profile", nargs="+", default=None, metavar="SPAN",
+                        help="run these spans (e.g. vqe.step) under cProfile; use with --workers 1")
+    parser.add_argument("--profile-output", default="vqe.prof",
+                        help="file for the --profile statistics (read with pstats or snakeviz)")
+    return parser.parse_args(argv)
 
 """
 This is the main function of the program. This executes 
 the program.
 """
-def main():
+def main(argv=None):
     """
     Main function that:
         - Reads all CIF files from a directory.
         - Builds Hamiltonians for each MOF.
-        - Runs VQE for each MOF to get ground state energy.
-        - Stores results in a CSV file.
-        - Tracks and saves energy vs iteration data for plotting.
+        - Runs VQE for each MOF to get ground state energy, spread 
+          across a pool of worker processes. Hamiltonians that were 
+          solved before are read from the cache instead.
+        - Appends each result and its energy vs iteration data to 
+          CSV files as soon as it finishes, and records it in a 
+          checkpoint manifest so an interrupted sweep can resume.
     """
+    args = parse_args(argv)
+    if args.hamiltonian == "fixed" and args.num_qubits != 2:
+        raise SystemExit("The fixed Hamiltonian only has 2 qubits")
+    sweep_start = time.perf_counter()
+    if args.metrics or args.profile:
+        telemetry.enable(profile=args.profile)
+
+    # Settings that decide the results; a resumed sweep should match them
+    settings = {
+        key: value for key, value in vars(args).items()
+        if key not in ("workers", "chunksize", "resume", "allow_settings_change",
+                       "metrics", "profile", "profile_output")
+    }
+    try:
+        writer = SweepWriter(args.output, args.iterations_output, args.checkpoint, settings=settings,
+                             resume=args.resume, allow_settings_change=args.allow_settings_change)
+    except ValueError as e:
+        raise SystemExit(f"{e}\nRun without --resume to start over, or pass --allow-settings-change")
+
     # Directory where CIF files are located
-    cif_directory = "generated mofs"
+    cif_directory = args.cif_dir
+    cif_paths = [
+        os.path.join(cif_directory, file)
+        for file in sorted(os.listdir(cif_directory))
+        if file.endswith(".cif")  # Only process .cif files
+        and file not in writer.completed  # Skip MOFs an earlier sweep finished
+    ]
+    if writer.completed:
+        print(f"Resuming: {len(writer.completed)} MOFs already done")
+    print(f"Processing {len(cif_paths)} MOFs with {args.workers} workers...")
     
-    results = []  # Will store MOF name and energy
-    energy_data = {}  # Will store energy vs iteration data for each MOF
-
-    # Iterate through all files in the directory
-    for file in os.listdir(cif_directory):
-        if file.endswith(".cif"):  # Only process .cif files
-            cif_path = os.path.join(cif_directory, file)
-            print(f"Processing {file}...")
-            
-            # Simulate building the Hamiltonian
-            H = get_hamiltonian_from_cif(cif_path)
-            
-            # Run VQE to get the lowest energy and energy history
-            energy, params, energy_history = run_vqe(H)
-            
-            # Store energy history for this MOF
-            mof_name = file.replace(".cif", "")
-            energy_data[mof_name] = energy_history
-            
-            print(f"Finished {file} with minimum energy: {energy:.4f}\n")
+    cache_hits = 0  # MOFs answered from the Hamiltonian cache
+    cache_misses = 0  # MOFs that ran VQE
+    total_iterations = 0  # Optimizer steps actually run
+    total_executions = 0  # Circuit executions actually run
+    total_seconds = 0.0  # Time spent inside VQE, summed over workers
+    stage_seconds = {"load": 0.0, "hamiltonian": 0.0, "vqe": 0.0, "write": 0.0}  # Summed over all MOFs
+    iterations_by_start = {"warm": [0, 0], "cold": [0, 0]}  # [MOFs, iterations] per kind of start
+    stop_reasons = {}  # How many MOFs stopped for each reason
+
+    # Append every MOF as it finishes
+    try:
+        for result in run_batch(
+            cif_paths,
+            workers=args.workers,
+            chunksize=args.chunksize,
+            cache_path=None if args.no_cache else args.cache,
+            warm_start=None if args.warm_start == "none" else args.warm_start,
+            warm_start_path=args.warm_start_db,
+            hamiltonian=args.hamiltonian,
+            store_path=args.structure_store,
+            num_qubits=args.num_qubits,
+            max_iterations=args.max_iterations,
+            optimizer=args.optimizer,
+            stepsize=args.stepsize,
+            energy_tol=args.energy_tol,
+            grad_tol=args.grad_tol,
+            patience=args.patience,
+            backend=args.backend,
+            diff_method=args.diff_method,
+        ):
+            file = result["file"]
+            energy = result["energy"]
+            energy_history = result["energy_history"]
+            stage_seconds["load"] += result["load_seconds"]
+            stage_seconds["hamiltonian"] += result["hamiltonian_seconds"]
+            stage_seconds["vqe"] += result["seconds"]
+            stop_reasons[result["stop_reason"]] = stop_reasons.get(result["stop_reason"], 0) + 1
+            if result["cache_hit"]:
+                cache_hits += 1
+            else:
+                cache_misses += 1
+                total_iterations += result["iterations"]
+                total_executions += result["executions"]
+                total_seconds += result["seconds"]
+                start = iterations_by_start["warm" if result["warm_started"] else "cold"]
+                start[0] += 1
+                start[1] += result["iterations"]
+
+            print(f"Finished {file} with minimum energy: {energy:.4f} "
+                  f"after {result['iterations']} iterations ({result['stop_reason']}), "
+                  f"{result['executions']} circuit executions in {result['seconds']:.2f}s")
             
-            # Store result for this MOF
-            results.append({"MOF": file, "Ground_State_Energy": energy})
-    
-    # Save all final energies to a CSV file
-    df = pd.DataFrame(results)
-    df.to_csv("ground_state_energies.csv", index=False)
-    print("All results saved to 'ground_state_energies.csv'.")
-    
-    # Save energy vs iteration data for all MOFs
-    save_energy_iterations_to_csv(energy_data)
+            # Store result and energy history for this MOF
+            write_start = time.perf_counter()
+            writer.write(file, energy, energy_history)
+            stage_seconds["write"] += time.perf_counter() - write_start
+    finally:
+        writer.close()
+
+    print(f"All results saved to '{args.output}'.")
+    print(f"Energy vs iteration data saved to '{args.iterations_output}'")
+    if cache_misses:
+        print(f"Average iterations per solved MOF: {total_iterations / cache_misses:.1f} "
+              f"(max {args.max_iterations}); stop reasons: {stop_reasons}")
+        print(f"Circuit executions per solved MOF ({args.backend}, {args.diff_method}): "
+              f"{total_executions / cache_misses:.1f}, VQE time per MOF: "
+              f"{total_seconds / cache_misses:.3f}s")
+    (warm_mofs, warm_iterations), (cold_mofs, cold_iterations) = (
+        iterations_by_start["warm"], iterations_by_start["cold"]
+    )
+    if warm_mofs and cold_mofs:
+        warm_average = warm_iterations / warm_mofs
+        cold_average = cold_iterations / cold_mofs
+        print(f"Warm start: {warm_mofs} MOFs averaged {warm_average:.1f} iterations vs "
+              f"{cold_average:.1f} for {cold_mofs} cold starts "
+              f"({100 * (1 - warm_average / cold_average):.0f}% fewer)")
+    print(f"Sweep took {time.perf_counter() - sweep_start:.2f}s; time per stage summed over workers: "
+          + ", ".join(f"{stage} {seconds:.2f}s" for stage, seconds in stage_seconds.items()))
+    if not args.no_cache:
+        print(f"Hamiltonian cache: {cache_hits} hits, {cache_misses} misses "
+              f"({cache_hits} VQE runs saved)")
+    telemetry.finish(args.metrics, args.profile_output, labels={"pipeline": "vqe"})
 
 # Run the script if it's executed directly (not imported)
 if __name__ == "__main__":
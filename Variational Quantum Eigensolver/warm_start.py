@@ -0,0 +1,106 @@
+import json  # For storing coefficient vectors and parameters as text
+import os  # For turning paths into MOF names
+import re  # For stripping the symmetry variant from MOF names
+import sqlite3  # For an index shared by worker processes and kept between runs
+import numpy as np  # Plain NumPy for the nearest-neighbour search
+from hamiltonian_cache import hamiltonian_terms  # Canonical Pauli terms of a Hamiltonian
+
+"""
+This function returns the family of a MOF from its CIF name. MOFs in
+the database are named after their metal, organic linkers and
+topology followed by a symmetry variant, e.g. str_m2_o1_o1_pcu_sym.13,
+and every variant of the same structure shares a family
+(str_m2_o1_o1_pcu). Generated MOFs such as gen-mof-7 share gen-mof.
+"""
+def mof_family(mof_name):
+    name = os.path.basename(mof_name)
+    if name.endswith(".cif"):
+        name = name[:-len(".cif")]
+    return re.sub(r"([_.-]sym)?[_.-]?\d+$", "", name)
+
+
+"""
+This class remembers the optimal parameters of every MOF solved so
+far so new MOFs can start from the parameters of the most similar
+solved one instead of random values. Similarity is either the
+distance between Hamiltonian coefficient vectors ("coeffs", for
+Hamiltonians with the same Pauli terms) or the MOF family ("family").
+"coeffs" falls back to the family when no Hamiltonian with the same
+terms has been solved yet.
+
+The index is a SQLite file so every worker process of a sweep sees
+the MOFs the others have finished. Each process keeps an in-memory
+copy and only reads the rows that were added since its last lookup.
+"""
+class WarmStartIndex:
+    def __init__(self, path="warm_start.sqlite", mode="coeffs"):
+        if mode not in ("coeffs", "family"):
+            raise ValueError(f"Unknown warm start mode '{mode}'")
+        self.path = path
+        self.mode = mode
+
+        self.conn = sqlite3.connect(path, timeout=60)
+        self.conn.execute("PRAGMA journal_mode=WAL")  # Readers do not block the writer
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS solved ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " mof TEXT NOT NULL,"
+            " family TEXT NOT NULL,"
+            " terms TEXT NOT NULL,"
+            " coeffs TEXT NOT NULL,"
+            " params TEXT NOT NULL)"
+        )
+        self.conn.commit()
+
+        self._last_id = 0  # Highest row already copied into memory
+        self._by_terms = {}  # Pauli terms -> ([coefficient vectors], [params])
+        self._stacked = {}  # Pauli terms -> coefficient vectors as one array
+        self._by_family = {}  # Family -> params of the latest solved member
+
+    def _refresh(self):
+        rows = self.conn.execute(
+            "SELECT id, family, terms, coeffs, params FROM solved WHERE id > ? ORDER BY id",
+            (self._last_id,),
+        ).fetchall()
+        for row_id, family, terms, coeffs, params in rows:
+            params = json.loads(params)
+            vectors, solutions = self._by_terms.setdefault(terms, ([], []))
+            vectors.append(json.loads(coeffs))
+            solutions.append(params)
+            self._stacked.pop(terms, None)
+            self._by_family[family] = params
+            self._last_id = row_id
+
+    def nearest(self, mof_name, H):
+        """Return the parameters of the most similar solved MOF, or None"""
+        self._refresh()
+
+        if self.mode == "coeffs":
+            terms = hamiltonian_terms(H)
+            key = json.dumps([word for word, _ in terms])
+            if key in self._by_terms:
+                if key not in self._stacked:
+                    self._stacked[key] = np.array(self._by_terms[key][0])
+                coeffs = np.array([coeff for _, coeff in terms])
+                distances = np.linalg.norm(self._stacked[key] - coeffs, axis=1)
+                return self._by_terms[key][1][int(np.argmin(distances))]
+
+        return self._by_family.get(mof_family(mof_name))
+
+    def add(self, mof_name, H, params):
+        """Record the optimal parameters of a solved MOF"""
+        terms = hamiltonian_terms(H)
+        self.conn.execute(
+            "INSERT INTO solved (mof, family, terms, coeffs, params) VALUES (?, ?, ?, ?, ?)",
+            (
+                mof_name,
+                mof_family(mof_name),
+                json.dumps([word for word, _ in terms]),
+                json.dumps([coeff for _, coeff in terms]),
+                json.dumps([float(p) for p in params]),
+            ),
+        )
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,277 @@
+"""
+Benchmarks for the hot paths of both pipelines on synthetic data, so
+they run offline and at any size. Every benchmark runs in a fresh
+process, which makes its peak memory (max RSS) its own. Results are
+written as JSON and compared with a stored baseline; any metric that is
+worse than the baseline by more than the tolerance is a regression and
+makes the run exit with status 1, as does a missing baseline unless
+--save-baseline records one.
+
+Metric names say which way is better: *_per_second is higher-is-better,
+*_seconds and *_mb are lower-is-better.
+"""
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import tempfile
+import resource
+import multiprocessing as mp
+
+# The pipelines are plain scripts in their own directories; import them by module name
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for directory in ("Variational Quantum Eigensolver", "MOF Generator ML Algorithm", "benchmarks"):
+    sys.path.insert(0, os.path.join(ROOT, directory))
+
+from synthetic import write_cifs, screening_table  # noqa: E402
+
+DEFAULT_CONFIG = {
+    'cifs': 64,  # Synthetic CIF files to parse
+    'atoms': 200,  # Atoms per synthetic CIF
+    'vqe_mofs': 8,  # MOFs to run VQE on
+    'vqe_iterations': 50,  # VQE iterations per MOF
+    'num_qubits': 2,
+    'rows': 20000,  # Screening table rows
+    'epochs': 20,  # Predictor training epochs
+    'candidates': 1000000,  # Generated and ranked candidates
+    'seed': 0,
+}
+
+
+def _median_time(function, repeat):
+    """Return the median wall time of `repeat` calls and the last result"""
+    times = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        times.append(time.perf_counter() - start)
+    times.sort()
+    return times[len(times) // 2], result
+
+
+def bench_cif_parsing(config, workdir):
+    """CIF parsing and Hamiltonian coefficient building"""
+    from cif_index import parse_cif
+    from hamiltonian_builder import structure_coefficients
+
+    paths = write_cifs(os.path.join(workdir, "cifs"), config['cifs'], config['atoms'], config['seed'])
+    parse_seconds, structures = _median_time(lambda: [parse_cif(p) for p in paths], config['repeat'])
+    build_seconds, _ = _median_time(
+        lambda: [structure_coefficients(s, config['num_qubits']) for s in structures], config['repeat']
+    )
+    return {
+        'cifs_per_second': len(paths) / parse_seconds,
+        'hamiltonians_per_second': len(paths) / build_seconds,
+    }
+
+
+def bench_vqe(config, workdir):
+    """VQE iterations per second with both simulator backends"""
+    import variational_quantum_eigensolver as vqe
+
+    paths = write_cifs(os.path.join(workdir, "cifs"), config['vqe_mofs'], config['atoms'], config['seed'])
+    hamiltonians = [vqe.get_hamiltonian_from_cif(p, config['num_qubits'])[0] for p in paths]
+    cost_fn = vqe.build_cost_fn(config['num_qubits'])
+
+    metrics = {}
+    for backend in ("numpy", "pennylane"):
+        def solve_all():
+            iterations = 0
+            for H in hamiltonians:
+                _, _, _, info = vqe.run_vqe(
+                    H, num_qubits=config['num_qubits'], max_iterations=config['vqe_iterations'],
+                    cost_fn=cost_fn if backend == "pennylane" else None, verbose=False,
+                    energy_tol=None, grad_tol=None, backend=backend,
+                )
+                iterations += info['iterations']
+            return iterations
+        seconds, iterations = _median_time(solve_all, config['repeat'])
+        metrics[f'{backend}_iterations_per_second'] = iterations / seconds
+    return metrics
+
+
+def bench_training(config, workdir):
+    """Multi-task predictor training, full-batch and streamed"""
+    import numpy as np
+    import torch
+    import mof
+    from feature_cache import FeatureCache
+    from streaming import make_loader, column_stats
+
+    torch.manual_seed(config['seed'])
+    data = mof.prepare_data(screening_table(config['rows'], config['seed']))
+    X_train = torch.FloatTensor(data['X_train']).to(mof.device)
+    X_test = torch.FloatTensor(data['X_test']).to(mof.device)
+    y_train = torch.FloatTensor(data['y_train']).to(mof.device)
+    y_test = torch.FloatTensor(data['y_test']).to(mof.device)
+    rows = len(X_train) * config['epochs']
+
+    def full_batch():
+        model = mof.MultiTaskPredictor(X_train.shape[1]).to(mof.device)
+        return mof.train_multitask_model(model, X_train, y_train, X_test, y_test, epochs=config['epochs'])
+    full_seconds, _ = _median_time(full_batch, config['repeat'])
+
+    cached = FeatureCache(os.path.join(workdir, "feature_cache")).put("benchmark", data)
+    paths = cached['paths']
+    _, y_var = column_stats(paths['y_train'])
+
+    def streamed():
+        model = mof.MultiTaskPredictor(X_train.shape[1]).to(mof.device)
+        train_loader = make_loader(paths['X_train'], paths['y_train'], batch_size=256, seed=config['seed'])
+        test_loader = make_loader(paths['X_test'], paths['y_test'], batch_size=256, shuffle=False)
+        return mof.train_multitask_streaming(
+            model, train_loader, test_loader, 1.0 / np.maximum(y_var, 1e-8), epochs=config['epochs']
+        )
+    streamed_seconds, _ = _median_time(streamed, config['repeat'])
+
+    return {
+        'full_batch_rows_per_second': rows / full_seconds,
+        'streaming_rows_per_second': rows / streamed_seconds,
+    }
+
+
+def bench_generation(config, workdir):
+    """Blocked candidate generation and scoring with untrained models"""
+    import numpy as np
+    import torch
+    import mof
+    from generation import screen_candidates
+
+    torch.manual_seed(config['seed'])
+    data = mof.prepare_data(screening_table(2000, config['seed']))
+    input_dim = data['X_train'].shape[1]
+    autoencoder = mof.Autoencoder(input_dim).to(mof.device)
+    property_model = mof.MultiTaskPredictor(input_dim).to(mof.device)
+    seed_features = torch.FloatTensor(data['X_train'][:100]).to(mof.device)
+    y_train = np.asarray(data['y_train'])
+
+    seconds, _ = _median_time(lambda: screen_candidates(
+        autoencoder, property_model, seed_features, config['candidates'],
+        y_train.mean(axis=0), y_train.std(axis=0)
+    ), config['repeat'])
+    return {'candidates_per_second': config['candidates'] / seconds}
+
+
+def bench_ranking(config, workdir):
+    """Two-stage ranking and Pareto selection latency"""
+    import numpy as np
+    from ranking import rank_candidates, select_pareto
+
+    rng = np.random.default_rng(config['seed'])
+    predictions = rng.standard_normal((config['candidates'], 4)).astype(np.float32)
+    two_stage_seconds, _ = _median_time(lambda: rank_candidates(predictions), config['repeat'])
+    pareto_seconds, _ = _median_time(lambda: select_pareto(predictions), config['repeat'])
+    return {'two_stage_seconds': two_stage_seconds, 'pareto_seconds': pareto_seconds}
+
+
+BENCHMARKS = {
+    'cif_parsing': bench_cif_parsing,
+    'vqe': bench_vqe,
+    'training': bench_training,
+    'generation': bench_generation,
+    'ranking': bench_ranking,
+}
+
+
+def _peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024  # Bytes on macOS, KiB on Linux
+
+
+def _run_one(name, config):
+    """Run one benchmark in this (fresh) process and add its peak memory"""
+    with tempfile.TemporaryDirectory() as workdir:
+        metrics = BENCHMARKS[name](config, workdir)
+    metrics['peak_rss_mb'] = _peak_rss_mb()
+    return metrics
+
+
+def run(names, config):
+    """Run benchmarks, each in its own process, and return their metrics by name"""
+    results = {}
+    context = mp.get_context("spawn")
+    for name in names:
+        print(f"Running {name}...", flush=True)
+        with context.Pool(1) as pool:
+            results[name] = pool.apply(_run_one, (name, config))
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Print every metric next to its baseline and return the regressions"""
+    regressions = []
+    print(f"\n{'Benchmark':<14}{'Metric':<36}{'Value':>14}{'Baseline':>14}{'Change':>10}")
+    for name, metrics in results.items():
+        for metric, value in metrics.items():
+            base = baseline.get(name, {}).get(metric)
+            if not base:
+                print(f"{name:<14}{metric:<36}{value:>14.4g}{'-':>14}{'-':>10}")
+                continue
+            change = value / base - 1
+            worse = -change if metric.endswith('_per_second') else change
+            flag = "  REGRESSION" if worse > tolerance else ""
+            print(f"{name:<14}{metric:<36}{value:>14.4g}{base:>14.4g}{100 * change:>9.1f}%{flag}")
+            if flag:
+                regressions.append((name, metric, value, base))
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the VQE and MOF generation hot paths on synthetic data.")
+    parser.add_argument("--only", nargs="+", choices=sorted(BENCHMARKS), help="benchmarks to run (default: all)")
+    for key, value in DEFAULT_CONFIG.items():
+        parser.add_argument(f"--{key.replace('_', '-')}", type=type(value), default=value)
+    parser.add_argument("--repeat", type=int, default=3, help="runs per measurement; the median is kept")
+    parser.add_argument("--output", default=os.path.join(ROOT, "benchmarks", "results.json"),
+                        help="JSON file for the results")
+    parser.add_argument("--baseline", default=os.path.join(ROOT, "benchmarks", "baseline.json"),
+                        help="JSON file of baseline results to compare with")
+    parser.add_argument("--save-baseline", action="store_true", help="store these results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="fraction by which a metric may be worse than the baseline")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    config = {key: getattr(args, key) for key in DEFAULT_CONFIG}
+    config['repeat'] = args.repeat
+    names = args.only or list(BENCHMARKS)
+    if not args.save_baseline and not os.path.exists(args.baseline):
+        raise SystemExit(f"No baseline at '{args.baseline}'; record one with --save-baseline")
+
+    results = run(names, config)
+    report = {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'environment': {'python': platform.python_version(), 'machine': platform.machine(),
+                        'processor': platform.processor(), 'cpus': os.cpu_count()},
+        'config': config,
+        'results': results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to '{args.output}'")
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            stored = json.load(f)
+        if stored.get('config') != config:
+            print("Warning: the baseline was recorded with a different configuration")
+        baseline = stored.get('results', {})
+    regressions = compare(results, baseline, args.tolerance)
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline written to '{args.baseline}'")
+    elif regressions:
+        print(f"\n{len(regressions)} metric(s) regressed by more than {100 * args.tolerance:.0f}%")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
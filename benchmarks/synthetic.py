@@ -0,0 +1,79 @@
+import os
+import numpy as np
+import pandas as pd
+
+# Elements and topologies to draw synthetic MOFs from
+_ELEMENTS = ["C", "H", "O", "N", "Zn", "Cu"]
+_TOPOLOGIES = ["pcu", "acs", "dia", "sra", "nbo", "fcu", "bcu", "tbo"]
+_FUNCTIONAL_GROUPS = ["H", "OH", "NH2", "F", "Cl", "CH3", "CN", "NO2", "OCH3", "COOH"]
+
+
+def write_cifs(directory, count, atoms=200, seed=0):
+    """Write `count` P1 CIF files with random cells, atom sites and partial
+    charges, laid out like the files in MOF_Database; returns their paths"""
+    rng = np.random.default_rng(seed)
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for i in range(count):
+        a, b, c = rng.uniform(8.0, 20.0, size=3)
+        alpha, beta, gamma = rng.uniform(70.0, 110.0, size=3)
+        lines = [
+            f"data_synthetic_{i}",
+            "_symmetry_space_group_name_H-M    P1",
+            "_symmetry_Int_Tables_number       1",
+            f"_cell_length_a                    {a:.6f}",
+            f"_cell_length_b                    {b:.6f}",
+            f"_cell_length_c                    {c:.6f}",
+            f"_cell_angle_alpha                 {alpha:.6f}",
+            f"_cell_angle_beta                  {beta:.6f}",
+            f"_cell_angle_gamma                 {gamma:.6f}",
+            "",
+            "loop_",
+            "_atom_site_label",
+            "_atom_site_type_symbol",
+            "_atom_site_fract_x",
+            "_atom_site_fract_y",
+            "_atom_site_fract_z",
+            "_atom_type_partial_charge",
+        ]
+        symbols = rng.choice(_ELEMENTS, size=atoms)
+        fract = rng.random((atoms, 3))
+        charges = rng.uniform(-1.0, 1.0, size=atoms)
+        for j in range(atoms):
+            x, y, z = fract[j]
+            lines.append(f"{symbols[j]}{j + 1}    {symbols[j]}    {x:.6f} {y:.6f} {z:.6f} {charges[j]:.6f}")
+
+        path = os.path.join(directory, f"synthetic_{i}.cif")
+        with open(path, "w") as f:
+            f.write("\n".join(lines) + "\n")
+        paths.append(path)
+    return paths
+
+
+def screening_table(rows, seed=0):
+    """Return a DataFrame with the columns mof.py reads from
+    top_MOFs_screening_csv.csv. The targets depend smoothly on the
+    features plus noise, so the models have something to learn."""
+    rng = np.random.default_rng(seed)
+    volume = rng.uniform(500.0, 20000.0, rows)
+    void_fraction = rng.uniform(0.05, 0.95, rows)
+    surface_area = rng.uniform(0.0, 6000.0, rows)
+    void_volume = void_fraction * rng.uniform(0.5, 2.0, rows)
+    sphere = rng.uniform(2.0, 20.0, rows)
+    weight = rng.uniform(200.0, 20000.0, rows)
+    noise = rng.standard_normal((rows, 4))
+
+    return pd.DataFrame({
+        'volume [A^3]': volume,
+        'surface_area [m^2/g]': surface_area,
+        'void_fraction': void_fraction,
+        'void_volume [cm^3/g]': void_volume,
+        'largest_free_sphere_diameter [A]': sphere,
+        'weight [u]': weight,
+        'topology': rng.choice(_TOPOLOGIES, rows),
+        'functional_groups': rng.choice(_FUNCTIONAL_GROUPS, rows),
+        'Ground_State_Energy': -0.5 - 0.3 * void_fraction + 0.05 * noise[:, 0],
+        'CO2_uptake_P0.15bar_T298K [mmol/g]': 2.0 * (1 - void_fraction) + 0.001 * surface_area / 6 + 0.2 * noise[:, 1],
+        'CO2/N2_selectivity': 20.0 / sphere + 2.0 * noise[:, 2],
+        'heat_adsorption_CO2_P0.15bar_T298K [kcal/mol]': 4.0 + 3.0 * (1 - void_fraction) + 0.3 * noise[:, 3],
+    })
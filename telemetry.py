@@ -0,0 +1,186 @@
+import os
+import json
+import time
+import cProfile
+import contextlib
+
+"""
+Named spans and counters shared by both pipelines. Instrumentation is
+off until enable() is called; while it is off span() returns the same
+do-nothing context manager every time and count() returns at once, so
+the calls can stay in hot loops. While it is on, every span name keeps
+a call count, total and longest wall time, and every counter a running
+total. Nothing is written per call: export() writes the totals once,
+as JSON lines or in the Prometheus text format.
+
+Names are dotted, e.g. "vqe.step" or "train.autoencoder". Spans with a
+name given to enable(profile=...) also run under cProfile, and the
+profile is written by finish() for pstats or snakeviz. A sampling
+profiler such as py-spy needs no hook: spans add no frames of their own.
+"""
+
+_enabled = False
+_spans = {}  # name -> [calls, total seconds, longest seconds]
+_counters = {}  # name -> total
+_profiler = None
+_profiled = frozenset()
+_profile_depth = 0  # Profiled spans currently open; the profiler runs while this is > 0
+
+_NULL_SPAN = contextlib.nullcontext()
+
+
+def enable(profile=None):
+    """Start recording; spans named in `profile` are also run under cProfile"""
+    global _enabled, _profiler, _profiled
+    _enabled = True
+    if profile:
+        _profiler = cProfile.Profile()
+        _profiled = frozenset(profile)
+
+
+def enabled():
+    return _enabled
+
+
+class _Span:
+    __slots__ = ('name', 'start', 'profiled')
+
+    def __init__(self, name):
+        self.name = name
+        self.profiled = False
+
+    def __enter__(self):
+        global _profile_depth
+        if self.name in _profiled:
+            self.profiled = True
+            _profile_depth += 1
+            if _profile_depth == 1:
+                _profiler.enable()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        global _profile_depth
+        seconds = time.perf_counter() - self.start
+        if self.profiled:
+            _profile_depth -= 1
+            if _profile_depth == 0:
+                _profiler.disable()
+        stats = _spans.get(self.name)
+        if stats is None:
+            _spans[self.name] = [1, seconds, seconds]
+        else:
+            stats[0] += 1
+            stats[1] += seconds
+            if seconds > stats[2]:
+                stats[2] = seconds
+        return False
+
+
+def span(name):
+    """Context manager that times the block under `name`"""
+    if not _enabled:
+        return _NULL_SPAN
+    return _Span(name)
+
+
+def count(name, value=1):
+    """Add `value` to the counter `name`"""
+    if _enabled:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+def snapshot(reset=False):
+    """Return the recorded spans and counters as plain data, e.g. to send
+    them from a worker process to the parent"""
+    data = {'spans': {name: list(stats) for name, stats in _spans.items()}, 'counters': dict(_counters)}
+    if reset:
+        _spans.clear()
+        _counters.clear()
+    return data
+
+
+def merge(data):
+    """Add a snapshot from another process to the totals of this one"""
+    if not _enabled or not data:
+        return
+    for name, (calls, seconds, longest) in data['spans'].items():
+        stats = _spans.setdefault(name, [0, 0.0, 0.0])
+        stats[0] += calls
+        stats[1] += seconds
+        stats[2] = max(stats[2], longest)
+    for name, value in data['counters'].items():
+        _counters[name] = _counters.get(name, 0) + value
+
+
+def _metric_name(name):
+    return ''.join(c if c.isalnum() else '_' for c in name)
+
+
+def export_jsonl(path, labels=None):
+    """Append one JSON line per span and counter, stamped with the time and `labels`"""
+    stamp = {'time': time.time(), 'pid': os.getpid(), **(labels or {})}
+    with open(path, 'a') as f:
+        for name, (calls, seconds, longest) in sorted(_spans.items()):
+            f.write(json.dumps({**stamp, 'type': 'span', 'name': name, 'calls': calls,
+                                'seconds': seconds, 'max_seconds': longest}) + '\n')
+        for name, value in sorted(_counters.items()):
+            f.write(json.dumps({**stamp, 'type': 'counter', 'name': name, 'value': value}) + '\n')
+
+
+def export_prometheus(path, labels=None):
+    """Write the totals in the Prometheus text format, replacing the file
+    in one step so a scraper (e.g. the node exporter textfile collector)
+    never reads half of it"""
+    label_text = ','.join(f'{key}="{value}"' for key, value in sorted((labels or {}).items()))
+    label_text = '{' + label_text + '}' if label_text else ''
+    lines = []
+    for name, (calls, seconds, longest) in sorted(_spans.items()):
+        metric = _metric_name(name) + '_seconds'
+        lines += [
+            f'# TYPE {metric} summary',
+            f'{metric}_count{label_text} {calls}',
+            f'{metric}_sum{label_text} {seconds!r}',
+            f'# TYPE {metric}_max gauge',
+            f'{metric}_max{label_text} {longest!r}',
+        ]
+    for name, value in sorted(_counters.items()):
+        metric = _metric_name(name) + '_total'
+        lines += [f'# TYPE {metric} counter', f'{metric}{label_text} {value!r}']
+
+    tmp = path + f'.tmp-{os.getpid()}'
+    with open(tmp, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+    os.replace(tmp, path)
+
+
+def export(path, labels=None):
+    """Export to `path`: Prometheus text for a .prom file, JSON lines otherwise"""
+    if path.endswith('.prom'):
+        export_prometheus(path, labels)
+    else:
+        export_jsonl(path, labels)
+
+
+def report():
+    """Print the spans by total time and the counters"""
+    if not _spans and not _counters:
+        return
+    print(f"\n{'Span':<32}{'Calls':>10}{'Total s':>12}{'Mean ms':>12}{'Max ms':>12}")
+    for name, (calls, seconds, longest) in sorted(_spans.items(), key=lambda item: -item[1][1]):
+        print(f"{name:<32}{calls:>10}{seconds:>12.3f}{1000 * seconds / calls:>12.3f}{1000 * longest:>12.3f}")
+    for name, value in sorted(_counters.items()):
+        print(f"{name:<32}{value:>10,}")
+
+
+def finish(metrics_path=None, profile_path=None, labels=None):
+    """Print the report and write the metrics and the profile, if any"""
+    if not _enabled:
+        return
+    report()
+    if metrics_path:
+        export(metrics_path, labels)
+        print(f"Metrics written to '{metrics_path}'")
+    if _profiler is not None and profile_path:
+        _profiler.dump_stats(profile_path)
+        print(f"Profile of {', '.join(sorted(_profiled))} written to '{profile_path}'")
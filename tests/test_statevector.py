@@ -0,0 +1,49 @@
+import os
+import sys
+
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("pennylane")
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "Variational Quantum Eigensolver"))
+
+from statevector import cross_check, optimize_batch  # noqa: E402
+from variational_quantum_eigensolver import (  # noqa: E402
+    fixed_hamiltonian, get_hamiltonian_from_cif,
+)
+
+CIF_FILES = [os.path.join(ROOT, "generated mofs", f"gen-mof-{i}.cif") for i in (1, 2, 3)]
+
+
+def _hamiltonians():
+    """The fixed Hamiltonian and structure Hamiltonians of a generated MOF"""
+    cases = [pytest.param(fixed_hamiltonian(), 2, id="fixed")]
+    for num_qubits in (2, 3):
+        H, _ = get_hamiltonian_from_cif(CIF_FILES[0], num_qubits)
+        cases.append(pytest.param(H, num_qubits, id=f"gen-mof-1-{num_qubits}-qubits"))
+    return cases
+
+
+@pytest.mark.parametrize("H, num_qubits", _hamiltonians())
+def test_matches_default_qubit(H, num_qubits):
+    worst = cross_check(H, num_qubits, samples=16, diff_method="backprop")
+    assert worst <= 1e-10
+
+
+@pytest.mark.parametrize("energy_tol", [None, 1e-6])
+def test_optimize_batch_matches_separate_runs(energy_tol):
+    hamiltonians = [get_hamiltonian_from_cif(path, 2)[0] for path in CIF_FILES] + [fixed_hamiltonian()]
+    start = np.random.default_rng(1).random((len(hamiltonians), 4))
+
+    energies, params, iterations = optimize_batch(
+        hamiltonians, max_iterations=60, stepsize=0.1, energy_tol=energy_tol, params=start
+    )
+    for m, H in enumerate(hamiltonians):
+        energy, single_params, single_iterations = optimize_batch(
+            [H], max_iterations=60, stepsize=0.1, energy_tol=energy_tol, params=start[m:m + 1]
+        )
+        np.testing.assert_allclose(energies[m], energy[0], rtol=0, atol=1e-10)
+        np.testing.assert_allclose(params[m], single_params[0], rtol=0, atol=1e-10)
+        assert iterations[m] == single_iterations[0]
@@ -0,0 +1,36 @@
+import os
+import sys
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "Variational Quantum Eigensolver"))
+
+from statevector import StatevectorSimulator  # noqa: E402
+
+
+def _random_hermitian(rng, dim):
+    """A dense random Hermitian matrix, so no PennyLane is needed"""
+    A = rng.normal(size=(dim, dim)) + 1j * rng.normal(size=(dim, dim))
+    return (A + A.conj().T) / 2
+
+
+@pytest.mark.parametrize("num_qubits", [2, 3, 4])
+def test_adjoint_gradient_matches_central_differences(num_qubits):
+    rng = np.random.default_rng(num_qubits)
+    H = np.stack([_random_hermitian(rng, 2 ** num_qubits) for _ in range(3)])
+    sim = StatevectorSimulator(H, num_qubits)
+    params = rng.uniform(-np.pi, np.pi, (len(H), sim.num_params))
+
+    energies, grads = sim.energy_and_grad(params)
+    np.testing.assert_allclose(sim.energy(params), energies, rtol=0, atol=1e-10)
+
+    step = 1e-6
+    expected = np.empty_like(grads)
+    for i in range(sim.num_params):
+        shift = np.zeros(sim.num_params)
+        shift[i] = step
+        expected[:, i] = (sim.energy(params + shift) - sim.energy(params - shift)) / (2 * step)
+    np.testing.assert_allclose(grads, expected, rtol=0, atol=1e-6)